@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for linguistic processing of entries
+Compares processing entries one by one (process_entry) with batch processing (process_entries) on a synthetic corpus.
+Previous implementation (git revision or directory with feedex modules) can be run on the same corpus as a baseline
+
+"""
+
+import sys
+import os
+import random
+import tempfile
+import shutil
+import subprocess
+
+# Modules to benchmark need to be known before import
+path = '/usr/share/feedex/feedex'
+for arg in sys.argv:
+    if arg.startswith('--path='): path = arg.split('=',1)[1]
+sys.path.insert(0, path)
+from feedex_headers import *
+
+
+
+
+count = 100000
+lang = 'en'
+rank = True
+learn = False
+seed = 1
+baseline = None
+single_only = False
+
+for i,arg in enumerate(sys.argv):
+
+    if arg in ('--help','-h'):
+        print("""
+Usage:
+
+    ling_benchmark.py [--count=INT] [--lang=STR] [--no-rank] [--learn] [--seed=INT] [--path=DIR] [--baseline=REV|DIR]
+
+
+        --count         Number of synthetic entries (default: 100000)
+        --lang          Language of generated entries. Use 'none' to force language detection (default: en)
+        --no-rank       Do not rank entries against saved rules
+        --learn         Extract features for learning
+        --seed          Random seed for corpus generation
+        --path          Directory with feedex modules to benchmark (default: /usr/share/feedex/feedex)
+        --baseline      Also process entries one by one with previous implementation - a git revision of this
+                        repository (e.g. the commit before batch processing) or a directory with feedex modules.
+                        It is run in a separate process on the same corpus
+        --single-only   Only process entries one by one (used for baseline runs)
+
+""")
+        sys.exit(0)
+
+    elif arg.startswith('--count='): count = scast(arg.split('=',1)[1], int, count)
+    elif arg.startswith('--lang='): lang = arg.split('=',1)[1]
+    elif arg.startswith('--seed='): seed = scast(arg.split('=',1)[1], int, seed)
+    elif arg == '--no-rank': rank = False
+    elif arg == '--learn': learn = True
+    elif arg.startswith('--baseline='): baseline = arg.split('=',1)[1]
+    elif arg == '--single-only': single_only = True
+
+if lang == 'none': lang = None
+
+
+
+
+WORDS = ('the','of','and','government','market','announced','new','policy','on','Tuesday','prices','rose','sharply','after','report',
+'NASA','launch','mission','scientists','said','that','climate','data','shows','record','heat','in','Europe','Asia','minister',
+'election','votes','counted','city','council','plans','housing','reform','company','shares','fell','investors','worried','about',
+'inflation','central','bank','rates','unchanged','football','club','signed','striker','season','opening','match','weather','storm',
+'warning','issued','coast','research','study','finds','health','benefits','coffee','drinking','technology','software','update',
+'security','flaw','fixed','users','urged','to','install','patch','2022','15','percent','million','dollars','.',',','"','(',')','!','?')
+
+def sentence(rnd, lo, hi):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(lo, hi))]
+    if len(words) > 0: words[0] = words[0].capitalize()
+    return f'{" ".join(words)}.'
+
+def corpus(n:int):
+    """ Generate synthetic entries """
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(n):
+        e = dict.fromkeys(ENTRIES_SQL_TABLE)
+        e['id'] = i + 1
+        e['feed_id'] = rnd.randint(1,20)
+        e['lang'] = lang
+        e['title'] = sentence(rnd, 4, 12)
+        e['desc'] = ' '.join(sentence(rnd, 6, 20) for _ in range(rnd.randint(1,4)))
+        e['text'] = ' '.join(sentence(rnd, 6, 20) for _ in range(rnd.randint(0,8)))
+        e['author'] = rnd.choice(('John Smith', 'Jane Doe', None))
+        e['publisher'] = rnd.choice(('Example News', None))
+        e['contributors'] = rnd.choice(('Anna Nowak; Mark Twain', None))
+        e['category'] = rnd.choice(('World', 'Business', 'Science', None))
+        entries.append(e)
+    return entries
+
+
+
+
+def run_baseline(rev:str):
+    """ Process the same corpus one by one with previous implementation in a separate process. Returns entries/s """
+    tmp_dir = None
+    if os.path.isdir(rev): bpath = rev
+    else:
+        # Modules directory of given revision (relative to this script's checkout)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        repo = subprocess.run(['git', '-C', root, 'rev-parse', '--show-toplevel', '--show-prefix'], capture_output=True, text=True)
+        if repo.returncode != 0:
+            print(f'{root} is not a git checkout: {repo.stderr.strip()}')
+            sys.exit(1)
+        top, prefix = repo.stdout.split('\n')[:2]
+        archive = subprocess.run(['git', '-C', top, 'archive', f'{rev}:{prefix}feedex'], capture_output=True)
+        if archive.returncode != 0:
+            print(f'Could not extract {rev} from {root}: {archive.stderr.decode(errors="replace").strip()}')
+            sys.exit(1)
+        tmp_dir = tempfile.mkdtemp()
+        subprocess.run(['tar', '-x', '-C', tmp_dir], input=archive.stdout, check=True)
+        bpath = tmp_dir
+
+    args = [a for a in sys.argv[1:] if not a.startswith(('--path=', '--baseline='))]
+    try: out = subprocess.run([sys.executable, os.path.abspath(__file__), f'--path={bpath}', '--single-only'] + args, capture_output=True, text=True)
+    finally:
+        if tmp_dir is not None: shutil.rmtree(tmp_dir)
+
+    rate = re.search(r'One by one:.*\((\d+) entries/s\)', out.stdout)
+    if rate is None:
+        print(f'Baseline run failed:\n{out.stdout}\n{out.stderr}')
+        sys.exit(1)
+    return int(rate.group(1))
+
+
+
+
+MC = FeedexMainDataContainer()
+LP = LingProcessor(MC, config=DEFAULT_CONFIG)
+
+# Some rules to rank against
+MC.rules = (
+(None, 'market', 4, None, None, 'TT0market', 0, None, 5, 1, 1, 0, 1),
+(None, 'central bank', 4, None, None, 'TD0central TD0bank', 0, None, 3, 1, 1, 0, 2),
+(None, 'NASA', 5, None, None, 'TT2nasa', 0, None, 4, 1, 1, 0, 3),
+(None, 'Storm', 1, None, 'title', 'storm', 1, None, 2, 1, 0, 0, 0),
+)
+MC.rules_version += 1
+
+
+# Metadata fields (author, publisher, contributors) are not stemmed, but features still need to be learned from them
+print('Checking feature extraction from metadata ...')
+for e in corpus(200):
+    LP.process_entry(e, index=True, stats=True, learn=True)
+    for f, prefix in (('author','MA'), ('publisher','MP'), ('contributors','MC')):
+        if e[f] is not None and not any(prefix in k for k in LP.features.keys()):
+            print(f'No features learned from {f} for entry {e["id"]}!')
+            sys.exit(1)
+
+
+if baseline is not None:
+    print(f'Processing one by one with baseline ({baseline}) ...')
+    baseline_rate = run_baseline(baseline)
+
+print(f'Generating {count} entries ...')
+single = corpus(count)
+
+print('Processing one by one (process_entry) ...')
+start = time.perf_counter()
+for e in single: LP.process_entry(e, index=True, stats=True, rank=rank, learn=learn)
+single_time = time.perf_counter() - start
+
+if single_only:
+    print(f"""
+Entries:                {count}
+One by one:             {single_time:.2f}s ({count/dezeroe(single_time,1):.0f} entries/s)
+""")
+    sys.exit(0)
+
+batch = corpus(count)
+
+print('Processing in batches (process_entries) ...')
+batch_size = DEFAULT_CONFIG.get('max_items_per_transaction', 500)
+start = time.perf_counter()
+for i in range(0, count, batch_size): LP.process_entries(batch[i:i+batch_size], index=True, stats=True, rank=rank, learn=learn)
+batch_time = time.perf_counter() - start
+
+for s,b in zip(single, batch):
+    if s != b:
+        print(f'Results differ for entry {s["id"]}!')
+        sys.exit(1)
+
+print(f"""
+Entries:                {count}
+One by one:             {single_time:.2f}s ({count/dezeroe(single_time,1):.0f} entries/s)
+Batch:                  {batch_time:.2f}s ({count/dezeroe(batch_time,1):.0f} entries/s)""")
+
+if baseline is not None: print(f"""Baseline (one by one):  {baseline_rate} entries/s
+Speedup vs baseline:    {count/dezeroe(batch_time,1)/dezeroe(baseline_rate,1):.2f}x (batch), {count/dezeroe(single_time,1)/dezeroe(baseline_rate,1):.2f}x (one by one)""")
+print()
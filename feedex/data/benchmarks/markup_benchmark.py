@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for stripping markup from entry fields
+Compares strip_markup with the previous implementation (chained replaces) on titles, descriptions and contents
+taken from feed files/URLs given as arguments, or from a synthetic feed-like corpus if none are given
+
+"""
+
+import sys
+import random
+sys.path.append('/usr/share/feedex/feedex')
+from feedex_headers import *
+
+
+
+
+count = 20000
+rounds = 3
+seed = 1
+sources = []
+
+for i,arg in enumerate(sys.argv):
+    if i == 0: continue
+
+    if arg in ('--help','-h'):
+        print("""
+Usage:
+
+    markup_benchmark.py [--count=INT] [--rounds=INT] [--seed=INT] [FEED_FILE_OR_URL ...]
+
+
+        --count         Number of synthetic entries if no feeds are given (default: 20000)
+        --rounds        How many times every payload is processed (default: 3)
+        --seed          Random seed for corpus generation
+
+""")
+        sys.exit(0)
+
+    elif arg.startswith('--count='): count = scast(arg.split('=',1)[1], int, count)
+    elif arg.startswith('--rounds='): rounds = scast(arg.split('=',1)[1], int, rounds)
+    elif arg.startswith('--seed='): seed = scast(arg.split('=',1)[1], int, seed)
+    else: sources.append(arg)
+
+
+
+
+def strip_markup_old(raw_text:str, **kargs):
+    """ Previous implementation for reference """
+    raw_text = scast(raw_text, str, None)
+    if raw_text is None: return None, (), ()
+
+    html = kargs.get('html',False)
+    if not html:
+        test = re.search(RSS_HANDLER_TEST_RE, raw_text)
+        if test is None: html = False
+        else: html = True
+
+    for ent in HTML_ENTITIES:
+        raw_text = raw_text.replace(ent[0],ent[2])
+        raw_text = raw_text.replace(ent[1],ent[2])
+
+    if html:
+        images = re.findall(RSS_HANDLER_IMAGES_RE, raw_text)
+        links = ()
+        raw_text = raw_text.replace("\n\r",' ')
+        raw_text = raw_text.replace("\n",' ')
+        raw_text = raw_text.replace("\r",' ')
+        raw_text = raw_text.replace("</p>","\n\n")
+        raw_text = raw_text.replace("<br>","\n")
+        raw_text = raw_text.replace("<br />","\n")
+        raw_text = raw_text.replace("<br/>","\n")
+        raw_text = raw_text.replace('<em>','»')
+        raw_text = raw_text.replace('</em>','«')
+        raw_text = raw_text.replace('<b>','»')
+        raw_text = raw_text.replace('</b>','«')
+        raw_text = raw_text.replace('<i>','»')
+        raw_text = raw_text.replace('</i>','«')
+        raw_text = raw_text.replace('<u>','»')
+        raw_text = raw_text.replace('</u>','«')
+        stripped_text = re.sub(RSS_HANDLER_STRIP_HTML_RE, '', scast(raw_text, str, ''))
+        stripped_text = stripped_text.strip()
+    else:
+        stripped_text = raw_text
+        images = ()
+        links = ()
+
+    return stripped_text, images, links
+
+
+
+
+WORDS = ('the','of','and','government','market','announced','new','policy','on','Tuesday','prices','rose','sharply','after','report',
+'scientists','said','climate','data','record','heat','Europe','minister','election','votes','city','council','housing','reform',
+'company','shares','fell','investors','inflation','bank','rates','football','club','season','weather','storm','research','study',
+'health','coffee','software','security','users','Zürich','café','naïve','2022','15','percent','&amp;','&quot;quoted&quot;','&nbsp;',
+'&#8217;s','&hellip;','&mdash;','&eacute;t&eacute;','&#160;')
+
+def sentence(rnd, lo, hi):
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(lo, hi))]
+    for j in range(len(words)):
+        r = rnd.random()
+        if r < 0.04: words[j] = f'<a href="https://example.com/{rnd.randint(1,9999)}?a=1&amp;b=2">{words[j]}</a>'
+        elif r < 0.07: words[j] = f'<b>{words[j]}</b>'
+        elif r < 0.09: words[j] = f'<em>{words[j]}</em>'
+    return f'{" ".join(words)}.'
+
+def corpus(n:int):
+    """ Generate feed-like payloads: plain titles, HTML descriptions and longer HTML contents """
+    rnd = random.Random(seed)
+    payloads = []
+    for i in range(n):
+        payloads.append( (rnd.choice(WORDS).capitalize() + ' ' + sentence(rnd, 4, 12), True) )
+        desc = ' '.join(sentence(rnd, 6, 20) for _ in range(rnd.randint(1,4)))
+        if rnd.random() < 0.3: desc = f'<img src="https://example.com/img/{i}.jpg" alt="" width="300" /><br/>\n{desc}'
+        if rnd.random() < 0.5: desc = f'<p>{desc}</p>'
+        payloads.append( (desc, False) )
+        paras = '\n'.join(f'<p class="para">{sentence(rnd, 10, 40)}<br />\r\n{sentence(rnd, 5, 20)}</p>' for _ in range(rnd.randint(0,8)))
+        if paras != '': payloads.append( (f'<div class="content">\n{paras}\n</div>', True) )
+    return payloads
+
+def feed_payloads(srcs):
+    """ Titles, descriptions and contents from real feeds """
+    payloads = []
+    for src in srcs:
+        print(f'Parsing {src} ...')
+        feed = feedparser.parse(src)
+        for e in feed.get('entries',()):
+            payloads.append( (e.get('title'), True) )
+            payloads.append( (e.get('description'), False) )
+            for c in e.get('content',()): payloads.append( (c.get('value'), True) )
+    return payloads
+
+
+
+
+if len(sources) > 0: payloads = feed_payloads(sources)
+else:
+    print(f'Generating {count} entries ...')
+    payloads = corpus(count)
+
+size = sum(len(scast(p, str, '')) for p, h in payloads)
+print(f'Payloads: {len(payloads)} ({size} characters)')
+
+print('Stripping with previous implementation ...')
+start = time.perf_counter()
+for r in range(rounds): old = [strip_markup_old(p, html=h) for p, h in payloads]
+old_time = time.perf_counter() - start
+
+print('Stripping with strip_markup ...')
+start = time.perf_counter()
+for r in range(rounds): new = [strip_markup(p, html=h) for p, h in payloads]
+new_time = time.perf_counter() - start
+
+diffs = 0
+for o, n, p in zip(old, new, payloads):
+    if o[0] != n[0] or tuple(o[1]) != tuple(n[1]):
+        diffs += 1
+        if diffs <= 3: print(f'Results differ for:\n{p[0][:300]}\n    old: {scast(o[0], str, "")[:300]}\n    new: {scast(n[0], str, "")[:300]}\n')
+
+print(f"""
+Payloads:               {len(payloads)} x {rounds}
+Previous:               {old_time:.2f}s ({len(payloads)*rounds/dezeroe(old_time,1):.0f} payloads/s)
+strip_markup:           {new_time:.2f}s ({len(payloads)*rounds/dezeroe(new_time,1):.0f} payloads/s)
+Speedup:                {old_time/dezeroe(new_time,1):.1f}x
+Different results:      {diffs}
+""")
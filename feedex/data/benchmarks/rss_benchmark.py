@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for RSS entry normalization
+Feeds are parsed once with feedparser and then processed by RSS handler (dates, markup, authors, tags, links) without downloading.
+Feed files/URLs can be given as arguments, otherwise a synthetic feed is generated. A temporary database is used
+
+"""
+
+import sys
+import random
+import tempfile
+sys.path.append('/usr/share/feedex/feedex')
+from feedex_headers import *
+
+
+
+
+count = 2000
+rounds = 5
+seed = 1
+sources = []
+
+for i,arg in enumerate(sys.argv):
+    if i == 0: continue
+
+    if arg in ('--help','-h'):
+        print("""
+Usage:
+
+    rss_benchmark.py [--count=INT] [--rounds=INT] [--seed=INT] [FEED_FILE_OR_URL ...]
+
+
+        --count         Number of items in synthetic feed if no feeds are given (default: 2000)
+        --rounds        How many times every feed is processed (default: 5)
+        --seed          Random seed for feed generation
+
+""")
+        sys.exit(0)
+
+    elif arg.startswith('--count='): count = scast(arg.split('=',1)[1], int, count)
+    elif arg.startswith('--rounds='): rounds = scast(arg.split('=',1)[1], int, rounds)
+    elif arg.startswith('--seed='): seed = scast(arg.split('=',1)[1], int, seed)
+    else: sources.append(arg)
+
+
+
+
+WORDS = ('the','of','and','government','market','announced','new','policy','on','Tuesday','prices','rose','sharply','after','report',
+'scientists','said','climate','data','record','heat','Europe','minister','election','votes','city','council','housing','reform',
+'company','shares','fell','investors','inflation','bank','rates','football','club','season','weather','storm','research','study')
+
+def sentence(rnd, lo, hi): return ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(lo, hi)))
+
+def synthetic_feed(n:int):
+    """ RSS 2.0 document with n items """
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        date = time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(1650000000 + rnd.randint(0, 5000000)))
+        items.append(f"""<item><title>{sentence(rnd, 4, 10)}</title><link>https://example.com/news/{i}</link><guid>https://example.com/news/{i}</guid>
+<pubDate>{date}</pubDate><author>editor@example.com (Jane Doe)</author><category>{rnd.choice(WORDS)}</category><category>{rnd.choice(WORDS)}</category>
+<description><![CDATA[<p>{sentence(rnd, 20, 60)}</p><p><b>{sentence(rnd, 2, 5)}</b> {sentence(rnd, 10, 30)}</p>]]></description>
+<enclosure url="https://example.com/img/{i}.jpg" type="image/jpeg" length="1000"/></item>""")
+    return f"""<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>Benchmark</title><link>https://example.com</link>
+<description>Synthetic feed</description><lastBuildDate>Tue, 01 Mar 2022 10:00:00 +0000</lastBuildDate>{''.join(items)}</channel></rss>"""
+
+
+
+
+if len(sources) == 0: sources = [synthetic_feed(count)]
+
+parsed = []
+start = time.perf_counter()
+for src in sources:
+    feed = feedparser.parse(src)
+    feed['status'] = 200
+    parsed.append(feed)
+parse_time = time.perf_counter() - start
+items = sum(len(f.get('entries',())) for f in parsed)
+
+
+tmp_dir = tempfile.mkdtemp()
+config = DEFAULT_CONFIG.copy()
+config['db_path'] = os.path.join(tmp_dir, 'bench.db')
+MC = FeedexMainDataContainer()
+FX = Feeder(MC, config=config, debug=False, allow_create=True, main_thread=True)
+if FX.db_status != 0:
+    print('Could not create benchmark database!')
+    sys.exit(1)
+
+feed = FeedContainerBasic()
+feed['id'] = 1
+feed['handler'] = 'rss'
+
+handler = FeedexRSSHandler(FX, config=config)
+handler.set_feed({'url':'benchmark'})
+
+print('Processing entries ...')
+entries = 0
+start = time.perf_counter()
+for r in range(rounds):
+    for f in parsed:
+        handler._do_download = lambda url, **kargs: f
+        for e in handler.fetch(feed, force=True, last_read=0):
+            if isinstance(e, EntryContainer): entries += 1
+norm_time = time.perf_counter() - start
+
+FX.close()
+for f in os.listdir(tmp_dir): os.remove(os.path.join(tmp_dir, f))
+os.rmdir(tmp_dir)
+
+print(f"""
+Items:                  {items} x {rounds} ({entries} normalized)
+Parsing (feedparser):   {parse_time:.2f}s
+Normalization:          {norm_time:.2f}s ({entries/dezeroe(norm_time,1):.0f} entries/s)
+""")
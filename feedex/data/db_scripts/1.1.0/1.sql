@@ -0,0 +1,4 @@
+BEGIN TRANSACTION;
+DELETE FROM params where name = 'version';
+INSERT INTO "main"."params" ("name", "val") VALUES ('version', '1.1.0');
+COMMIT;
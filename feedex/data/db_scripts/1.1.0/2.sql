@@ -0,0 +1,10 @@
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS "idx_entries_feed_guid" ON "entries" (
+	"feed_id",
+	"guid"
+);
+CREATE INDEX IF NOT EXISTS "idx_entries_feed_link" ON "entries" (
+	"feed_id",
+	"link"
+);
+COMMIT;
@@ -0,0 +1,50 @@
+BEGIN TRANSACTION;
+CREATE TABLE IF NOT EXISTS "entry_terms" (
+	"term"	TEXT NOT NULL,
+	"raw"	INTEGER NOT NULL,
+	"entry_id"	INTEGER NOT NULL,
+	PRIMARY KEY("term","raw","entry_id")
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS "idx_entry_terms_entry_id" ON "entry_terms" (
+	"entry_id"
+);
+
+-- Term is a token from tokens/tokens_raw without position (7), prefix (2) and case (1) - raw = 1 for tokens_raw
+CREATE TRIGGER IF NOT EXISTS "trg_entry_terms_insert" AFTER INSERT ON "entries"
+BEGIN
+	INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+	SELECT substr(tok, 11), 0, new.id FROM (
+		WITH RECURSIVE split(tok, rest) AS (SELECT '', coalesce(new.tokens,'') || ' ' UNION ALL SELECT substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+		SELECT tok FROM split WHERE length(tok) > 10 );
+	INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+	SELECT substr(tok, 11), 1, new.id FROM (
+		WITH RECURSIVE split(tok, rest) AS (SELECT '', coalesce(new.tokens_raw,'') || ' ' UNION ALL SELECT substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+		SELECT tok FROM split WHERE length(tok) > 10 );
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_entry_terms_update" AFTER UPDATE OF tokens, tokens_raw ON "entries"
+BEGIN
+	DELETE FROM entry_terms WHERE entry_id = old.id;
+	INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+	SELECT substr(tok, 11), 0, new.id FROM (
+		WITH RECURSIVE split(tok, rest) AS (SELECT '', coalesce(new.tokens,'') || ' ' UNION ALL SELECT substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+		SELECT tok FROM split WHERE length(tok) > 10 );
+	INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+	SELECT substr(tok, 11), 1, new.id FROM (
+		WITH RECURSIVE split(tok, rest) AS (SELECT '', coalesce(new.tokens_raw,'') || ' ' UNION ALL SELECT substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+		SELECT tok FROM split WHERE length(tok) > 10 );
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_entry_terms_delete" AFTER DELETE ON "entries"
+BEGIN
+	DELETE FROM entry_terms WHERE entry_id = old.id;
+END;
+
+-- Index existing entries
+INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+WITH RECURSIVE split(entry_id, tok, rest) AS (SELECT id, '', coalesce(tokens,'') || ' ' FROM entries UNION ALL SELECT entry_id, substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+SELECT substr(tok, 11), 0, entry_id FROM split WHERE length(tok) > 10;
+INSERT OR IGNORE INTO entry_terms (term, raw, entry_id)
+WITH RECURSIVE split(entry_id, tok, rest) AS (SELECT id, '', coalesce(tokens_raw,'') || ' ' FROM entries UNION ALL SELECT entry_id, substr(rest, 1, instr(rest,' ')-1), substr(rest, instr(rest,' ')+1) FROM split WHERE rest <> '')
+SELECT substr(tok, 11), 1, entry_id FROM split WHERE length(tok) > 10;
+COMMIT;
@@ -0,0 +1,6 @@
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS "idx_rules_context_id" ON "rules" (
+	"context_id"
+);
+INSERT INTO "main"."params" ("name", "val") SELECT 'rules_version', '0' WHERE NOT EXISTS (SELECT 1 FROM params WHERE name = 'rules_version');
+COMMIT;
@@ -0,0 +1,127 @@
+BEGIN TRANSACTION;
+CREATE TABLE IF NOT EXISTS "rules_agg" (
+	"n"	INTEGER,
+	"name"	TEXT,
+	"type"	INTEGER,
+	"feed_id"	INTEGER,
+	"field_id"	TEXT,
+	"string"	TEXT,
+	"case_insensitive"	INTEGER,
+	"lang"	TEXT,
+	"weight"	NUMERIC,
+	"additive"	INTEGER,
+	"learned"	INTEGER,
+	"flag"	INTEGER,
+	"context_id"	INTEGER
+);
+CREATE INDEX IF NOT EXISTS "idx_rules_agg_context_string" ON "rules_agg" (
+	"context_id",
+	"string"
+);
+CREATE INDEX IF NOT EXISTS "idx_rules_agg_order" ON "rules_agg" (
+	"type",
+	abs("weight") DESC
+);
+
+-- Aggregated rules (formerly computed on every load) - one row per rule group with weight scaled by its context entry.
+-- Rule changes are applied as deltas, entry/feed changes recompute whole contexts. Manual rules have context_id = 0
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_insert" AFTER INSERT ON "rules"
+WHEN NOT EXISTS (SELECT 1 FROM entries e LEFT JOIN feeds f ON f.id = e.feed_id WHERE e.id = new.context_id AND (coalesce(e.deleted,0) = 1 OR coalesce(f.deleted,0) = 1))
+BEGIN
+	INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, new.name, new.type, new.feed_id, new.field_id, new.string, new.case_insensitive, new.lang, 0, new.additive, new.learned, new.flag, coalesce(new.context_id,0)
+	WHERE NOT EXISTS (SELECT 1 FROM rules_agg a WHERE a.context_id = coalesce(new.context_id,0) AND a.name IS new.name AND a.type IS new.type AND a.feed_id IS new.feed_id AND a.field_id IS new.field_id AND a.string IS new.string AND a.case_insensitive IS new.case_insensitive AND a.lang IS new.lang AND a.additive IS new.additive AND a.learned IS new.learned AND a.flag IS new.flag);
+	UPDATE rules_agg SET weight = weight + coalesce(new.weight * coalesce( coalesce((SELECT e.read FROM entries e WHERE e.id = new.context_id), CASE WHEN new.learned = 1 THEN 0 ELSE 1 END) * coalesce((SELECT e.weight FROM entries e WHERE e.id = new.context_id), CASE WHEN new.learned = 1 THEN 0 ELSE 1 END), new.archive), 0)
+	WHERE context_id = coalesce(new.context_id,0) AND name IS new.name AND type IS new.type AND feed_id IS new.feed_id AND field_id IS new.field_id AND string IS new.string AND case_insensitive IS new.case_insensitive AND lang IS new.lang AND additive IS new.additive AND learned IS new.learned AND flag IS new.flag;
+	DELETE FROM rules_agg WHERE context_id = coalesce(new.context_id,0) AND name IS new.name AND type IS new.type AND feed_id IS new.feed_id AND field_id IS new.field_id AND string IS new.string AND case_insensitive IS new.case_insensitive AND lang IS new.lang AND additive IS new.additive AND learned IS new.learned AND flag IS new.flag AND abs(weight) < 0.000000001;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_delete" AFTER DELETE ON "rules"
+WHEN NOT EXISTS (SELECT 1 FROM entries e LEFT JOIN feeds f ON f.id = e.feed_id WHERE e.id = old.context_id AND (coalesce(e.deleted,0) = 1 OR coalesce(f.deleted,0) = 1))
+BEGIN
+	UPDATE rules_agg SET weight = weight - coalesce(old.weight * coalesce( coalesce((SELECT e.read FROM entries e WHERE e.id = old.context_id), CASE WHEN old.learned = 1 THEN 0 ELSE 1 END) * coalesce((SELECT e.weight FROM entries e WHERE e.id = old.context_id), CASE WHEN old.learned = 1 THEN 0 ELSE 1 END), old.archive), 0)
+	WHERE context_id = coalesce(old.context_id,0) AND name IS old.name AND type IS old.type AND feed_id IS old.feed_id AND field_id IS old.field_id AND string IS old.string AND case_insensitive IS old.case_insensitive AND lang IS old.lang AND additive IS old.additive AND learned IS old.learned AND flag IS old.flag;
+	DELETE FROM rules_agg WHERE context_id = coalesce(old.context_id,0) AND name IS old.name AND type IS old.type AND feed_id IS old.feed_id AND field_id IS old.field_id AND string IS old.string AND case_insensitive IS old.case_insensitive AND lang IS old.lang AND additive IS old.additive AND learned IS old.learned AND flag IS old.flag AND abs(weight) < 0.000000001;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_update_old" BEFORE UPDATE ON "rules"
+WHEN NOT EXISTS (SELECT 1 FROM entries e LEFT JOIN feeds f ON f.id = e.feed_id WHERE e.id = old.context_id AND (coalesce(e.deleted,0) = 1 OR coalesce(f.deleted,0) = 1))
+BEGIN
+	UPDATE rules_agg SET weight = weight - coalesce(old.weight * coalesce( coalesce((SELECT e.read FROM entries e WHERE e.id = old.context_id), CASE WHEN old.learned = 1 THEN 0 ELSE 1 END) * coalesce((SELECT e.weight FROM entries e WHERE e.id = old.context_id), CASE WHEN old.learned = 1 THEN 0 ELSE 1 END), old.archive), 0)
+	WHERE context_id = coalesce(old.context_id,0) AND name IS old.name AND type IS old.type AND feed_id IS old.feed_id AND field_id IS old.field_id AND string IS old.string AND case_insensitive IS old.case_insensitive AND lang IS old.lang AND additive IS old.additive AND learned IS old.learned AND flag IS old.flag;
+	DELETE FROM rules_agg WHERE context_id = coalesce(old.context_id,0) AND name IS old.name AND type IS old.type AND feed_id IS old.feed_id AND field_id IS old.field_id AND string IS old.string AND case_insensitive IS old.case_insensitive AND lang IS old.lang AND additive IS old.additive AND learned IS old.learned AND flag IS old.flag AND abs(weight) < 0.000000001;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_update_new" AFTER UPDATE ON "rules"
+WHEN NOT EXISTS (SELECT 1 FROM entries e LEFT JOIN feeds f ON f.id = e.feed_id WHERE e.id = new.context_id AND (coalesce(e.deleted,0) = 1 OR coalesce(f.deleted,0) = 1))
+BEGIN
+	INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, new.name, new.type, new.feed_id, new.field_id, new.string, new.case_insensitive, new.lang, 0, new.additive, new.learned, new.flag, coalesce(new.context_id,0)
+	WHERE NOT EXISTS (SELECT 1 FROM rules_agg a WHERE a.context_id = coalesce(new.context_id,0) AND a.name IS new.name AND a.type IS new.type AND a.feed_id IS new.feed_id AND a.field_id IS new.field_id AND a.string IS new.string AND a.case_insensitive IS new.case_insensitive AND a.lang IS new.lang AND a.additive IS new.additive AND a.learned IS new.learned AND a.flag IS new.flag);
+	UPDATE rules_agg SET weight = weight + coalesce(new.weight * coalesce( coalesce((SELECT e.read FROM entries e WHERE e.id = new.context_id), CASE WHEN new.learned = 1 THEN 0 ELSE 1 END) * coalesce((SELECT e.weight FROM entries e WHERE e.id = new.context_id), CASE WHEN new.learned = 1 THEN 0 ELSE 1 END), new.archive), 0)
+	WHERE context_id = coalesce(new.context_id,0) AND name IS new.name AND type IS new.type AND feed_id IS new.feed_id AND field_id IS new.field_id AND string IS new.string AND case_insensitive IS new.case_insensitive AND lang IS new.lang AND additive IS new.additive AND learned IS new.learned AND flag IS new.flag;
+	DELETE FROM rules_agg WHERE context_id = coalesce(new.context_id,0) AND name IS new.name AND type IS new.type AND feed_id IS new.feed_id AND field_id IS new.field_id AND string IS new.string AND case_insensitive IS new.case_insensitive AND lang IS new.lang AND additive IS new.additive AND learned IS new.learned AND flag IS new.flag AND abs(weight) < 0.000000001;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_entry_update" AFTER UPDATE OF read, weight, deleted, feed_id ON "entries"
+BEGIN
+	DELETE FROM rules_agg WHERE context_id = old.id;
+	INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, r.name, r.type, r.feed_id, r.field_id, r.string, r.case_insensitive, r.lang,
+	sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ),
+	r.additive, r.learned, r.flag, coalesce(r.context_id, 0)
+	FROM rules r
+	LEFT JOIN entries e ON e.id = r.context_id
+	LEFT JOIN feeds f ON f.id = e.feed_id
+	WHERE r.context_id = new.id AND coalesce(e.deleted,0) <> 1 AND coalesce(f.deleted,0) <> 1
+	GROUP BY r.name, r.type, r.feed_id, r.field_id, r.case_insensitive, r.lang, r.additive, r.string, r.learned, r.flag, r.context_id
+	HAVING sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ) <> 0
+;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_entry_delete" AFTER DELETE ON "entries"
+BEGIN
+	DELETE FROM rules_agg WHERE context_id = old.id;
+	INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, r.name, r.type, r.feed_id, r.field_id, r.string, r.case_insensitive, r.lang,
+	sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ),
+	r.additive, r.learned, r.flag, coalesce(r.context_id, 0)
+	FROM rules r
+	LEFT JOIN entries e ON e.id = r.context_id
+	LEFT JOIN feeds f ON f.id = e.feed_id
+	WHERE r.context_id = old.id AND coalesce(e.deleted,0) <> 1 AND coalesce(f.deleted,0) <> 1
+	GROUP BY r.name, r.type, r.feed_id, r.field_id, r.case_insensitive, r.lang, r.additive, r.string, r.learned, r.flag, r.context_id
+	HAVING sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ) <> 0
+;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "trg_rules_agg_feed_update" AFTER UPDATE OF deleted ON "feeds"
+BEGIN
+	DELETE FROM rules_agg WHERE context_id IN (SELECT e.id FROM entries e WHERE e.feed_id = new.id);
+	INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, r.name, r.type, r.feed_id, r.field_id, r.string, r.case_insensitive, r.lang,
+	sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ),
+	r.additive, r.learned, r.flag, coalesce(r.context_id, 0)
+	FROM rules r
+	LEFT JOIN entries e ON e.id = r.context_id
+	LEFT JOIN feeds f ON f.id = e.feed_id
+	WHERE r.context_id IN (SELECT e.id FROM entries e WHERE e.feed_id = new.id) AND coalesce(e.deleted,0) <> 1 AND coalesce(f.deleted,0) <> 1
+	GROUP BY r.name, r.type, r.feed_id, r.field_id, r.case_insensitive, r.lang, r.additive, r.string, r.learned, r.flag, r.context_id
+	HAVING sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ) <> 0
+;
+END;
+
+-- Aggregate existing rules
+DELETE FROM rules_agg;
+INSERT INTO rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id)
+	SELECT NULL, r.name, r.type, r.feed_id, r.field_id, r.string, r.case_insensitive, r.lang,
+	sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ),
+	r.additive, r.learned, r.flag, coalesce(r.context_id, 0)
+	FROM rules r
+	LEFT JOIN entries e ON e.id = r.context_id
+	LEFT JOIN feeds f ON f.id = e.feed_id
+	WHERE  coalesce(e.deleted,0) <> 1 AND coalesce(f.deleted,0) <> 1
+	GROUP BY r.name, r.type, r.feed_id, r.field_id, r.case_insensitive, r.lang, r.additive, r.string, r.learned, r.flag, r.context_id
+	HAVING sum(r.weight * coalesce( coalesce(e.read, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END) * coalesce(e.weight, CASE WHEN r.learned = 1 THEN 0 ELSE 1 END), r.archive) ) <> 0
+;
+COMMIT;
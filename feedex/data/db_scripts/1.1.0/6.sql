@@ -0,0 +1,22 @@
+BEGIN TRANSACTION;
+-- Fetch schedule: next check time for every channel and time until which server asked not to check again (cache headers)
+CREATE TABLE IF NOT EXISTS "fetch_schedule" (
+	"feed_id"	INTEGER NOT NULL,
+	"due"	INTEGER,
+	"cache_until"	INTEGER,
+	-- Adaptive check intervals: estimated publication rate (new entries per hour) and yield statistics
+	"rate"	NUMERIC,
+	"checks"	INTEGER,
+	"empty_checks"	INTEGER,
+	"predicted"	NUMERIC,
+	"actual"	INTEGER,
+	-- Content cache for HTML channels: hash and size of last downloaded page, bytes not downloaded thanks to conditional requests
+	"content_hash"	TEXT,
+	"content_length"	INTEGER,
+	"bytes_saved"	INTEGER,
+	PRIMARY KEY("feed_id")
+);
+CREATE INDEX IF NOT EXISTS "idx_fetch_schedule_due" ON "fetch_schedule" (
+	"due"
+);
+COMMIT;
@@ -30,7 +30,7 @@ for i,arg in enumerate(sys.argv):
         print("""
 Usage:
 
-    dict_processor.py [--lang=STR] [--stem] [--tokenize] [--add|--remove|--summary|--csv]
+    dict_processor.py [--lang=STR] [--stem] [--tokenize] [--add|--remove|--summary|--csv|--compile]
 
 
         --lang          Language model for tokenizind and stemming
@@ -73,6 +73,12 @@ Usage:
                 Print a dictionary from MAIN_FILE as a proper language model CSV 
 
 
+        --compile   MAIN_FILE   [OUT_FILE]
+
+                Compile dictionaries from MAIN_FILE pickle to memory-mapped lexicon file used by ling processor
+                OUT_FILE defaults to MAIN_FILE with .fxlex extension - this is where it is looked up when loading a model
+
+
         """)
         sys.exit()      
 
@@ -117,11 +123,17 @@ Usage:
         argument2 = sanitize_arg(slist(sys.argv, i+2, None), str, None, singleton=True, arg_name='Name of Dictionary to remove', exit_fail=True, allow_none=False)    
         break
 
+    if arg == '--compile':
+        action = 'compile'
+        argument = sanitize_arg(slist(sys.argv, i+1, None), str, None, singleton=True, arg_name='Dictionary file', exit_fail=True, allow_none=False, is_file=True)
+        argument2 = sanitize_arg(slist(sys.argv, i+2, None), str, None, singleton=True, arg_name='Output file', exit_fail=True, allow_none=True)
+        break
+
 
 
 
 
-lingua = LingProcessor(config=DEFAULT_CONFIG, debug=False)
+lingua = LingProcessor(FeedexMainDataContainer(), config=DEFAULT_CONFIG, debug=False)
 lingua.set_model(lang)
 
 
@@ -422,6 +434,19 @@ if action == 'add':
 
 
 
+if action == 'compile':
+    if get_format(argument) != 'pickle':
+        print('Main file must be pickle!')
+        sys.exit(-3)
+    orig_data = read_pickle(argument)
+    if type(orig_data) != dict or orig_data == {}:
+        print('Main file must be a dictionary pickle!')
+        sys.exit(-3)
 
+    if argument2 is None: argument2 = f'{argument.rsplit(".",1)[0]}.{LEXICON_FILE_EXT}'
 
-
+    writer = FeedexLexiconWriter()
+    for d, dc in orig_data.items():
+        if type(dc) in (list, tuple): writer.add(d, dc)
+    writer.write(argument2, file_hash(argument))
+    print(f'Compiled {len(writer.index["lexicons"])} dictionaries to {argument2}')
@@ -12,6 +12,148 @@ from feedex_headers import *
 
 
 
+# Process pool workers for mass recalculation. Each process holds its own ling processor with a copy of compiled rules
+RECALC_WORKER = {}
+
+def recalc_worker_init(config, rules, rule_index, manual_rules, debug):
+    """ Set up ling processor in a worker process """
+    MC = FeedexMainDataContainer(config=config)
+    MC.rules = rules
+    MC.rule_index = rule_index
+    MC.manual_rules = manual_rules
+    MC.rule_index_next = len(rules)
+    MC.rule_index_version = MC.rules_version
+    RECALC_WORKER['LP'] = LingProcessor(MC, config=config, debug=debug)
+
+def recalc_worker(batch:list, ling_kargs:dict):
+    """ Process a batch of entries and return only fields needed for saving """
+    features = RECALC_WORKER['LP'].process_entries(batch, **ling_kargs)
+    fields = ('id','lang','importance','flag') + LING_TECH_LIST
+    return [{f:e.get(f) for f in fields} for e in batch], features
+
+
+
+
+
+class FeedexConnectionPool:
+    """ Pool of set-up SQLite connections. A connection is owned by one Feeder instance at a time and returned on disconnect """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {} # DB path -> idle connections
+        self.checked = set() # DB paths with version already checked in this process
+
+    def get(self, db_path:str):
+        """ Take idle connection or open a new one. Returns connection and a flag if it was reused """
+        with self.lock:
+            idle = self.idle.get(db_path)
+            if idle: return idle.pop(), True
+
+        conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT/1000, check_same_thread=False)
+        for p in DB_PRAGMAS: conn.execute(p)
+        return conn, False
+
+    def put(self, db_path:str, conn):
+        """ Return connection to pool or close it if pool is full """
+        try: conn.rollback()
+        except (sqlite3.Error, sqlite3.OperationalError): 
+            conn.close()
+            return
+        with self.lock:
+            idle = self.idle.setdefault(db_path, [])
+            if len(idle) < DB_POOL_SIZE:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self, db_path:str):
+        """ Close all idle connections to a DB """
+        with self.lock: idle = self.idle.pop(db_path, [])
+        for conn in idle: conn.close()
+        self.checked.discard(db_path)
+
+
+
+
+
+class FeedexLockManager:
+    """ In-process DB locking with condition variables, so waiters wake up as soon as lock is released.
+        Writer lock is owned by a single Feeder instance between locked() and unlock() and is reentrant.
+        Readers share access and wait only for an exclusive writer (e.g. maintenance), which in turn waits for active readers """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.writer = None
+        self.depth = 0
+        self.exclusive = False
+        self.readers = 0
+
+        # Wait metrics for this process
+        self.stats = {'waits':0, 'wait_time':0.0, 'wait_max':0.0, 'timeouts':0, 'read_waits':0, 'read_wait_time':0.0}
+
+
+    def acquire(self, owner, timeout, **kargs):
+        """ Acquire writer lock for owner. Timeout None waits indefinitely. Returns False on timeout """
+        exclusive = kargs.get('exclusive', False)
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.writer in (None, owner) and not (exclusive and self.readers > 0), timeout): return False
+            self.writer = owner
+            self.depth += 1
+            if exclusive: self.exclusive = True
+        return True
+
+    def release(self, owner, **kargs):
+        """ Release writer lock (or all its levels) and wake up waiters. Returns remaining depth """
+        with self.cond:
+            if self.writer is not owner: return 0
+            if kargs.get('all', False): self.depth = 0
+            else: self.depth -= 1
+            if self.depth <= 0:
+                self.writer = None
+                self.depth = 0
+                self.exclusive = False
+                self.cond.notify_all()
+            return self.depth
+
+    def held(self, owner):
+        """ Writer lock depth held by owner """
+        with self.cond:
+            if self.writer is owner: return self.depth
+            return 0
+
+
+    def acquire_read(self, owner, timeout):
+        """ Enter reading. Waits only while other owner holds an exclusive lock """
+        with self.cond:
+            if self.exclusive and self.writer is not owner:
+                started = time.perf_counter()
+                if not self.cond.wait_for(lambda: not self.exclusive or self.writer is owner, timeout): return False
+                self.stats['read_waits'] += 1
+                self.stats['read_wait_time'] += time.perf_counter() - started
+            self.readers += 1
+        return True
+
+    def release_read(self):
+        with self.cond:
+            self.readers -= 1
+            if self.readers <= 0:
+                self.readers = 0
+                self.cond.notify_all()
+        return 0
+
+
+    def add_wait(self, wait:float, **kargs):
+        """ Register time spent waiting for writer lock """
+        with self.cond:
+            if kargs.get('timeout', False): self.stats['timeouts'] += 1
+            else: self.stats['waits'] += 1
+            self.stats['wait_time'] += wait
+            if wait > self.stats['wait_max']: self.stats['wait_max'] = wait
+
+
+
+
+
 class Feeder:
     """ Main engine for Feedex. Handles SQLite3 interface, feed and entry data"""
 
@@ -26,6 +168,17 @@ class Feeder:
         self.config = kargs.get('config', DEFAULT_CONFIG)
         self.db_path = kargs.get('db_path', self.config.get('db_path'))
 
+        # Connection (taken from pool in _connect_db)
+        self.conn = None
+        self.curs = None
+        self.conn_id = 0
+        self.lock_owner = object() # Identifies this instance in lock manager
+
+        # Ling processor and query parser are created on first use (see LP and QP)
+        self.init_kargs = kargs
+        self._LP = None
+        self._QP = None
+
         # DB errors and status 
         self.db_error = None
         self.db_status = 0
@@ -69,6 +222,15 @@ class Feeder:
         # Is it currently fetching?
         self.is_fetching = 0
 
+        # Parallel fetching: number of workers, thread-local handlers and connection slots per host
+        self.fetch_workers = scast(kargs.get('fetch_workers', self.config.get('fetch_workers',4)), int, 1)
+        self.fetch_local = threading.local()
+        self.host_slots = {}
+        self.host_slots_lock = threading.Lock()
+
+        # Processes for mass recalculation (0 - all CPUs)
+        self.recalc_workers = scast(kargs.get('recalc_workers', self.config.get('recalc_workers',0)), int, 1)
+
         # Last inserted ids
         self.last_entry_id = 0
         self.last_feed_id = 0
@@ -97,10 +259,45 @@ class Feeder:
             if not self.single_run: self.load_history()
             if self.debug in (1,2): print('Main connection established...')
 
-        # initialize linguistic processor for tokenizing and stemming
-        self.LP = LingProcessor(self.MC, **kargs)
-        # And query parser ...
-        if not kargs.get('no_qp', False): self.QP = FeederQueryParser(self, **kargs)
+
+
+    @property
+    def LP(self):
+        """ Linguistic processor for tokenizing and stemming. Loads language models on first use """
+        if self._LP is None: self._LP = LingProcessor(self.MC, **self.init_kargs)
+        return self._LP
+
+    @property
+    def QP(self):
+        """ Query parser (None if disabled with no_qp) """
+        if self._QP is None and not self.init_kargs.get('no_qp', False): self._QP = FeederQueryParser(self, **self.init_kargs)
+        return self._QP
+
+    @property
+    def scheduler(self):
+        """ Fetch scheduler shared through main container. Rebuilt from saved schedule whenever feeds are reloaded """
+        if self.MC.scheduler is None: self.MC.scheduler = FeedexFetchScheduler(self.config)
+        if self.MC.scheduler.feeds is not self.MC.feeds:
+            saved = {}
+            for r in self.qr_sql('select feed_id, cache_until, rate, checks, empty_checks, predicted, actual, bytes_saved from fetch_schedule', all=True):
+                saved[r[0]] = {'cache_until':r[1], 'rate':r[2], 'checks':r[3], 'empty_checks':r[4], 'predicted':r[5], 'actual':r[6], 'bytes_saved':r[7]}
+            ids = self.MC.scheduler.needs_history(self.MC.feeds, saved)
+            if len(ids) > 0: history = self._publication_rates(ids)
+            else: history = {}
+            self.MC.scheduler.build(self.MC.feeds, saved, history=history)
+        return self.MC.scheduler
+
+    def _publication_rates(self, ids:list):
+        """ Estimate new entries per hour for given channels from recent history """
+        now = int(datetime.now().timestamp())
+        since = now - ADAPTIVE_HISTORY
+        rates = {}
+        for r in self.qr_sql("""select e.feed_id, sum(case when e.adddate >= :since then 1 else 0 end), min(e.adddate) 
+from entries e where e.feed_id in (%s) and coalesce(e.deleted,0) <> 1 group by e.feed_id""" % ', '.join([str(scast(i, int, 0)) for i in ids]), {'since':since}, all=True):
+            # Channels added recently have shorter history
+            span = max(now - max(since, scast(r[2], int, now)), 86400)
+            rates[r[0]] = scast(r[1], int, 0) / span * 3600
+        return rates
 
 
 
@@ -156,8 +353,11 @@ class Feeder:
                     yield -1, _('Error creating DB foler %a'), db_dir
                     return -1
 
+        if first_run: self.MC.db_pool.clear(db_path)
+
+        # Connections come from pool with PRAGMAs already set up
         try:
-            self.conn = sqlite3.connect(db_path)
+            self.conn, reused = self.MC.db_pool.get(db_path)
             self.curs = self.conn.cursor()
         except (sqlite3.Error, sqlite3.OperationalError, OSError) as e: 
             yield -2, _('DB connection error: %a'), e
@@ -168,18 +368,12 @@ class Feeder:
         self.MC.conns += 1
         self.conn_id = self.MC.conns
 
-        if self.debug in (1,2): print(f"{_('Connected to')} {db_path} ({self.conn_id})")
-
-        # Some technical stuff...
-        try:
-            with self.conn:
-                self.curs.execute("PRAGMA case_sensitive_like=true")
-        except sqlite3.Error as e:
-            yield -2, f'{_("Error setting up PRAGMA")} ({self.conn_id}): %a', e
-            return -2
+        if self.debug in (1,2): print(f"{_('Connected to')} {db_path} ({self.conn_id}{', pooled' if reused else ''})")
 
         # If not in main thread - not do version checks and other maintenance
         if not self.main_thread and not self.allow_create: return 0
+        # ... or if it was already done for this DB
+        if db_path in self.MC.db_pool.checked: return 0
 
         if first_run:
 
@@ -235,21 +429,13 @@ class Feeder:
 
             # ... make a clean backup
             self.conn.rollback()
-            self.conn.close()
+            self._checkpoint()
             try:
                 copyfile(db_path, f'{db_path }.bak')
             except OSError as e:
                 self.db_status = f"""{_('Error creating database backup to')} {db_path}.bak: {e}"""
                 yield -1, f"""{_("Error creating database backup to")} {db_path}.bak: %a""", e
                 return -1
-            
-            try:
-                self.conn = sqlite3.connect(db_path)
-                self.curs = self.conn.cursor()
-            except (sqlite3.Error, sqlite3.OperationalError, OSError) as e: 
-                yield -2, _('DB reconnection error: %a'), e
-                self.db_status = f'{_("DB reconnection error:")} {e}'
-                return -2
 
             for d in sorted( os.listdir(f'{FEEDEX_SYS_SHARED_PATH}{DIR_SEP}data{DIR_SEP}db_scripts') ):
 
@@ -268,6 +454,7 @@ class Feeder:
                                 yield -2, f"""{_('Error running %a script')} ({e})! {_('Attempting to restore database')}""", scr_path
                                 # Restore backup...
                                 self.close()
+                                self.MC.db_pool.clear(db_path)
                                 try:
                                     os.remove(db_path)
                                     copyfile(db_path + '.bak', db_path)
@@ -290,12 +477,14 @@ class Feeder:
                 return -1 
             yield 0, _('Backup database removed successfully')
 
+        self.MC.db_pool.checked.add(db_path)
+        return 0
+
 
     def _reset_connection(self, **kargs):
         """ Reset connection to database, rollback all hanging transactions and unlock"""
         try:
-            self.conn.rollback()
-            self.conn.close()
+            self.close()
             self._connect_db()
             self.unlock()
             if kargs.get('log',False): self.log(False, f"{_('Connection')} {self.conn_id} {_('reset')}")
@@ -309,34 +498,27 @@ class Feeder:
 
 
     # Database lock and handling it with timeout - waiting for availability
+    # In-process waiters are handled by lock manager in main container, other processes see 'lock' marker in params table
     def lock(self, **kargs):
         """ Locks DB """
-        try:
-            with self.conn:
-                self.curs.execute("insert into params values('lock', 1)")
-        except (sqlite3.Error, sqlite3.OperationalError) as e:
-            if hasattr(e, 'message'): err = e.message 
-            else: err = e
-            self.db_error = err
-            self.MC.ret_status = -2
-            self.log(True, f'{_("DB error")} ({self.conn_id} - {_("locking")}): {err}')
-            cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("locking")}): %a', err) )
-            return e
-            
-        self.MC.db_lock = True
+        if self.locked(timeout=0): return -4
         if kargs.get('verbose', False): cli_msg( (0, _('Database locked')) )
         return 0
 
     def unlock(self, **kargs):
         """ Unlocks DB """
         if kargs.get('ignore',False): return 0
+        # Nested lock is released by outer call
+        if self.MC.db_locks.held(self.lock_owner) > 1:
+            self.MC.db_locks.release(self.lock_owner)
+            return 0
         # Need to do a loop to make sure DB is unlocked no matter what
         tm = 0
         while tm <= self.timeout or self.wait_indef:        
             try:
                 with self.conn:
                     self.curs.execute("delete from params where name='lock'")
-                self.MC.db_lock = False
+                self.MC.db_locks.release(self.lock_owner)
                 if kargs.get('verbose', False): cli_msg( (0, _('Database unlocked')) )
                 return 0
             except (sqlite3.Error, sqlite3.OperationalError) as e:
@@ -349,30 +531,69 @@ class Feeder:
             tm = tm + 1
             time.sleep(1)
         
+        self.MC.db_locks.release(self.lock_owner)
         cli_msg((-1, f'{_("Failed to unlock DB")} ({self.conn_id})'))
         self.MC.ret_status = -4
         return -1
 
     
     def locked(self, **kargs):
-        """ Checks if DB is locked and waits the timeout checking for availability before aborting"""
+        """ Checks if DB is locked and waits the timeout checking for availability before aborting. If not locked - locks it
+            exclusive=True - wait for local readers to finish and keep new ones waiting until unlocked """
         if kargs.get('ignore',False): return False
         if self.ignore_lock: return False
         timeout = kargs.get('timeout', self.timeout)
+        if self.wait_indef: timeout = None
+
+        started = time.perf_counter()
+        if not self.MC.db_locks.acquire(self.lock_owner, timeout, exclusive=kargs.get('exclusive',False)):
+            return self._lock_timeout(started)
+        if self.MC.db_locks.held(self.lock_owner) > 1: return False
+
+        # Lock marker is checked and inserted in one write transaction, so two processes can not both get it
+        delay = 0.05
+        reported = 1
+        while True:
+            claimed = self._claim_lock()
+            waited = time.perf_counter() - started
+            if claimed: 
+                if waited > 0.001: 
+                    self.MC.db_locks.add_wait(waited)
+                    if self.debug in (1,2): cli_msg( (0, f'{_("Lock acquired after")} %a s ({self.conn_id})', round(waited,3)) )
+                return False
 
-        tm = 0
-        while tm <= timeout or self.wait_indef:
-            if not self.MC.db_lock: lock = self.qr_sql("select * from params where name = 'lock'", one=True)
-            else: lock = 1
+            if timeout is not None and waited >= timeout: break
+            if waited >= reported:
+                cli_msg( (-4, f"{_('Database locked')} ({self.conn_id})... {_('Waiting')}... {int(waited)}") )
+                reported += 1
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+
+        self.MC.db_locks.release(self.lock_owner)
+        return self._lock_timeout(started)
+
+
+    def _claim_lock(self):
+        """ Insert lock marker if not present (BEGIN IMMEDIATE waits for other writers using busy timeout) """
+        try:
+            if self.conn.in_transaction: self.conn.commit()
+            self.curs.execute('BEGIN IMMEDIATE')
+            lock = self.curs.execute("select 1 from params where name = 'lock'").fetchone()
+            if lock is None: self.curs.execute("insert into params values('lock', 1)")
+            self.conn.commit()
+        except (sqlite3.Error, sqlite3.OperationalError) as e:
+            self.conn.rollback()
+            if hasattr(e, 'message'): err = e.message 
+            else: err = e
+            self.log(True, f'{_("DB error")} ({self.conn_id} - {_("locking")}): {err}')
+            cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("locking")}): %a', err) )
+            return False
+        return lock is None
 
-            if lock is not None or self.db_error is not None: 
-                cli_msg( (-4, f"{_('Database locked')} ({self.conn_id})... {_('Waiting')}... {tm}") )     
-            else:
-                self.lock()
-                return False
-            tm = tm + 1
-            time.sleep(1)
 
+    def _lock_timeout(self, started:float):
+        """ Register and report failed locking """
+        self.MC.db_locks.add_wait(time.perf_counter() - started, timeout=True)
         self.MC.ret_status = cli_msg( (-4, f'{_("Timeout reached")} ({self.conn_id}). {_("Aborting")}...') )
         return True
 
@@ -431,25 +652,9 @@ class Feeder:
         if kargs.get('ignore_errors', True): self.db_error = None
         elif self.db_error is not None: return ()
 
-        tm=0
-        ready = False
-        while tm <= LOCAL_DB_TIMEOUT: # This will queue the query if there is something else going on locally...
-            if not self.MC.db_lock: 
-                ready = True
-                break
-            elif self.debug in (1,2): cli_msg ( (-2, f'DB locked locally (sql: {sql}) ({self.conn_id})... waiting {tm}') )
-            tm += 1
-            time.sleep(1)
-
-        if not ready: 
-            cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("read")}): %a ({sql})', _('Local lock timeout reached')) )
-            self.db_error = _('Local lock timeout reached')
-            self.MC.ret_status = -2
-            return ()
-        
+        if not self._wait_local_lock(sql): return ()
 
         try:
-            self.MC.db_lock = True        
             if many: 
                 with self.conn: return self.curs.executemany(sql, *args)
             else:
@@ -460,17 +665,78 @@ class Feeder:
             
             
         except (sqlite3.Error, sqlite3.OperationalError) as e:            
-            if hasattr(e, 'message'): err = e.message 
-            else: err = e
-            self.db_error = err
-            self.MC.ret_status = -2
-            self.log(True, f'{_("DB error")} ({self.conn_id} - {_("read")}): {err} ({sql})')
-            cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("read")}): %a ({sql})', err) )
-            self.conn.rollback()
-            self.MC.db_lock = False
+            self._read_error(e, sql)
             return ()
 
-        finally: self.MC.db_lock = False 
+        finally: self.MC.db_locks.release_read()
+
+
+
+    def qr_sql_iter(self, sql:str, *args, **kargs):
+        """ Query database and yield results in batches of rows, so large result sets are never loaded whole - no locking
+            Default: rows are fetched from a live cursor
+            keyset=INT: query is re-run for every batch with :last_key set to given column of the last row fetched. 
+                        Query needs a condition on :last_key, ordering by that column and 'limit :limit' at the end.
+                        Use this if queried tables are modified while iterating """
+        batch = scast(kargs.get('batch', self.config.get('max_items_per_transaction', 300)), int, 300)
+        keyset = kargs.get('keyset')
+        if kargs.get('ignore_errors', True): self.db_error = None
+        elif self.db_error is not None: return 0
+
+        if keyset is not None:
+            params = dict(slist(args, 0, {}))
+            params['limit'] = batch
+            params['last_key'] = params.get('last_key', kargs.get('start', 0))
+            while True:
+                rows = self.qr_sql(sql, params, all=True)
+                if self.db_error is not None or len(rows) == 0: break
+                yield rows
+                if len(rows) < batch: break
+                params['last_key'] = rows[-1][keyset]
+            return 0
+
+        curs = self.conn.cursor()
+        started = False
+        try:
+            while True:
+                if not self._wait_local_lock(sql): break
+                try:
+                    if not started:
+                        curs.execute(sql, *args)
+                        started = True
+                    rows = curs.fetchmany(batch)
+                except (sqlite3.Error, sqlite3.OperationalError) as e:
+                    self._read_error(e, sql)
+                    break
+                finally: self.MC.db_locks.release_read()
+
+                if len(rows) == 0: break
+                yield rows
+        finally: curs.close()
+        return 0
+
+
+
+    def _wait_local_lock(self, sql:str):
+        """ Wait for exclusive local operations (e.g. maintenance) to finish """
+        if self.MC.db_locks.acquire_read(self.lock_owner, LOCAL_DB_TIMEOUT): return True
+
+        cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("read")}): %a ({sql})', _('Local lock timeout reached')) )
+        self.db_error = _('Local lock timeout reached')
+        self.MC.ret_status = -2
+        return False
+
+
+
+    def _read_error(self, e, sql:str):
+        """ Handle error on reading from DB """
+        if hasattr(e, 'message'): err = e.message 
+        else: err = e
+        self.db_error = err
+        self.MC.ret_status = -2
+        self.log(True, f'{_("DB error")} ({self.conn_id} - {_("read")}): {err} ({sql})')
+        cli_msg( (-2, f'{_("DB error")} ({self.conn_id} - {_("read")}): %a ({sql})', err) )
+        self.conn.rollback()
 
 
 
@@ -480,17 +746,32 @@ class Feeder:
 
 
     def _disconnect(self):
-        """ Wrapper for updating connection count """
+        """ Wrapper for updating connection count and giving connection back to pool """
         if self.debug in (1,2): print(f'Disconnecting connection {self.conn_id}')
         self.MC.conns -= 1
+        if hasattr(self, 'lock_owner'): self.MC.db_locks.release(self.lock_owner, all=True)
+        conn = getattr(self, 'conn', None)
+        if conn is not None: 
+            self.conn = None
+            self.MC.db_pool.put(self.db_path, conn)
 
     def close(self, **kargs):
-        """ Closes connection. Probably not required, but still """
+        """ Closes connection (it is not returned to pool) """
+        if self.conn is None: return 0
         try:
             self.conn.rollback()
             self.conn.close()
         except (sqlite3.Error, sqlite3.OperationalError) as e:
-            self.MC.ret_status = cli_msg( (-2, f'{_("DB error")}: %a ({_("on close")})', err) )
+            self.MC.ret_status = cli_msg( (-2, f'{_("DB error")}: %a ({_("on close")})', e) )
+        self.conn = None
+
+    def _checkpoint(self):
+        """ Write WAL contents to DB file, so it can be safely copied """
+        try: self.curs.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        except (sqlite3.Error, sqlite3.OperationalError) as e: 
+            self.db_error = e
+            return e
+        return 0
 
     def __del__(self):
         self._disconnect()
@@ -559,20 +840,89 @@ class Feeder:
         no_limit = kargs.get('no_limit',False)
         limit = scast(self.config.get('rule_limit'), int, 50000)
 
+        version = self._get_rules_db_version()
+
         if not self.config.get('use_keyword_learning', True):  #This config flag tells if we should learn and rank autoatically or by manual rules only
             rules = self.qr_sql(GET_RULES_NL_SQL, all=True)
         else:
             if no_limit or limit == 0:
+                limit = 0
                 rules = self.qr_sql(GET_RULES_SQL, all=True)
             else:
                 rules = self.qr_sql(f'{GET_RULES_SQL}LIMIT :limit', {'limit':limit} , all=True)           
 
         if self.db_error is None: 
             self.MC.rules = rules
+            self.MC.rules_limit = limit
+            self.MC.rules_db_version = version
+            self.MC.rules_version += 1
             return 0
         else: return self.db_error
 
 
+
+    def update_rules(self, context_id=None, **kargs):
+        """ Update rule cache after rules for a context (entry ID, None for manual rules) were changed, instead of reloading all rules.
+            Rules are reloaded fully if requested or if rules were changed elsewhere in the meantime (DB version mismatch).
+            Rules dropped by limit are not brought back until next full reload """
+        version = self._bump_rules_db_version()
+        if version is None: return self.db_error
+        if self.single_run: return 0
+
+        if kargs.get('full',False) or self.MC.rules_db_version is None or version != self.MC.rules_db_version + 1: return self.load_rules()
+
+        if not self.config.get('use_keyword_learning', True):
+            # Only manual rules are loaded in this mode, and quickly
+            if context_id is None: return self.load_rules()
+            self.MC.rules_db_version = version
+            return 0
+
+        if context_id is None: rules = self.qr_sql(GET_RULES_MANUAL_SQL, all=True)
+        else: rules = self.qr_sql(GET_RULES_CONTEXT_SQL, {'context_id':context_id}, all=True)
+        if self.db_error is not None: return self.db_error
+
+        context_id = scast(context_id, int, 0)
+        removed = []
+        kept = []
+        for r in self.MC.rules:
+            if scast(r[12], int, 0) == context_id: removed.append(r)
+            else: kept.append(r)
+
+        # Keep order and limit as in full query
+        kept.extend(rules)
+        kept.sort(key=lambda x: (scast(x[2], int, 0), -abs(scast(x[8], float, 0))) )
+        if self.MC.rules_limit > 0 and len(kept) > self.MC.rules_limit:
+            cut = set(kept[self.MC.rules_limit:])
+            kept = kept[:self.MC.rules_limit]
+            removed.extend(cut)
+            added = []
+            for r in rules:
+                if r not in cut: added.append(r)
+        else: added = rules
+
+        self.MC.rules = kept
+        self.MC.rules_db_version = version
+        self.LP.update_compiled_rules(removed, added)
+
+        if self.debug in (2,): print(f'Rules updated for context {context_id} (-{len(removed)}, +{len(added)})')
+        return 0
+
+
+
+    def _get_rules_db_version(self):
+        """ Get version counter of rules saved in DB """
+        return scast( slist(self.qr_sql("select val from params where name = 'rules_version'", one=True), 0, 0), int, 0)
+
+    def _bump_rules_db_version(self):
+        """ Increment rule version counter in DB and return new value (None on error) """
+        err = self.run_sql_lock("update params set val = coalesce(val,0) + 1 where name = 'rules_version'", ())
+        if err != 0: return None
+        if self.rowcount == 0:
+            err = self.run_sql_lock("insert into params values('rules_version', 1)", ())
+            if err != 0: return None
+        return self._get_rules_db_version()
+
+
     def load_history(self, **kargs):
         """ Get search history """
         history = self.qr_sql(f'{SEARCH_HISTORY_SQL} desc', all=True)
@@ -818,7 +1168,7 @@ class Feeder:
         # stat
         if num_added > 0:
             self.update_stats()
-            if not self.single_run: self.load_rules()
+            self.update_rules(full=True)
 
         if num_added > 1: 
             self.log(False, f'Added {num_added} new entries')
@@ -852,6 +1202,34 @@ class Feeder:
 
 
 
+    def next_fetch(self, **kargs):
+        """ Print seconds until next channel is due for check (0 if overdue), e.g. for scripts sleeping between checks """
+        due = self.scheduler.next_due()
+        if due is None:
+            self.update_ret_code( cli_msg( (-1, _('No Channels scheduled for checking')) ) )
+            return -1
+        print( max(0, due - int(datetime.now().timestamp())) )
+        return 0
+
+
+
+    def _schedule_next(self, feed, res:dict):
+        """ Put checked channel back to fetch queue and save its schedule """
+        item = self.scheduler.reschedule(feed, res['now'], error=res['error'], new_items=res['new_items'], observed=(res['status'] is not None),
+                                            cache_until=http_cache_until(res['headers'], res['now']), bytes_saved=res['bytes_saved'])
+        if item is None: return self.run_sql_lock('delete from fetch_schedule where feed_id = :id', {'id':feed['id']})
+        # Content cache is only replaced when a new body was downloaded
+        return self.run_sql_lock("""insert into fetch_schedule (feed_id, due, cache_until, rate, checks, empty_checks, predicted, actual, bytes_saved, content_hash, content_length) 
+values (:id, :due, :cache_until, :rate, :checks, :empty, :predicted, :actual, :bytes_saved, :content_hash, :content_length)
+on conflict(feed_id) do update set due = excluded.due, cache_until = excluded.cache_until, rate = excluded.rate, checks = excluded.checks, 
+empty_checks = excluded.empty_checks, predicted = excluded.predicted, actual = excluded.actual, bytes_saved = excluded.bytes_saved, 
+content_hash = coalesce(excluded.content_hash, content_hash), content_length = coalesce(excluded.content_length, content_length)""",
+                                    {'id':feed['id'], 'due':item['due'], 'cache_until':item['cache_until'], 'rate':item['rate'], 'checks':item['checks'],
+                                    'empty':item['empty'], 'predicted':item['predicted'], 'actual':item['actual'], 'bytes_saved':item['bytes_saved'],
+                                    'content_hash':res['content_hash'], 'content_length':res['content_length']})
+
+
+
     def lock_fetching(self, **kargs):
         """ Check if someone is currently fetching to DB """
         self.is_fetching = self.qr_sql("select val from params where name = 'is_fetching'", one=True)
@@ -892,22 +1270,17 @@ class Feeder:
 
 
 
-    def fetch(self, **kargs): 
+    def fetch(self, **kargs):
         for m in self.g_fetch(**kargs): self.update_ret_code( cli_msg(m) )
     def g_fetch(self, **kargs):
-        """ Check for news taking into account specified intervals and defaults as well as ETags and Modified tags"""
+        """ Check for news taking into account specified intervals and defaults as well as ETags and Modified tags.
+            Channels are downloaded and parsed by a pool of workers, but this generator remains the only one
+            writing to DB - results are processed and saved in channel order """
 
         if self.lock_fetching() != 0:
             yield -4, _('Someone else is currently fetching to the database?')
             return -4
 
-
-        feed_ids = scast(kargs.get('ids'), tuple, None)
-        feed_id = scast(kargs.get('id'), int, 0)
-
-        force = kargs.get('force', False)
-        ignore_interval = kargs.get('ignore_interval', True)
-
         skip_ling = kargs.get('skip_ling',False)
         update_only = kargs.get('update_only', False)
 
@@ -919,202 +1292,134 @@ class Feeder:
         tech_counter = 0
         meta_updated = False
 
-        handler = None
-        # Data handlers init - to load later...
-        rss_handler = None
-        html_handler = None
-        script_handler = None
-        
-        for feed in self.MC.feeds:
+        ientry = EntryContainer(self) # Container for validation and ling processing of downloaded entries
 
-            self.feed.clear()
-            self.feed.populate(feed)
+        for res in self._g_fetch_jobs(started, **kargs):
 
-            # Check for processing conditions...
-            if self.feed['deleted'] == 1 and not update_only and feed_id == 0: continue
-            if self.feed['fetch'] in (None,0) and feed_id == 0 and feed_ids is None: continue
-            if feed_id != 0 and feed_id != self.feed['id']: continue
-            if feed_ids is not None and self.feed['id'] not in feed_ids: continue
-            if self.feed['is_category'] not in (0,None) or self.feed['handler'] in ('local'): continue
-
-            # Ignore unhealthy feeds...
-            if scast(self.feed['error'],int,0) >= self.config.get('error_threshold',5) and not kargs.get('ignore_errors',False):
-                yield 0, _('Feed %a ignored due to previous errors'), self.feed.name(id=True)
+            # Messages from channel selection are passed on as they are
+            if isinstance(res, (tuple, list)):
+                yield res
                 continue
 
-            #Check if time difference exceeds the interval
-            last_checked = scast(self.feed['lastchecked'], int, 0)
-            if not ignore_interval:
-                diff = (started - last_checked)/60
-                if diff < scast(self.feed['interval'], int, self.config.get('default_interval',45)):
-                    if self.debug in (1,): print(f'Feed {self.feed["id"]} ignored (interval: {self.feed["interval"]}, diff: {diff})')
-                    continue
-
-            yield 0, _('Processing %a ...'), self.feed.name()
+            feed = res['feed']
+            yield 0, _('Processing %a ...'), feed.name()
+            items_before = self.new_items
 
             entries_sql = []
 
-            now = datetime.now()
-            now_raw = int(now.timestamp())
-            last_read = scast(self.feed['lastread'], int, 0)
-            
-            
-            # Choose/lazy-load appropriate handler           
-            if self.feed['handler'] == 'rss':
-                if rss_handler is None: rss_handler = FeedexRSSHandler(self)
-                handler = rss_handler
-            
-            elif self.feed['handler'] == 'html':
-                if html_handler is None: html_handler = FeedexHTMLHandler(self)
-                handler = html_handler
-            
-            elif self.feed['handler'] == 'script':
-                if script_handler is None: script_handler = FeedexScriptHandler(self)
-                handler = script_handler
-
-            elif self.feed['handler'] == 'local':
-                yield 0, _('Channel handled locally... Ignoring...')
-                continue
-            
-            else:
-                yield -3, _('Handler %a not recognized!'), self.feed['handler']
-                continue     
-
-            # Set up feed-specific user agent
-            if self.feed['user_agent'] not in (None, ''):
-                yield 0, _('Using custom User Agent: %a'), self.feed['user_agent']
-                handler.set_agent(self.feed['user_agent'])
-            else: handler.set_agent(None)
+            for item in res['items']:
 
-            # Start fetching ...
-            if not update_only:
+                if isinstance(item, dict):
+                    # Items not found among recent ones still need to be checked against whole channel
+                    if self._is_fetched(feed['id'], item, res['compare_links']): continue
+                    self.new_items += 1
+                    ientry.clear()
+                    ientry.merge(item)
+                    err = ientry.validate_types()
+                    if err != 0:
+                        yield -7, f'{_("Error while processing entry")} {self.new_items}: {_("Invalid data type for")} %a', err
+                        continue
 
-                pguids = self.qr_sql("""select distinct guid from entries e where e.feed_id = :feed_id""", {'feed_id':self.feed['id']} , all=True)
-                if handler.compare_links:
-                    plinks = self.qr_sql("""select distinct link from entries e where e.feed_id = :feed_id""", {'feed_id':self.feed['id']} , all=True, ignore_errors=False)
-                else:
-                    plinks = ()
-                
-                if self.db_error is not None: 
-                    self.log(True, f'{_("Feed")} {self.feed.name()} {_("ignored due to DB error")}: {self.db_error}')
-                    yield -2, f'{_("Feed")} {self.feed.name()} {_("ignored due to DB error")}: %a', self.db_error
-                    continue
+                    entries_sql.append(ientry.vals.copy())
 
-                handler.set_feed(self.feed)
-                for item in handler.fetch(self.feed, force=force, pguids=pguids, plinks=plinks, last_read=last_read, last_checked=last_checked):
-                    
-                    if isinstance(item, EntryContainer):
-                        self.new_items += 1
-                        err = item.validate_types()
-                        if err != 0: 
-                            yield -7, f'{_("Error while processing entry")} {self.new_items}: {_("Invalid data type for")} %a', err
-                            continue
-                        
-                        if not skip_ling:
-                            item.ling(index=True, stats=True, rank=True)
-                            vals = item.vals.copy()
-                            if isinstance(vals, dict): entries_sql.append(vals)
-                            else: yield -1, _('Error while linguistic processing %a!'), item
-                        else:
-                            entries_sql.append(item.vals.copy())
-
-                        # Track new entries and take care of massive insets by dividing them into parts
-                        tech_counter += 1
-                        if tech_counter >= self.config.get('max_items_per_transaction', 300):
-                            err = self.run_sql_lock(self.entry.insert_sql(all=True), entries_sql, many=True)
-                            if err != 0: yield -2, _('DB error: %a'), err
-                            else: entries_sql = []                # If error occurs do not clear the pipeline in hope that it will succeed on next try
-
-                            tech_counter = 0  
-
-
-                    elif isinstance(item, (tuple, list)):
-                        yield item
-                    else:
-                        yield -3, _('Unknown error: %a'), item
+                    # Track new entries and take care of massive insets by dividing them into parts
+                    tech_counter += 1
+                    if tech_counter >= self.config.get('max_items_per_transaction', 300):
+                        # Linguistic processing is done for whole batch
+                        if not skip_ling: self.LP.process_entries(entries_sql, index=True, stats=True, rank=True)
+                        err = self.run_sql_lock(self.entry.insert_sql(all=True), entries_sql, many=True)
+                        if err != 0: yield -2, _('DB error: %a'), err
+                        else: entries_sql = []                # If error occurs do not clear the pipeline in hope that it will succeed on next try
 
+                        tech_counter = 0
 
-                # Push final entries to DB
-                if len(entries_sql) > 0:
-                    err = self.run_sql_lock(self.entry.insert_sql(all=True), entries_sql, many=True)
-                    if err != 0: yield -2, _('DB error: %a'), err
+                elif isinstance(item, (tuple, list)):
+                    yield item
+                else:
+                    yield -3, _('Unknown error: %a'), item
 
+            # Push final entries to DB
+            if len(entries_sql) > 0:
+                if not skip_ling: self.LP.process_entries(entries_sql, index=True, stats=True, rank=True)
+                err = self.run_sql_lock(self.entry.insert_sql(all=True), entries_sql, many=True)
+                if err != 0: yield -2, _('DB error: %a'), err
 
-            else:
-                handler.set_feed(self.feed)
-                msg = handler.download(force=force)
-                if msg != 0: yield -3, _('Handler error: %a'), msg
 
 
+            res['new_items'] = self.new_items - items_before
 
-            if handler.error:
+            if res['error']:
                 # Save info about errors if they occurred
                 if update_only:
-                    err = self.run_sql_lock("""update feeds set http_status = :status, error = coalesce(error,0)+1 where id = :id""", {'status': handler.status, 'id': self.feed['id']} )
+                    err = self.run_sql_lock("""update feeds set http_status = :status, error = coalesce(error,0)+1 where id = :id""", {'status': res['status'], 'id': feed['id']} )
                 else:
-                    err = self.run_sql_lock("""update feeds set lastchecked = :now, http_status = :status, error = coalesce(error,0)+1 where id = :id""", {'now':now_raw, 'status':handler.status, 'id': self.feed['id']} )
+                    err = self.run_sql_lock("""update feeds set lastchecked = :now, http_status = :status, error = coalesce(error,0)+1 where id = :id""", {'now':res['now'], 'status':res['status'], 'id': feed['id']} )
                 if err != 0: yield -2, _('DB error: %a'), err
 
+                if not update_only:
+                    err = self._schedule_next(feed, res)
+                    if err != 0: yield -2, _('DB error: %a'), err
+
                 continue
 
-            else:				
+            else:
                 #Update feed last checked date and other data
                 if update_only:
-                    err = self.run_sql_lock("""update feeds set http_status = :status, error = 0  where id = :id""", {'status':handler.status, 'id': self.feed['id']} )
+                    err = self.run_sql_lock("""update feeds set http_status = :status, error = 0  where id = :id""", {'status':res['status'], 'id': feed['id']} )
                 else:
-                    err = self.run_sql_lock("""update feeds set lastread = :now, lastchecked = :now, etag = :etag, modified = :modified, http_status = :status, error = 0  where id = :id""", 
-                    {'now':now_raw, 'etag':handler.etag, 'modified':handler.modified, 'status':handler.status, 'id':self.feed['id']} )
+                    err = self.run_sql_lock("""update feeds set lastread = :now, lastchecked = :now, etag = :etag, modified = :modified, http_status = :status, error = 0  where id = :id""",
+                    {'now':res['now'], 'etag':res['etag'], 'modified':res['modified'], 'status':res['status'], 'id':feed['id']} )
                 if err != 0: yield -2, _('DB error: %a'), err
 
+                if not update_only:
+                    err = self._schedule_next(feed, res)
+                    if err != 0: yield -2, _('DB error: %a'), err
+
 
             # Inform about redirect
-            if handler.redirected: 
-                self.log(False, f"{_('Channel redirected')} ({self.feed['url']})")
-                yield 0, f'{_("Channel redirected")} (%a)', self.feed['url']
+            if res['redirected']:
+                self.log(False, f"{_('Channel redirected')} ({feed['url']})")
+                yield 0, f'{_("Channel redirected")} (%a)', feed['url']
 
             # Save permanent redirects to DB
-            if handler.feed_raw.get('href',None) != self.feed['url'] and handler.status == 301:
-                self.feed['url'] = rss_handler.feed_raw.get('href',None)
+            if res['href'] != feed['url'] and res['status'] == 301:
+                feed['url'] = res['href']
                 if not update_only and kargs.get('save_perm_redirects', self.config.get('save_perm_redirects', False) ):
-                    err = self.run_sql_lock('update feeds set url = :url where id = :id', {'url':self.feed['url'], 'id':self.feed['id']} )    
+                    err = self.run_sql_lock('update feeds set url = :url where id = :id', {'url':feed['url'], 'id':feed['id']} )
                     if err != 0: yield -2, _('DB error: %a'), err
 
             # Mark deleted as unhealthy to avoid unnecessary fetching
-            if handler.status == 410 and self.config.get('mark_deleted',False):
-                err = self.run_sql_lock('update feeds set error = :err where id = :id', {'err':self.config.get('error_threshold',5), 'id':self.feed['id']})
+            if res['status'] == 410 and self.config.get('mark_deleted',False):
+                err = self.run_sql_lock('update feeds set error = :err where id = :id', {'err':self.config.get('error_threshold',5), 'id':feed['id']})
                 if err != 0: yield -2, _('DB error: %a'), err
 
 
 
-            # Autoupdate metadata if needed or specified by 'forced' or 'update_only'
-            if (scast(self.feed['autoupdate'], int, 0) == 1 or update_only) and not handler.no_updates:
+            # Save metadata autoupdated by worker
+            if res['update']:
 
-                yield 0, _('Updating metadata for %a'), self.feed.name()
+                yield 0, _('Updating metadata for %a'), feed.name()
 
-                msg = handler.update(self.feed, ignore_images=self.config.get('ignore_images',False))
+                msg = res['update_msg']
                 if msg != 0: yield -3, _('Handler error: %a'), msg
                 else:
 
-                    updated_feed = handler.feed
+                    updated_feed = res['updated_feed']
 
                     if updated_feed == -1:
-                        yield -3, _('Error updating metadata for feed %a'), self.feed.name(id=True)
+                        yield -3, _('Error updating metadata for feed %a'), feed.name(id=True)
                         continue
                     elif updated_feed == 0:
                         continue
-                    
+
                     err = updated_feed.validate_types()
                     if err != 0: yield -7, _('Invalid data type for %a'), err
                     else:
                         err = self.run_sql_lock(updated_feed.update_sql(wheres=f'id = :id'), updated_feed.vals)
                         if err != 0: yield -2, _('DB Error: %a'), err
-        
-                    meta_updated = True
-                    yield 0, _('Metadata updated for feed %a'), self.feed.name()
 
-
-            # Stop if this was the specified feed...
-            if feed_id != 0: break
+                    meta_updated = True
+                    yield 0, _('Metadata updated for feed %a'), feed.name()
 
 
 
@@ -1123,13 +1428,14 @@ class Feeder:
         if self.new_items > 0:
             err = self.run_sql_lock("""insert into actions values('fetch', :started)""", {'started':started} )
             if err != 0: yield -2, _('DB Error: %a'), err
-            else: 
+            else:
                 if self.MC.fetches is None: self.get_last()
                 self.MC.fetches.insert(0, (started, started_str) )
 
         if kargs.get('update_stats',True):
             if self.new_items > 0: self.update_stats()
 
+        if self.debug in (1,3): print(date_parse_stats())
         if not update_only: yield 0, _('Finished fetching (%a new articles)'), self.new_items
         else: yield 0, _('Finished updating metadata')
 
@@ -1139,6 +1445,294 @@ class Feeder:
 
 
 
+    def _g_fetch_jobs(self, started:int, **kargs):
+        """ Select channels for fetching and dispatch them to download workers. Yields selection messages and
+            finished jobs. Jobs are yielded in channel order, regardless of which worker finishes first.
+            Jobs of streaming handlers (scripts) are yielded as soon as they are first in line - their items are
+            taken from worker while it is still running """
+        feed_ids = scast(kargs.get('ids'), tuple, None)
+        feed_id = scast(kargs.get('id'), int, 0)
+
+        ignore_interval = kargs.get('ignore_interval', True)
+        update_only = kargs.get('update_only', False)
+
+        # Single channel does not need a pool
+        workers = scast(kargs.get('workers', self.fetch_workers), int, 1)
+        if feed_id != 0 or workers < 1: workers = 1
+
+        # Unless intervals are ignored, only channels due for check are taken from scheduler's queue.
+        # Channels given explicitly are looked up among all feeds, so they can be checked even if they are not queued
+        explicit = feed_id != 0 or feed_ids is not None
+        if ignore_interval:
+            scheduler = None
+            feeds = self.MC.feeds
+        elif explicit:
+            scheduler = self.scheduler
+            feeds = self.MC.feeds
+        else:
+            scheduler = self.scheduler
+            feeds = [scheduler.rows[i] for i in scheduler.take_due(started)]
+            if self.debug in (1,): print(f'Channels due for check: {len(feeds)}')
+
+        if workers > 1 and len(feeds) > 1: pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feedex_fetch')
+        else: pool = None
+        pending = deque() # Pending (future, job) in channel order
+        streams = [] # Streaming jobs, to be closed if fetching stops
+        # Scripts get their slots in dispatch order, so a streaming job first in line is never stuck behind later ones
+        script_slots = FeedexOrderedSlots(scast(self.config.get('script_workers',2), int, 2))
+
+        try:
+            for feed in feeds:
+
+                self.feed.clear()
+                self.feed.populate(feed)
+
+                # Check for processing conditions...
+                if self.feed['deleted'] == 1 and not update_only and feed_id == 0: continue
+                if self.feed['fetch'] in (None,0) and feed_id == 0 and feed_ids is None: continue
+                if feed_id != 0 and feed_id != self.feed['id']: continue
+                if feed_ids is not None and self.feed['id'] not in feed_ids: continue
+                if self.feed['is_category'] not in (0,None) or self.feed['handler'] in ('local'): continue
+
+                # Ignore unhealthy feeds...
+                if scast(self.feed['error'],int,0) >= self.config.get('error_threshold',5) and not kargs.get('ignore_errors',False):
+                    yield 0, _('Feed %a ignored due to previous errors'), self.feed.name(id=True)
+                    continue
+
+                last_checked = scast(self.feed['lastchecked'], int, 0)
+
+                handler = FEEDEX_HANDLERS.get(self.feed['handler'])
+                if handler is None:
+                    yield -3, _('Handler %a not recognized!'), self.feed['handler']
+                    continue
+
+                if scheduler is not None and explicit and not scheduler.take(self.feed, started):
+                    if self.debug in (1,): print(f'Feed {self.feed["id"]} ignored (not due for check)')
+                    continue
+
+                job = {'feed':feed, 'force':kargs.get('force',False), 'update_only':update_only, 'last_read':scast(self.feed['lastread'], int, 0),
+                        'last_checked':last_checked, 'pguids':(), 'plinks':(), 'content_hash':None, 'content_length':None}
+
+                # Guids and links of recent entries are loaded here, as workers do not touch DB. Older ones are checked by writer
+                if not update_only:
+                    recent = self.qr_sql("""select e.guid, e.link from entries e where e.feed_id = :feed_id order by e.id desc limit :limit""",
+                                {'feed_id':self.feed['id'], 'limit':scast(self.config.get('dedup_window',1000), int, 1000)} , all=True, ignore_errors=False)
+                    pguids = set()
+                    plinks = set()
+                    for r in recent:
+                        if r[0] not in (None,''): pguids.add(r[0])
+                        if r[1] not in (None,'') and handler.compare_links: plinks.add(r[1])
+                    job['pguids'] = pguids
+                    job['plinks'] = plinks
+
+                    # Last downloaded content for skipping unchanged pages
+                    if handler.all_is_html:
+                        cache = self.qr_sql('select content_hash, content_length from fetch_schedule where feed_id = :feed_id', {'feed_id':self.feed['id']}, one=True)
+                        job['content_hash'] = slist(cache, 0, None)
+                        job['content_length'] = slist(cache, 1, None)
+
+                    if self.db_error is not None:
+                        self.log(True, f'{_("Feed")} {self.feed.name()} {_("ignored due to DB error")}: {self.db_error}')
+                        yield -2, f'{_("Feed")} {self.feed.name()} {_("ignored due to DB error")}: %a', self.db_error
+                        continue
+
+                    # Items are passed to writer while handler is working
+                    if handler.streams_entries:
+                        job['stream'] = Queue(maxsize=FETCH_STREAM_SIZE)
+                        job['closed'] = threading.Event()
+                        job['res'] = self._fetch_result(job)
+                        job['res']['items'] = self._g_fetch_stream(job)
+                        streams.append(job)
+                        # Even a single channel needs a worker for that
+                        if pool is None: pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feedex_fetch')
+
+                if self.feed['handler'] == 'script':
+                    job['slots'] = script_slots
+                    job['ticket'] = script_slots.ticket()
+
+                if pool is None: yield self._fetch_job(job)
+                else:
+                    pending.append( (pool.submit(self._fetch_job, job), job) )
+                    # Keep the pipeline bounded and pass on finished (or streaming) jobs from the head
+                    while len(pending) >= workers * 2 or (len(pending) > 0 and (pending[0][0].done() or 'stream' in pending[0][1])):
+                        yield from self._g_fetch_result(*pending.popleft())
+
+                # Stop if this was the specified feed...
+                if feed_id != 0: break
+
+            while len(pending) > 0: yield from self._g_fetch_result(*pending.popleft())
+
+        finally:
+            # Workers waiting for writer or a slot must not block shutdown
+            for job in streams: job['closed'].set()
+            script_slots.close()
+            if pool is not None: pool.shutdown(wait=True, cancel_futures=True)
+            # Channels taken, but skipped go back to queue
+            if scheduler is not None: scheduler.release()
+
+
+
+
+    def _g_fetch_result(self, future, job:dict):
+        """ Yield result of a dispatched job. Streaming job is yielded right away and its worker is waited for 
+            after writer took all items """
+        if 'stream' not in job: yield future.result()
+        else:
+            yield job['res']
+            future.result()
+
+
+    def _g_fetch_stream(self, job:dict):
+        """ Items of a streaming job in order, until worker is finished """
+        try:
+            while True:
+                item = job['stream'].get()
+                if item is None: return 0
+                yield item
+        finally: job['closed'].set()
+
+
+    def _fetch_stream_put(self, job:dict, handler, item):
+        """ Pass item to writer. Handler's time limit is stopped while writer is busy with previous items """
+        stream = job['stream']
+        if stream.full():
+            if handler is not None: handler.hold()
+            # Only this worker puts items, so there will be room once it is not full
+            while stream.full():
+                if job['closed'].wait(FETCH_STREAM_WAIT): return -1
+            if handler is not None: handler.resume()
+        stream.put(item)
+        return 0
+
+
+
+    def _fetch_result(self, job:dict):
+        """ Empty result for a job """
+        feed = FeedContainerBasic()
+        feed.populate(job['feed'])
+        return {'feed':feed, 'items':[], 'now':int(datetime.now().timestamp()), 'error':False, 'status':None, 'etag':None, 'modified':None,
+                'redirected':False, 'href':None, 'headers':{}, 'content_hash':None, 'content_length':None, 'bytes_saved':0,
+                'update':False, 'update_msg':0, 'updated_feed':0, 'compare_links':True}
+
+
+
+    def _fetch_job(self, job:dict):
+        """ Download and parse a single channel. Runs in a worker thread, so no DB or shared containers here!
+            Returns a dict with messages and entries (in order) and final handler status. 
+            Streaming jobs pass messages and entries through job's stream instead and end it with None """
+        res = job.get('res')
+        if res is None: res = self._fetch_result(job)
+        feed = res['feed']
+
+        handler = None
+        try:
+            handler = self._get_fetch_handler(feed['handler'])
+            res['compare_links'] = handler.compare_links
+
+            if 'stream' in job: add = lambda item: self._fetch_stream_put(job, handler, item)
+            else: add = res['items'].append
+
+            return self._fetch_job_run(job, res, handler, add)
+
+        finally:
+            # Slot not taken (e.g. after error) must not hold up later scripts
+            if 'ticket' in job: job['slots'].drop(job['ticket'])
+            if 'stream' in job: self._fetch_stream_put(job, handler, None)
+
+
+    def _fetch_job_run(self, job:dict, res:dict, handler, add):
+        """ Run handler for a job, passing items to 'add' """
+        feed = res['feed']
+
+        # Set up feed-specific user agent
+        if feed['user_agent'] not in (None, ''):
+            add( (0, _('Using custom User Agent: %a'), feed['user_agent']) )
+            handler.set_agent(feed['user_agent'])
+        else: handler.set_agent(None)
+
+        with self._get_host_slot(feed, job) as slot:
+            # Fetching was stopped while waiting
+            if not slot: return res
+
+            handler.set_feed(feed)
+            if not job['update_only']:
+                for item in handler.fetch(feed, force=job['force'], pguids=job['pguids'], plinks=job['plinks'], last_read=job['last_read'], last_checked=job['last_checked'],
+                                            content_hash=job['content_hash'], content_length=job['content_length']):
+                    # Handler reuses its entry container, so values need to be copied
+                    if isinstance(item, EntryContainer): item = item.vals.copy()
+                    # Stop handler if writer does not take items anymore
+                    if add(item) == -1: break
+            else:
+                msg = handler.download(force=job['force'])
+                if msg != 0: add( (-3, _('Handler error: %a'), msg) )
+
+            res['error'] = handler.error
+            res['status'] = handler.status
+            res['etag'] = handler.etag
+            res['modified'] = handler.modified
+            res['redirected'] = handler.redirected
+            res['href'] = handler.feed_raw.get('href',None)
+            res['headers'] = handler.headers
+            res['content_hash'] = handler.content_hash
+            res['content_length'] = handler.content_length
+            res['bytes_saved'] = handler.bytes_saved
+
+            # Autoupdate metadata if needed or specified by 'forced' or 'update_only'
+            if not handler.error and handler.changed and (scast(feed['autoupdate'], int, 0) == 1 or job['update_only']) and not handler.no_updates:
+                res['update'] = True
+                res['update_msg'] = handler.update(feed, ignore_images=self.config.get('ignore_images',False))
+                if isinstance(handler.feed, FeedContainerBasic):
+                    res['updated_feed'] = FeedContainerBasic()
+                    res['updated_feed'].merge(handler.feed.vals)
+                else: res['updated_feed'] = handler.feed
+
+        return res
+
+
+
+    def _is_fetched(self, feed_id:int, entry:dict, compare_links:bool):
+        """ Check if entry's guid (or link) was already saved for a channel - uses (feed_id, guid/link) indices """
+        guid = entry.get('guid')
+        if guid not in (None,''):
+            if self.qr_sql("select 1 from entries e where e.feed_id = :feed_id and e.guid = :guid limit 1", {'feed_id':feed_id, 'guid':guid}, one=True) not in (None, ()): return True
+        link = entry.get('link')
+        if compare_links and link not in (None,''):
+            if self.qr_sql("select 1 from entries e where e.feed_id = :feed_id and e.link = :link limit 1", {'feed_id':feed_id, 'link':link}, one=True) not in (None, ()): return True
+        return False
+
+
+
+    def _get_fetch_handler(self, handler:str):
+        """ Lazy-load handler for current thread (handlers keep state between download and parsing, so they can't be shared) """
+        handlers = getattr(self.fetch_local, 'handlers', None)
+        if handlers is None:
+            handlers = {}
+            self.fetch_local.handlers = handlers
+        if handlers.get(handler) is None: handlers[handler] = FEEDEX_HANDLERS[handler](self)
+        return handlers[handler]
+
+
+    def _get_host_slot(self, feed, job:dict=None):
+        """ Get semaphore limiting parallel connections to channel's host. All scripted channels share one slot, 
+            so the number of running fetching scripts is limited (job's ticket is used, if dispatcher gave one) """
+        if job is not None and 'ticket' in job: return job['slots'].taken(job['ticket'])
+        if feed['handler'] == 'script':
+            host = '<script>'
+            size = scast(self.config.get('script_workers',2), int, 2)
+        else:
+            host = urllib.parse.urlparse(scast(feed['url'], str, '')).netloc
+            if host == '': host = f'<{feed["id"]}>'
+            size = scast(self.config.get('fetch_host_connections',2), int, 2)
+        with self.host_slots_lock:
+            slot = self.host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(size)
+                self.host_slots[host] = slot
+        return slot
+
+
+
+
 
 
 
@@ -1165,8 +1759,8 @@ class Feeder:
         err = self.run_sql_lock("""delete from rules where learned = 1""",[])
         if err != 0: return -2, _('DB error: %a'), err
         else:
-            if not self.single_run: self.load_rules()
             deleted_rules = self.rowcount
+            self.update_rules(full=True)
             return 0, _('Deleted %a learned rules'), deleted_rules
 
 
@@ -1213,7 +1807,8 @@ class Feeder:
         for msg in self.g_recalculate(**kargs): self.update_ret_code( cli_msg(msg) )
     def g_recalculate(self, **kargs):
         """ Utility to recalculate, retokenize, relearn, etc. 
-            Useful for mass operations """
+            Useful for mass operations. Entries are streamed in chunks and processed by a pool of processes,
+            results are saved here in batched transactions """
 
         entry_id = scast(kargs.get('id'), int, 0)
         learn = kargs.get('learn',False)
@@ -1227,96 +1822,174 @@ class Feeder:
             if rank: self.log(False,"Ranking according to saved rules...")
             if learn: self.log(False,"Learning keywords ...")
             if stats: self.log(False,"Recalculating entries' stats ...")
-
-            entries = self.qr_sql("""
-select 
-e.* 
-from entries e 
-join feeds f on f.id = e.feed_id 
-left join feeds ff on ff.id = f.parent_id
-where coalesce(e.deleted,0) <> 1 
-and coalesce(f.deleted,0) <> 1 
-and coalesce(ff.deleted,0) <> 1
-            """, all=True)
-
         else:
             many = False
             yield 0, f'{_("Recalculating entry")} {entry_id} ...'
-            entries = self.qr_sql("select * from entries where id=:id", {"id":entry_id} , all=True)
 
-        if self.db_error is not None:
-            yield -2, _('DB error: %a'), self.db_error
-            return -2
+        workers = scast(kargs.get('workers', self.recalc_workers), int, 1)
+        if workers == 0: workers = coalesce(os.cpu_count(), 1)
+        if not many: workers = 1
+        if workers > 1: yield 0, _('Processing with %a worker processes'), workers
+
+        # Workers get a copy of compiled rules for ranking
+        if rank and self.MC.rule_index_version != self.MC.rules_version: self.LP.compile_rules()
 
         entry = EntryContainer(self)
+        ling_kargs = {'learn':learn, 'index':stats, 'stats':stats, 'rank':rank}
 
         entry_q = []
         rules_q = []
         rules_ids_q = []
 
-        entries_len = len(entries)
+        started = time.time()
+        done = 0
 
-        i = 0
-        j = 0
-        for e in entries:
-    
-            i +=1
-            j +=1
+        for res in self._g_recalc_jobs(entry_id, many, learn, workers, ling_kargs):
 
-            entry.populate(e)
-            yield 0, _("Processing entry %a ..."), entry['id']
-    
-            if many and learn and coalesce(entry['read'],0) == 0: continue
+            if isinstance(res, tuple) and len(res) == 3:
+                yield res
+                return res[0]
 
-            entry.ling(learn=learn, index=stats, stats=stats, rank=rank, save_rules=False)
+            batch, features = res
             
-            vals = {'id':entry['id']}
-            if stats:
-                for f in LING_TECH_LIST: vals[f] = entry[f] 
-            if rank:
-                vals['importance'] = entry['importance']
-                vals['flag'] = entry['flag']
+            for vs, fs in zip(batch, features):
+                vals = {'id':vs['id']}
+                if stats:
+                    for f in LING_TECH_LIST: vals[f] = vs[f] 
+                if rank:
+                    vals['importance'] = vs['importance']
+                    vals['flag'] = vs['flag']
+
+                if learn:
+                    entry.clear()
+                    entry.merge(vs)
+                    entry.learn_rules(fs, save_rules=False)
+                    for r in entry.rules: rules_q.append(r)
+                    rules_ids_q.append({'id': vs['id']})
+
+                entry_q.append(vals)
+
+            yield 0, _('Committing batch ...')
+            err = self.run_sql_lock(self.entry.update_sql(filter=vals.keys(), wheres='id = :id'), entry_q, many=True)
+            if err != 0:
+                yield -2, _('DB error: %a'), err
+                return -2
 
             if learn:
-                entry.learn_rules(entry.FX.LP.features, save_rules=False)
-                for r in entry.rules: rules_q.append(r)
-                rules_ids_q.append({'id': entry['id']})
+                yield 0, _('Learning rule batch ...')
+                err = self.run_sql_lock('delete from rules where context_id = :id', rules_ids_q, many=True)
+                if err == 0:
+                    err = self.run_sql_lock(self.rule.insert_sql(all=True), rules_q, many=True)
+                
+                if err != 0:
+                    yield -2, _('DB error: %a'), err
+                    return -2
 
-            entry_q.append(vals)
+            entry_q.clear()
+            rules_q.clear()
+            rules_ids_q.clear()
 
+            done += len(batch)
+            elapsed = dezeroe(time.time() - started, 1)
+            yield 0, _('Batch committed. Entries processed: %a'), f'{done} ({round(done/elapsed, 1)}/s)'
 
-            if i >= self.config.get('max_items_per_transaction', 500) or j >= entries_len - 1:
 
-                yield 0, _('Committing batch ...')
-                err = self.run_sql_lock(self.entry.update_sql(filter=vals.keys(), wheres='id = :id'), entry_q, many=True)
-                if err != 0:
-                    yield -2, _('DB error: %a'), err
+        self.log(False, f"Recalculation finished ({done} entries in {round(time.time() - started)}s)")
+        yield 0, _('Recalculation finished!')
+
+        self.update_stats()
+        if learn: self.update_rules(full=True)
+        return 0
+
+
+
+    def _g_recalc_jobs(self, entry_id:int, many:bool, learn:bool, workers:int, ling_kargs:dict):
+        """ Process streamed entry chunks serially or in a process pool. Yields (batch, features) in order or error messages """
+        pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=recalc_worker_init, 
+                    initargs=(self.config, self.MC.rules, self.MC.rule_index, self.MC.manual_rules, self.debug))
+
+        pending = deque() # Limit of chunks in flight keeps memory bounded
+        try:
+            for batch in self._g_recalc_chunks(entry_id, many, learn):
+
+                if isinstance(batch, tuple):
+                    yield batch
                     return -2
 
-                if learn:
-                    yield 0, _('Learning rule batch ...')
-                    err = self.run_sql_lock('delete from rules where context_id = :id', rules_ids_q, many=True)
-                    if err == 0:
-                        err = self.run_sql_lock(self.rule.insert_sql(all=True), rules_q, many=True)
-                    
-                    if err != 0:
-                        yield -2, _('DB error: %a'), err
-                        return -2
+                if pool is None:
+                    yield batch, self.LP.process_entries(batch, **ling_kargs)
+                    continue
 
-                i = 0
-                entry_q.clear()
-                rules_q.clear()
-                rules_ids_q.clear()
+                try: pending.append(pool.submit(recalc_worker, batch, ling_kargs))
+                except Exception as e:
+                    yield -1, _('Recalculation worker error: %a'), e
+                    return -1
 
-                yield 0, _('Batch committed')
+                while len(pending) >= workers * 2:
+                    res = self._recalc_result(pending.popleft())
+                    yield res
+                    if len(res) == 3: return -1
 
+            while len(pending) > 0:
+                res = self._recalc_result(pending.popleft())
+                yield res
+                if len(res) == 3: return -1
 
-        self.log(False, "Recalculation finished")
-        yield 0, _('Recalculation finished!')
+        finally:
+            if pool is not None: pool.shutdown(wait=True, cancel_futures=True)
 
-        self.update_stats()
-        if learn: 
-            if not self.single_run: self.load_rules()
+
+
+    def _recalc_result(self, future):
+        """ Wait for worker's results """
+        try: return future.result()
+        except Exception as e: return -1, _('Recalculation worker error: %a'), e
+
+
+
+    def _g_recalc_chunks(self, entry_id:int, many:bool, learn:bool):
+        """ Stream entries for recalculation by id ranges, so the whole DB is never loaded at once """
+        entry = EntryContainer(self)
+        if many:
+            # Only read entries are learned from
+            for entries in self.qr_sql_iter("""
+select 
+e.* 
+from entries e 
+join feeds f on f.id = e.feed_id 
+left join feeds ff on ff.id = f.parent_id
+where coalesce(e.deleted,0) <> 1 
+and coalesce(f.deleted,0) <> 1 
+and coalesce(ff.deleted,0) <> 1
+and e.id > :last_key
+and (:learn = 0 or coalesce(e.read,0) <> 0)
+order by e.id
+limit :limit
+                """, {'learn':int(learn)}, keyset=0):
+
+                batch = []
+                for e in entries:
+                    entry.populate(e)
+                    batch.append(entry.vals.copy())
+                yield batch
+
+            if self.db_error is not None: 
+                yield -2, _('DB error: %a'), self.db_error
+                return -2
+
+        else:
+            entries = self.qr_sql("select * from entries where id=:id", {"id":entry_id} , all=True)
+            if self.db_error is not None:
+                yield -2, _('DB error: %a'), self.db_error
+                return -2
+
+            batch = []
+            for e in entries:
+                entry.populate(e)
+                batch.append(entry.vals.copy())
+            if len(batch) > 0: yield batch
         return 0
 
 
@@ -1340,6 +2013,8 @@ and coalesce(ff.deleted,0) <> 1
         if lock is not None: lock=_('DATABASE LOCKED!')
         else: lock=''
 
+        lock_stats = self.MC.db_locks.stats
+
         fetch_lock = self.qr_sql("select val from params where name = 'is_fetching'", one=True, ignore_errors=False)
 
         if self.db_error is not None: stat_str = f'{_("ERROR FETCHING DB STATISTICS!")}:<b>{self.db_error}</b>'
@@ -1383,6 +2058,8 @@ and coalesce(ff.deleted,0) <> 1
 {_('Last news update')}:       {mb}{last_time_str}{me}
 {_('First news update')}:      {mb}{first_time_str}{me}
 
+{_('Lock waits')}:             {mb}{lock_stats['waits']}{me} ({_('total')}: {round(lock_stats['wait_time'],3)}s, {_('max')}: {round(lock_stats['wait_max'],3)}s, {_('timeouts')}: {lock_stats['timeouts']})
+
 {fetch_lock}
 {lock}
 
@@ -1410,11 +2087,10 @@ and coalesce(ff.deleted,0) <> 1
         for m in self.g_db_maintenance(**kargs): self.update_ret_code( cli_msg(m) )        
     def g_db_maintenance(self, **kargs):
         """ Performs database maintenance to increase performance at large sizes """
-        if self.locked(ignore=kargs.get('ignore_lock',False)):
+        if self.locked(ignore=kargs.get('ignore_lock',False), exclusive=True):
             yield -4, _('DB locked!')
             return -4
 
-        self.MC.db_lock = False
         yield 0, _('Starting DB miantenance')
 
         yield 0, _('Performing VACUUM')
@@ -1423,6 +2099,9 @@ and coalesce(ff.deleted,0) <> 1
         self.qr_sql('ANALYZE', one=True, ignore_errors=False)
         yield 0, _('REINDEXING all tables')
         self.qr_sql('REINDEX', one=True, ignore_errors=False)
+        yield 0, _('Rebuilding aggregated rules')
+        self.qr_sql('delete from rules_agg', one=True, ignore_errors=False)
+        self.qr_sql(REBUILD_RULES_AGG_SQL, one=True, ignore_errors=False)
 
         yield 0, _('Updating document statistics')
         doc_count = slist(self.qr_sql(DOC_COUNT_SQL, one=True, ignore_errors=False),0, 0)
@@ -1509,7 +2188,7 @@ and coalesce(ff.deleted,0) <> 1
                 err = self.run_sql_lock(self.rule.insert_sql(all=True), ldata_sql, many=True)
                 if err != 0: return -2, _('DB error: %a'), err
                 else:
-                    if not self.single_run: self.load_rules()
+                    self.update_rules(full=True)
                     self.log(False, f'Rules successfully imported from {pfile}')
                     return 0, _('Rules successfully imported from %a'), pfile
 
@@ -1526,7 +2205,7 @@ and coalesce(ff.deleted,0) <> 1
                 err = self.run_sql_lock(self.flag.insert_sql(all=True), ldata_sql, many=True)
                 if err != 0: return -2, _('DB error: %a'), err
                 else:
-                    if not self.single_run: self.load_rules()
+                    if not self.single_run: self.load_flags()
                     self.log(False, f'Flags successfully imported from {pfile}')
                     return 0, _('Flags successfully imported from %a'), pfile
 
@@ -1539,7 +2218,7 @@ and coalesce(ff.deleted,0) <> 1
 
     def archive(self, time, target_db, **kargs):
         for m in self.g_archive(time, target_db, **kargs): self.update_ret_code( cli_msg(m) ) 
-    def g_archive(self, time, target_db, **kargs):
+    def g_archive(self, arch_time, target_db, **kargs):
         """ This function archives current database to a new one """
         with_rules = kargs.get('with_rules',False)
         no_read = kargs.get('no_read',False)
@@ -1552,14 +2231,12 @@ and coalesce(ff.deleted,0) <> 1
         db_backup = f'{self.db_path}.bak'
         yield 0, _("Making safety backup to %a"), db_backup
         self.conn.rollback()
-        self.conn.close()
+        self._checkpoint()
         try: copyfile(self.db_path, db_backup)
         except OSError as e:
-            self.db_status = f'Error creating database backup to {db_path}.bak: {e}'
-            yield -2, f'{_("Error creating database backup to")} {db_path}.bak: %a', e
+            self.db_status = f'Error creating database backup to {db_backup}: {e}'
+            yield -2, f'{_("Error creating database backup to")} {db_backup}: %a', e
             return -1
-        finally:
-            self._connect_db()
 
 
         target_db_conn = Feeder(self.MC, db_path=target_db, config=self.config, ignore_images=True, debug=self.debug, no_qp=True, load_icons=False, no_defaults=True, allow_create=True)
@@ -1567,11 +2244,13 @@ and coalesce(ff.deleted,0) <> 1
             yield -2, _('Target DB error: %a'), target_db_conn.db_error            
             return -2
         else: yield 0, _('Database %a created ...'), target_db
+        # Data will be copied through attached database on this connection
+        target_db_conn.close()
         
-        if type(time) is int: timestamp = time
-        else: timestamp = convert_timestamp(time)
+        if type(arch_time) is int: timestamp = arch_time
+        else: timestamp = convert_timestamp(arch_time)
         if timestamp is None: 
-            yield -7, _('Error converting time: %a'), time
+            yield -7, _('Error converting time: %a'), arch_time
             return -7
 
 
@@ -1579,114 +2258,132 @@ and coalesce(ff.deleted,0) <> 1
 
         # Adding additional sql conditions for unread- and unflagged-only params
         add_sql = ''
-        add_sql1 = ''
-        add_sql2 = ''
-        if no_read: 
-            add_sql = f'{add_sql} and coalesce(e.read,0) <= 0'
-            add_sql1 = f'{add_sql1} and coalesce(ee.read,0) <= 0'
-            add_sql2 = f'{add_sql2} and coalesce(read,0) <= 0'
-        if no_flag: 
-            add_sql = f'{add_sql} and coalesce(e.flag,0) = 0'
-            add_sql1 = f'{add_sql1} and coalesce(ee.flag,0) = 0'
-            add_sql2 = f'{add_sql2} and coalesce(flag,0) = 0'
-
-        entry_count = self.qr_sql(f"""select count(e.id) from entries e where e.pubdate <= :timestamp{add_sql}""",{'timestamp':timestamp}, one=True)
+        if no_read: add_sql = f'{add_sql} and coalesce(e.read,0) <= 0'
+        if no_flag: add_sql = f'{add_sql} and coalesce(e.flag,0) = 0'
+        entries_sql = f'e.pubdate <= :timestamp{add_sql}'
+
+        entry_count = self.qr_sql(f"""select count(e.id) from entries e where {entries_sql}""",{'timestamp':timestamp}, one=True)
         entry_count = slist(entry_count, 0, 0)
         if entry_count == 0: 
             yield 0, _('Nothing to be archived ... Aborting ...')
             return 0
 
+        if self.locked(ignore=kargs.get('ignore_lock',False)):
+            yield -4, _('DB locked!')
+            return -4
+
+        if self._run_sql("attach database :path as archive", {'path':target_db}) != 0:
+            yield -2, _('Error attaching target DB: %a'), self.db_error
+            self.unlock()
+            return -2
+
+        started = time.time()
+        try: err = yield from self._g_archive_transfer(entries_sql, timestamp, entry_count, with_rules)
+        finally:
+            try: self.curs.execute('detach database archive')
+            except (sqlite3.Error, sqlite3.OperationalError) as e: self.db_error = e
+            self.unlock()
+
+        if err != 0: return err
+        yield 0, _('Entries archived: %a'), f'{entry_count} ({round(entry_count/dezeroe(time.time() - started, 1))}/s)'
+
+        yield 0, _('Deleting temporary backup ...')
+        try: os.remove(db_backup)
+        except OSError as e:
+            self.db_status = f'{_("Error removing")} {db_backup}: {e}'
+            yield -1, f'{_("Error removing")} {db_backup}: %a', e
+            return -1 
+        yield 0, _('Temporary backup database removed successfully')
+
+        if not err:
+            yield 0, _('DB successfully archived to %a'), target_db
+            return 0
+
+
+
+    def _g_archive_transfer(self, entries_sql:str, timestamp:int, entry_count:int, with_rules:bool):
+        """ Copy archived data to attached archive DB and remove it from current one """
+        params = {'timestamp':timestamp}
+        entry_ids_sql = f'select e.id from main.entries e where {entries_sql}'
+
         if not with_rules:
 
             yield 0, _('Calculating archive weights for rules\' contexts...')
-            
-
-            err = self.run_sql_lock(f"""update rules
+            err = self._run_sql(f"""update rules
 set archive = ( select coalesce(e.weight,0) * coalesce(e.read,0) from entries e where context_id = e.id )
-where id in (
-SELECT rr.id from rules rr
-join entries ee on ee.id = rr.context_id
-where ee.pubdate <= :timestamp{add_sql1} and rr.learned = 1)""", {'timestamp':timestamp})
+where learned = 1 and context_id in ({entry_ids_sql})""", params)
             if err != 0: 
-                yield -2, _('DB Error: %a'), err
+                yield -2, _('DB Error: %a'), self.db_error
                 return -2
 
-
         else:
-
             yield 0, _('Transferring rules to archived DB ...')
-            rules = self.qr_sql(f"""SELECT rr.* from rules rr
-join entries ee on ee.id = rr.context_id
-where ee.pubdate <= :timestamp{add_sql1} and rr.learned = 1""", {'timestamp':timestamp}, all=True)
+            err = yield from self._g_archive_copy('rules', RULES_SQL_TABLE, f'learned = 1 and context_id in ({entry_ids_sql})', params)
+            if err != 0: return err
 
-            if len(rules) == 0: yield 0, _('No rules to archive ...')
-            else:
-                err = target_db_conn.run_sql_lock(self.rule.insert_sql(all=True), rules, many=True)
-                if err != 0: 
-                    yield -2, _('DB Error while transferring rules: %a'), err
-                    return -2
-            
-        
         yield 0, _('Transferring entries...')
-
-        for offset in range(0, entry_count, 500):
-            entries = self.qr_sql(f"""select * from entries where pubdate <= :timestamp{add_sql2} LIMIT 500 OFFSET :offset""", {'timestamp':timestamp, "offset":offset}, all=True)
-            yield 0, f'{_("Moving")} {offset}/{entry_count}'
-            err = target_db_conn.run_sql_lock(self.entry.insert_sql(all=True), entries, many=True)
-            if err != 0: 
-                yield -2, _('DB Error while transferring entries: %a'), err
-                return -2
+        err = yield from self._g_archive_copy('entries', ENTRIES_SQL_TABLE, f'id in ({entry_ids_sql})', params, total=entry_count)
+        if err != 0: return err
 
         yield 0, _('Transferring feed data ...')
-        feeds = self.qr_sql(GET_FEEDS_SQL, all=True)
-        err = target_db_conn.run_sql_lock(self.feed.insert_sql(all=True), feeds, many=True)
-        if err != 0: 
-            yield -2, _('DB Error while transferring feeds: %a'), err
-            return -2
+        err = yield from self._g_archive_copy('feeds', FEEDS_SQL_TABLE, '1 = 1', {})
+        if err != 0: return err
 
         yield 0, _('Transferring flags ...')
-        flags = self.qr_sql("""select * from flags""", all=True)
-        flag = FlagContainerBasic()
-        err = target_db_conn.run_sql_lock(flag.insert_sql(all=True), flags, many=True)
-        if err != 0: 
-            yield -2, _('DB Error while transferring flags: %a'), err
-            return -2
+        err = yield from self._g_archive_copy('flags', FLAGS_SQL_TABLE, '1 = 1', {})
+        if err != 0: return err
 
         yield 0, _('Transferring manual rules ...')
-        rules = self.qr_sql("""select * from rules where coalesce(learned,0) = 0""", all=True)
-        err = target_db_conn.run_sql_lock(self.rule.insert_sql(all=True), rules, many=True)
-        if err != 0: 
-            yield -2, _('DB Error while transferring manual rules: %a'), err
-            return -2
-
+        err = yield from self._g_archive_copy('rules', RULES_SQL_TABLE, 'coalesce(learned,0) = 0', {})
+        if err != 0: return err
 
         if with_rules:
             yield 0, _('Removing rules from current DB...')
-            err = self.run_sql_lock(f"""delete from rules where id in
-(SELECT rr.id from rules rr
-join entries ee on ee.id = rr.context_id
-where ee.pubdate <= :timestamp{add_sql1} and rr.learned = 1)""", {'timestamp':timestamp})
+            err = self._run_sql(f"""delete from rules where learned = 1 and context_id in ({entry_ids_sql})""", params)
             if err != 0: 
-                yield -2, _('DB Error: %a'), err
+                yield -2, _('DB Error: %a'), self.db_error
                 return -2
 
         yield 0, _('Removing old entries from current DB...')
-        err = self.run_sql_lock(f"""delete from entries where pubdate <= :timestamp{add_sql2}""", {'timestamp':timestamp})
+        err = self._run_sql(f"""delete from entries where id in ({entry_ids_sql})""", params)
         if err != 0:
-            yield -2, _('DB Error: %a'), err
+            yield -2, _('DB Error: %a'), self.db_error
             return -2
-        
-        yield 0, _('Deleting temporary backup ...')
-        try: os.remove(db_backup)
-        except OSError as e:
-            self.db_status = f'{_("Error removing")} {db_backup}: {e}'
-            yield -1, f'{_("Error removing")} {db_backup}: %a', e
-            return -1 
-        yield 0, _('Temporary backup database removed successfully')
 
-        if not err:
-            yield 0, _('DB successfully archived to %a'), target_db
-            return 0
+        return 0
+
+
+
+    def _g_archive_copy(self, table:str, fields:tuple, where:str, params:dict, **kargs):
+        """ Copy rows to attached archive DB by id ranges, every range in a separate transaction """
+        cols = ', '.join(f'"{f}"' for f in fields)
+        params = params.copy()
+        params['last_id'] = -1
+        params['limit'] = ARCHIVE_CHUNK
+        total = kargs.get('total')
+
+        copied = 0
+        started = time.time()
+        while True:
+            upper_id = self.qr_sql(f'select max(id) from (select id from main.{table} where id > :last_id and {where} order by id limit :limit)', params, one=True)
+            if self.db_error is not None:
+                yield -2, _('DB Error while transferring %a'), f'{table}: {self.db_error}'
+                return -2
+            upper_id = slist(upper_id, 0, None)
+            if upper_id is None: break
+
+            params['upper_id'] = upper_id
+            err = self._run_sql(f'insert into archive.{table} ({cols}) select {cols} from main.{table} where id > :last_id and id <= :upper_id and {where}', params)
+            if err != 0:
+                yield -2, _('DB Error while transferring %a'), f'{table}: {self.db_error}'
+                return -2
+
+            copied += self.rowcount
+            params['last_id'] = upper_id
+            if total is not None: 
+                yield 0, f'{_("Moving")} {copied}/{total} ({round(copied/dezeroe(time.time() - started, 1))}/s)'
+
+        return 0
 
 
 
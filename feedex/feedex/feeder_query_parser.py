@@ -114,6 +114,17 @@ class FeederQueryParser:
             elif qtype == 2: cond = "\n( e.tokens_raw LIKE :phrase ESCAPE '\\' )"
             elif qtype == 4: cond = "\n( e.tokens LIKE :phrase ESCAPE '\\'  )"
             elif qtype == 5: cond = "\n( e.tokens_raw LIKE :phrase ESCAPE '\\' )"
+
+            # Resolve candidates from term index first, so LIKE is only checked for entries containing all exact terms
+            if qtype in (1,2,4,5) and len(phrase.get('terms',())) > 0:
+                if qtype in (1,4): vals['raw'] = 0
+                else: vals['raw'] = 1
+                cands = ''
+                for i,t in enumerate(phrase['terms']):
+                    vals[f'term{i}'] = t
+                    if i > 0: cands = f'{cands} INTERSECT '
+                    cands = f'{cands}select t.entry_id from entry_terms t where t.term = :term{i} and t.raw = :raw'
+                cond = f"\n( e.id in ({cands}) ) and {cond}"
  
 
         else: #string is empty
@@ -398,25 +409,88 @@ class FeederQueryParser:
             print(f"\n\n'Query: \n{query}\n{vals}")
             print(f"Phrase: {self.phrase}")
   
-        results_tmp = self.FX.qr_sql(query, vals, all=True)
+        # No point ranking if no string was given
+        if self.phrase.get('empty',False): self._query_all(query, vals)
+        else: self._query_ranked(query, vals, qtype, filters, rank=rank, cnt=cnt, snippets=snippets, rev=rev, sort=sort, 
+                                    max_context_length=max_context_length, case_ins=case_ins, doc_count=kargs.get('doc_count'))
         if self.FX.db_error is not None: 
             self.results = ()
             return self.results
 
-        if self.debug in (1,5): print("Results: ", len(results_tmp))
+
+        # Group results, if needed
+        if kargs.get('print', self.print):
+            node_col = -1
+            node_title_col = None
+            node_header = ()
+            node_header_raw = ()
+
+        if kargs.get('allow_group',False):
+            if filters.get('group') is not None: 
+                self.results = self.group_results(self.results, filters.get('group'),filters.get('depth',self.config.get('default_depth',5)))
+                if kargs.get('print', self.print):
+                    node_col = len(RESULTS_SQL_TABLE_PRINT)
+                    node_title_col = self.result.get_index('title')
+                    node_header = ('Is Node?',)
+                    node_header_raw = ('is_node',)
+
+        depth = scast(filters.get('depth'), int,0)
+        if depth > 0 and filters.get('group') is None: 
+            self.results = self.results[:depth]
+
+        # Save phrase to history        
+        if not kargs.get('no_history',False): 
+            err = self.history_item.add(self.phrase, filters.get('feed'))
+            if err != 0: self.FX.MC.ret_status = cli_msg(err)
+
+
+        # Display results if needed
+        if kargs.get('print', self.print):
+            if self.output == 'short': columns = NOTES_PRINT
+            elif self.output == 'headlines': columns = HEADLINES_PRINT
+            else: columns = RESULTS_SHORT_PRINT1
+            self.cli_table_print(RESULTS_SQL_TABLE_PRINT + node_header, self.results, mask=columns, 
+                                flag_col=self.result.get_index('flag'), read_col=self.result.get_index('read'), del_col=self.result.get_index('deleted'), 
+                                date_col=self.result.get_index('pubdate_short'), node_col=node_col, node_title_col=node_title_col,
+                                html_cols=RESULTS_SQL_TABLE + node_header_raw)
+
+        return self.results
+
+
+
+
+
+
+
+
+    def _query_all(self, query:str, vals:dict):
+        """ Get all results without matching and ranking """
+        self.results = self.FX.qr_sql(query, vals, all=True)
+        if self.debug in (1,5) and self.FX.db_error is None: print("Results: ", len(self.results))
+
+
+
+    def _query_ranked(self, query:str, vals:dict, qtype:int, filters:dict, **kargs):
+        """ Match query results against phrase and rank them """
+        rank = kargs.get('rank', True)
+        cnt = kargs.get('cnt', False)
+        snippets = kargs.get('snippets', True)
+        rev = kargs.get('rev', False)
+        sort = kargs.get('sort')
+        max_context_length = kargs.get('max_context_length', 0)
+        case_ins = kargs.get('case_ins', False)
 
         self.results = []
 
         # Rank results (if needed)
         # For this we will use last returned column and then replace it with ranking - a little crude, but works
         # SQL has its limitations and I need something beyond boolean matching
+        # Results are streamed in batches and only matches are kept. IDF is known after all are counted, so TF is saved first
+
+        matched_docs_count = 0
+        for results_tmp in self.FX.qr_sql_iter(query, vals):
 
-        # No point doing this if no string was given or there was only one result
-        matched_docs_count = len(results_tmp)
-        if (not self.phrase.get('empty',False)) and matched_docs_count > 0:
-            if rank:
-                doc_count = kargs.get('doc_count', self.FX.get_doc_count())
-                idf = log10(doc_count/matched_docs_count)
+            matched_docs_count += len(results_tmp)
 
             # Calculate ranking for each result
             for r in results_tmp:
@@ -440,13 +514,10 @@ class FeederQueryParser:
                     self.result['snippets'] = self.snippets_lst.copy()
 
                 # Append TF-IDF rank or match count - depending on what option was chosen
-                if rank: # Construct TF-IDF
+                if rank: # Construct TF (multiplied by IDF later)
                     doc_len = scast(self.result["word_count"], int, 1)
                     if doc_len == 0: rnk = 0
-                    else:
-                        tf = matched/doc_len
-                        # Final ranking measure - modify at your fancy
-                        rnk = tf * idf
+                    else: rnk = matched/doc_len
                     # append...
                     self.result['rank'] = rnk
                     self.result['count'] = matched
@@ -457,53 +528,22 @@ class FeederQueryParser:
 
                 self.results.append(self.result.tuplify(all=True))
 
-            # Sort results by rank or count if no other sorting method was chosen
-            if sort is None:
-                if cnt: self.results.sort(key=lambda x: x[self.result.get_index('count')], reverse=rev)
-                elif rank: self.results.sort(key=lambda x: x[self.result.get_index('rank')], reverse=rev)
-        
-        
-        else:
-            self.results = results_tmp
-
-
-        # Group results, if needed
-        if kargs.get('print', self.print):
-            node_col = -1
-            node_title_col = None
-            node_header = ()
-            node_header_raw = ()
-
-        if kargs.get('allow_group',False):
-            if filters.get('group') is not None: 
-                self.results = self.group_results(self.results, filters.get('group'),filters.get('depth',self.config.get('default_depth',5)))
-                if kargs.get('print', self.print):
-                    node_col = len(RESULTS_SQL_TABLE_PRINT)
-                    node_title_col = self.result.get_index('title')
-                    node_header = ('Is Node?',)
-                    node_header_raw = ('is_node',)
-
-        depth = scast(filters.get('depth'), int,0)
-        if depth > 0 and filters.get('group') is None: 
-            self.results = self.results[:depth]
-
-        # Save phrase to history        
-        if not kargs.get('no_history',False): 
-            err = self.history_item.add(self.phrase, filters.get('feed'))
-            if err != 0: self.FX.MC.ret_status = cli_msg(err)
-
-
-        # Display results if needed
-        if kargs.get('print', self.print):
-            if self.output == 'short': columns = NOTES_PRINT
-            elif self.output == 'headlines': columns = HEADLINES_PRINT
-            else: columns = RESULTS_SHORT_PRINT1
-            self.cli_table_print(RESULTS_SQL_TABLE_PRINT + node_header, self.results, mask=columns, 
-                                flag_col=self.result.get_index('flag'), read_col=self.result.get_index('read'), del_col=self.result.get_index('deleted'), 
-                                date_col=self.result.get_index('pubdate_short'), node_col=node_col, node_title_col=node_title_col,
-                                html_cols=RESULTS_SQL_TABLE + node_header_raw)
-
-        return self.results
+        if self.FX.db_error is not None: return -2
+        if self.debug in (1,5): print("Results: ", matched_docs_count)
+
+        if rank and len(self.results) > 0:
+            # Final ranking measure - modify at your fancy
+            doc_count = kargs.get('doc_count')
+            if doc_count is None: doc_count = self.FX.get_doc_count()
+            idf = log10(doc_count/matched_docs_count)
+            rank_idx = self.result.get_index('rank')
+            self.results = [r[:rank_idx] + (r[rank_idx] * idf,) + r[rank_idx+1:] for r in self.results]
+
+        # Sort results by rank or count if no other sorting method was chosen
+        if sort is None:
+            if cnt: self.results.sort(key=lambda x: x[self.result.get_index('count')], reverse=rev)
+            elif rank: self.results.sort(key=lambda x: x[self.result.get_index('rank')], reverse=rev)
+        return 0
 
 
 
@@ -1444,6 +1484,38 @@ class FeederQueryParser:
 
 
 
+    def fetch_report(self, **kargs):
+        """ Show check schedule with estimated publication rates and predicted vs. actual number of new entries """
+        self.results = []
+        feed = FeedContainerBasic()
+        totals = {'checks':0, 'empty':0, 'predicted':0, 'actual':0, 'bytes_saved':0}
+
+        for f, item in self.FX.scheduler.report():
+            feed.populate(f)
+            if item['rate'] is None: rate = None
+            else: rate = round(item['rate'] * 24, 2)
+            self.results.append( (feed['id'], feed.name(), scast(feed['interval'], int, self.config.get('default_interval',45)), round(item['interval'] / 60),
+                                rate, item['checks'], item['empty'], round(item['predicted'], 1), item['actual'], item['bytes_saved'],
+                                datetime.fromtimestamp(item['due']).strftime('%Y.%m.%d %H:%M') ) )
+            for k in totals.keys(): totals[k] += item[k]
+
+        if kargs.get('print', self.print):
+            self.cli_table_print((n_('ID'), n_('Channel'), n_('Interval'), n_('Used interval'), n_('Entries per day'), n_('Checks'), n_('Empty checks'),
+                                    n_('Predicted'), n_('Actual'), n_('Bytes saved'), n_('Next check')), self.results, interline=False, output='csv',
+                                    html_cols=('id', 'name', 'interval', 'used_interval', 'rate', 'checks', 'empty_checks', 'predicted', 'actual', 'bytes_saved', 'due') )
+            if self.output not in ('json', 'html', 'csv'):
+                if totals['checks'] > 0: empty = round(totals['empty'] / totals['checks'] * 100)
+                else: empty = 0
+                print(f"""
+{_('Checks')}: {totals['checks']}, {_('without new entries')}: {totals['empty']} ({empty}%)
+{_('Predicted new entries')}: {round(totals['predicted'], 1)}, {_('actual')}: {totals['actual']}
+{_('Bytes saved by conditional requests')}: {totals['bytes_saved']}""")
+        else:
+            return self.results
+
+
+
+
     def test_regexes(self, feed_id, **kargs):
         """ Display test for HTML parsing REGEXes """
         handler = FeedexHTMLHandler(self.FX)
@@ -1458,6 +1530,7 @@ class FeederQueryParser:
 {_('Feed Image Link:')} <b>{feed_img}</b>
 {_('Feed Character Encoding:')} <b>{feed_charset}</b>
 {_('Feed Language Code:')} <b>{feed_lang}</b>
+{_('Parsing time:')} <b>{round(scast(handler.parse_time, float, 0) * 1000, 3)} ms</b>
 ------------------------------------------------------------------------------------------------------------------------------
 
 """
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent Feedex process serving CLI actions over a local Unix socket. Main data container is kept warm
+(feeds, flags, rules, compiled matchers, language models, doc count), so forwarded calls skip all loading.
+
+Protocol: one JSON object per line in each direction
+    request:    {"method": "action"|"ping"|"stop", "db_path": str, "action": str, "args": [arg1, arg2, arg3], "params": {...}}
+    response:   {"status": int, "stdout": str, "stderr": str}
+
+Status -100 means the request can not be served here (e.g. different database) and should be run locally
+
+With 'daemon_fetch' config option daemon also checks for news, waking up when the next channel is due according to fetch scheduler
+
+"""
+
+
+from feedex_headers import *
+import socket
+import signal
+import io
+from contextlib import redirect_stdout, redirect_stderr
+
+
+
+
+
+
+def daemon_request(socket_path:str, request:dict, **kargs):
+    """ Send request to a running daemon and return response. Returns None if daemon is not there or can not serve it """
+    if not os.path.exists(socket_path): return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+            sock.connect(socket_path)
+            sock.settimeout(kargs.get('timeout'))
+            sock.sendall(json.dumps(request, default=str).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f: resp = f.readline()
+    except (OSError, socket.timeout): return None
+
+    try: resp = json.loads(resp)
+    except (ValueError, TypeError): return None
+    if type(resp) is not dict or resp.get('status') == -100: return None
+    return resp
+
+
+
+
+
+class FeedexDaemon:
+    """ Serves CLI actions with warm main data container. Actions are run one at a time with output captured
+        and sent back to the client. Handler is a callable taking (Feeder, action, arg1, arg2, arg3, params) """
+
+    def __init__(self, top_parent, handler, **kargs):
+
+        if isinstance(top_parent, FeedexMainDataContainer): self.MC = top_parent
+        else: raise FeedexTypeError(_('Top_parent should be an instance of FeedexMainDataContainer class!'))
+
+        self.handler = handler
+        self.config = kargs.get('config', DEFAULT_CONFIG)
+        self.debug = kargs.get('debug')
+        self.socket_path = kargs.get('socket_path', FEEDEX_DAEMON_SOCKET)
+        self.db_path = os.path.realpath(scast(self.config.get('db_path'), str, ''))
+        self.fetch = kargs.get('fetch', self.config.get('daemon_fetch', False))
+        self.fetch_retry = 0
+
+        self.FX = None
+        self.sock = None
+        self.running = False
+        self.lock = threading.Lock() # Actions are executed one at a time
+        self.data_version = None
+
+
+
+    def _warm_up(self):
+        """ Connect and load everything needed by actions """
+        self.FX = Feeder(self.MC, config=self.config, debug=self.debug, main_thread=True, load_icons=True)
+        if self.FX.db_status != 0: return self.FX.db_status
+
+        for m in tuple(self.MC.models.keys()): self.FX.LP.set_model(m, detect=False)
+        self.FX.LP.compile_rules()
+        self.FX.get_doc_count()
+        self.FX.QP # Query parser is created on first use
+        self.data_version = self._data_version()
+        return 0
+
+
+    def _data_version(self):
+        """ Changes every time another connection commits to DB """
+        return slist(self.FX.qr_sql('PRAGMA data_version', one=True), 0, None)
+
+
+    def _refresh(self):
+        """ Reload data changed by other processes since last request """
+        version = self._data_version()
+        if version == self.data_version: return 0
+        self.data_version = version
+
+        if self.debug in (1,2): print('Database changed, refreshing data...')
+        err = self.FX.load_feeds()
+        if err == 0: err = self.FX.load_flags()
+        if err == 0 and self.FX._get_rules_db_version() != self.MC.rules_db_version: err = self.FX.load_rules()
+        self.MC.doc_count = None
+        return err
+
+
+
+    def _serve_action(self, request:dict):
+        """ Run action with captured output """
+        if os.path.realpath(scast(request.get('db_path'), str, '')) != self.db_path: return {'status': -100}
+
+        action = request.get('action')
+        if action not in DAEMON_ACTIONS: return {'status': -100}
+
+        args = list(request.get('args', ()))[:3]
+        while len(args) < 3: args.append(None)
+        params = request.get('params', {})
+        if type(params) is not dict: params = {}
+        params['config'] = self.config
+        params['daemon'] = True
+
+        out, err = io.StringIO(), io.StringIO()
+        with self.lock:
+            self.MC.ret_status = 0
+            with redirect_stdout(out), redirect_stderr(err):
+                try:
+                    if self._refresh() != 0: status = 2
+                    else:
+                        # Instance for this call takes display and other options from request. Loaded data is shared through main container
+                        feedex = Feeder(self.MC, **params)
+                        if feedex.db_status != 0: status = 2
+                        else:
+                            self.handler(feedex, action, *args, params)
+                            if feedex.db_error is not None: status = 2
+                            else: status = abs(scast(self.MC.ret_status, int, 0))
+                        feedex = None
+                except SystemExit as e: status = scast(e.code, int, 0)
+                except Exception as e:
+                    cli_msg( (-1, f'{_("Error executing action")}: %a', f'{type(e).__name__}: {e}') )
+                    status = 1
+
+            # Changes made here are already in main container
+            self.data_version = self._data_version()
+
+        return {'status': status, 'stdout': out.getvalue(), 'stderr': err.getvalue()}
+
+
+
+    def _fetch_due(self):
+        """ Check for news if any channel is due. Returns seconds until the next one """
+        with self.lock:
+            if self._refresh() != 0: return 1
+            due = self.FX.scheduler.next_due()
+            if due is not None and due <= time.time() and time.time() >= self.fetch_retry:
+                self.MC.ret_status = 0
+                try: self.FX.fetch(force=False, ignore_interval=False)
+                except Exception as e: cli_msg( (-1, f'{_("Error checking for news")}: %a', f'{type(e).__name__}: {e}') )
+                self.data_version = self._data_version()
+                due = self.FX.scheduler.next_due()
+                # Channels still due (e.g. someone else is fetching) are retried later
+                if due is not None and due <= time.time(): self.fetch_retry = time.time() + FETCH_RETRY
+
+        if due is None: return 1
+        return min(1, max(0.01, due - time.time(), self.fetch_retry - time.time()))
+
+
+
+    def _handle_conn(self, conn):
+        """ Read request, handle and send response """
+        try:
+            with conn:
+                with conn.makefile('rb') as f: req = f.readline()
+                try: req = json.loads(req)
+                except (ValueError, TypeError): req = None
+
+                if type(req) is not dict: resp = {'status': -1, 'stderr': _('Invalid request!')}
+                elif req.get('method') == 'ping': resp = {'status': 0, 'version': FEEDEX_VERSION, 'db_path': self.db_path}
+                elif req.get('method') == 'stop':
+                    resp = {'status': 0}
+                    self.running = False
+                elif req.get('method') == 'action': resp = self._serve_action(req)
+                else: resp = {'status': -1, 'stderr': _('Unknown method!')}
+
+                conn.sendall(json.dumps(resp, default=str).encode('utf-8') + b'\n')
+        except OSError as e:
+            if self.debug in (1,2): print(f'Daemon connection error: {e}')
+
+
+
+    def _stop(self, *args):
+        self.running = False
+
+
+
+    def run(self):
+        """ Warm up and serve requests until stopped """
+        if daemon_request(self.socket_path, {'method':'ping'}) is not None:
+            return cli_msg( (-1, _('Daemon already running at %a'), self.socket_path) )
+
+        err = self._warm_up()
+        if err != 0: return cli_msg( (-2, _('Could not connect to database!')) )
+
+        try:
+            if os.path.exists(self.socket_path): os.remove(self.socket_path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0o177) # Socket only for this user
+            try: self.sock.bind(self.socket_path)
+            finally: os.umask(umask)
+            self.sock.listen()
+            self.sock.settimeout(1)
+        except OSError as e:
+            return cli_msg( (-1, f'{_("Could not open socket")}: %a', e) )
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.running = True
+        cli_msg( (0, _('Feedex daemon listening at %a'), self.socket_path) )
+        try:
+            while self.running:
+                # Sleep on socket until a request comes or a channel is due
+                if self.fetch: self.sock.settimeout(self._fetch_due())
+                try: conn, _addr = self.sock.accept()
+                except socket.timeout: continue
+                except OSError as e:
+                    if self.running: cli_msg( (-1, f'{_("Socket error")}: %a', e) )
+                    continue
+                threading.Thread(target=self._handle_conn, args=(conn,), daemon=True).start()
+        finally:
+            self.sock.close()
+            if os.path.exists(self.socket_path): os.remove(self.socket_path)
+            with self.lock: self.FX.close()
+
+        cli_msg( (0, _('Feedex daemon stopped')) )
+        return 0
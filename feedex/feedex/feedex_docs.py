@@ -106,6 +106,18 @@ Usage: <b>feedex [parameters|filters] [actions] [arguments]</b>
     <b>Fetching:</b>
         -g, --get-news [ID]                     Get news without checking intervals, ETags or Modified tags (force download). Limit by feed ID
         -c, --check [ID]                        Check for news (applying intervals and no force download with etag/modified). Limit by feed ID
+                                                Only channels due for check are downloaded. Next check time is computed from 
+                                                channel's interval, backed off after errors and postponed until HTTP cache 
+                                                expires (see respect_cache_headers config option)
+                                                With adaptive_intervals config option (off by default), channel's own interval is
+                                                replaced by one adapted to how often channel publishes (bounded by
+                                                adaptive_interval_min and adaptive_interval_max)
+                                                Params:
+                                                    --workers=INT   Number of channels downloaded in parallel (1 - sequential)
+        --next-fetch                            Print seconds until next channel is due for check (0 if overdue), e.g.:
+                                                    while sleep $(feedex --next-fetch); do feedex -c; done
+        --fetch-report                          Show check schedule: intervals used, estimated publication rates and number
+                                                of new entries predicted vs. actually fetched by checks
         -o, --open-in-browser [ID|URL]          Open entry by ID or URL in browser. Register openning for later ranking and
                                                 learn rules.
 
@@ -325,8 +337,10 @@ Usage: <b>feedex [parameters|filters] [actions] [arguments]</b>
         --recalculate [ID]                      Recalculate linguistic stats and tokens for all/IDd entry
         --rerank [ID]                           Recalculate importance and flag stats for all/IDd entry
         --relearn [ID]                          (Re)learn features from all read entries/IDd entry
+                                                Params:
+                                                    --workers=INT   Number of processes for mass recalculation (1 - sequential)
 
-        --db-maintenance                        Perform maintenance on the database (VACUUM, ANALYZE and REINDEX)
+        --db-maintenance                        Perform maintenance on the database (VACUUM, ANALYZE, REINDEX and rule aggregate rebuild)
                                                 to reduce DB size
 
         --archive [TIMESTAMP] [TARGET_DB]       Archive entries older than [TIMESTAMP] to [TARGET_DB] file and remove them
@@ -346,6 +360,15 @@ Usage: <b>feedex [parameters|filters] [actions] [arguments]</b>
         --db-stats                              Database statistics
         --timeout=INT                           (param) Timeout to try connect on case database is locked
 
+    <b>Daemon:</b>
+        --daemon                                Run in background keeping rules, language models and connection loaded.
+                                                Queries, adding, fetching, opening and marking are then passed to it
+                                                through local socket, so they return much faster
+        --stop-daemon                           Stop running daemon
+                                                With daemon_fetch config option set daemon also checks for news whenever
+                                                a channel is due
+        --no-daemon                             (param) Do not pass action to daemon, execute it directly
+
 
     <b>Configuration parameters:</b>
 
@@ -354,12 +377,14 @@ Usage: <b>feedex [parameters|filters] [actions] [arguments]</b>
         --database=                             Specify different SQLite database
         --debug                                 Set verbose debug mode to 1 - more inforation on what is done
         --debug=INT                             Set debug mode (see below)
+        --startup-profile                       Print time breakdown of imports, initialization and action to stderr
 
     <b>Possible ENVIRONMENT variables to set:</b>
 
         FEEDEX_DB_PATH                          Path to SQLite database
         FEEDEX_LOG                              Path to log file
         FEEDEX_CONFIG                           Path to config file
+        FEEDEX_DAEMON_SOCKET                    Path to daemon socket
 
 
     <b>Return codes:</b>
@@ -446,6 +471,7 @@ FEEDEX_HELP_FEEDS=_("""
 
 Feeds (news Channels) are downloaded and parsed using handlers (rss, html) or populated by scripts (script, local - ignored during fetching).
 Unless used with -g option, Feedex will respect etags and 'modified' tags if provided by publisher. 
+This also applies to HTML channels, which are additionally not parsed again if page content did not change since last check.
 It will also check for news duplicates before saving. 
 HTTP return codes are analysed after download. If channel gave too many HTTP errors in consecutive tries, it will be
 ignored. To try again one needs to change error parameter using <b>--edit-feed [ID] error 0 </b>
@@ -482,6 +508,7 @@ Below are field descriptions:
     <b>lastchecked</b>                         Epoch-encoded date of last check on this feed
     
     <b>interval</b>                            how often shoul this feed be checked for news (-c option)? in minutes
+                                               Next check times are kept in <b>fetch_schedule</b> table
     <b>error</b>                               how many times download or parsing failed. Used to skip broken feeds after
                                                certain amount (error_threshold configuration option)
     <b>autoupdate</b>                          should Feedex automatically update feed data when -c or -g option is used?
@@ -716,8 +743,10 @@ FEEDEX_HELP_SCRIPTING=_("""
 
 If Feed's handler is specified as <b>script</b> a user-specified command from <b>script_file</b> field (<b>feeds</b> table) is ran on fetching.
 Its output, assumed to be a <b>JSON string</b> (see below), is then parsed and loaded for processing just like RSS. Errors should be handled within
-the script, as STDERR is not analysed. User should take special care for the script not to cause unacceptable lattency or infinite loop, as fetching
-process waits for output and blocks while waiting.
+the script, as STDERR is not analysed (it is shown only in debug mode). Scripts are ran in parallel with other Channels, but no more than 
+<b>script_workers</b> at once (config). Script running longer than <b>script_timeout</b> seconds or writing more than <b>script_max_output</b> MB
+is killed and Channel is marked as failed - entries read before that are still saved. Time spent waiting for earlier entries
+to be saved is not counted.
 
 Several parameters can be passed in the command and be replaced by variables:
 
@@ -764,6 +793,18 @@ Several parameters can be passed in the command and be replaced by variables:
 
 }
 
+<b>JSON lines:</b>
+
+Output can also be written as JSON lines. First line is a header object like above (<b>entries</b> list can be omitted) and every following line
+is a single entry object, e.g.:
+
+{"status": 200, "feed": {"title": "My Channel"}}
+{"title": "First entry", "link": "https://example.com/1"}
+{"title": "Second entry", "link": "https://example.com/2"}
+
+Entries are then processed one by one while script is still running, so large outputs do not need to be loaded at once.
+Script should flush its output after each line.
+
 """)
 
 
@@ -116,11 +116,13 @@ class EntryContainer(SQLContainerEditable):
             if err != 0: yield -2, _('DB error: %a'), err
             else: 
                 yield 0, _('Keywords learned')
-                if not self.FX.single_run: 
-                    err = self.FX.load_rules()
-                    if err != 0: 
-                        yield -2, _('Error reloading rules after successfull open: %a'), err
-                        return -2
+
+        # Read count changes weights of rules learned from this entry
+        if kargs.get('update_read',True) or read == 0:
+            err = self.FX.update_rules(self.vals['id'])
+            if err != 0: 
+                yield -2, _('Error reloading rules after successfull open: %a'), err
+                return -2
 
         return 0                        
 
@@ -268,8 +270,9 @@ class EntryContainer(SQLContainerEditable):
             for i,u in enumerate(self.to_update):
                 if u in self.immutable or u == 'id': del self.to_update[i]
 
-            if self.relearn and not self.FX.single_run: 
-                err = self.FX.load_rules()
+            # Rules learned from this entry are weighted by its read, weight and deleted fields
+            if self.relearn or restoring or set(self.to_update).intersection({'read','weight','deleted','feed_id'}) != set(): 
+                err = self.FX.update_rules(self.vals['id'])
                 if err != 0: 
                     yield -2, _('Error reloading rules after successfull update: %a'), err
                     return -2
@@ -374,9 +377,8 @@ class EntryContainer(SQLContainerEditable):
 
         if self.FX.rowcount > 0:
 
-            if not self.FX.single_run: 
-                err = self.FX.load_rules()
-                if err != 0: return -2, _('Error reloading rules after successfull delete: %a'), err
+            err = self.FX.update_rules(id)
+            if err != 0: return -2, _('Error reloading rules after successfull delete: %a'), err
             err = self.FX.update_stats()
             if err != 0: return -2, _('Error updating DB stats after successfull delete: %a'), err
 
@@ -453,9 +455,8 @@ class EntryContainer(SQLContainerEditable):
                 yield 0, _('Keywords learned for entry %a'), self.vals['id']
 
         if kargs.get('update_stats',True):
-            if not self.FX.single_run: 
-                err = self.FX.load_rules()
-                if err != 0: return -2, _('Error reloading rules after successfull add: %a'), err
+            err = self.FX.update_rules(self.vals['id'])
+            if err != 0: return -2, _('Error reloading rules after successfull add: %a'), err
 
             err = self.FX.update_stats()
             if err != 0: return -2, _('Error updating DB stats after successfull add: %a'), err
@@ -20,6 +20,8 @@ class SQLContainer:
     def __init__(self, table:str, fields:list, **kargs):
         self.vals = {}
         self.fields = fields
+        self.field_set = frozenset(fields) # Quick membership checks on assignment
+        self.nulls = dict.fromkeys(fields)
         self.table = table
         self.clear()
         self.length = len(fields)
@@ -31,7 +33,7 @@ class SQLContainer:
 
     def clear(self):
         """ Clear data """
-        for f in self.fields: self.vals[f] = None
+        self.vals.update(self.nulls)
 
     def populate(self, ilist:list, **kargs):
         """ Populate container with a list (e.g. query result where fields are ordered as in DB (select * ...) """
@@ -71,10 +73,10 @@ class SQLContainer:
     
 
     def __setitem__(self, key:str, value):
-        if key in self.fields: self.vals[key] = value
+        if key in self.field_set: self.vals[key] = value
 
     def __delitem__(self, key:str):
-        if key in self.fields: self.vals[key] = None
+        if key in self.field_set: self.vals[key] = None
 
 
     def pop(self, field:str):
@@ -469,7 +471,7 @@ class FeedContainer(FeedContainerBasic):
             if restoring:
                 err = self.FX.update_stats()
                 if err != 0: return -2, _('Error updating DB stats after successfull update: %a'), err
-                err = self.FX.load_rules()
+                err = self.FX.update_rules(full=True)
                 if err != 0: return -2, _('Error reloading rules after successfull update: %a'), err
 
             if self.vals['is_category'] == 1: stype = _('Category')
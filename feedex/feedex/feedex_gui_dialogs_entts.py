@@ -1045,6 +1045,7 @@ Parsing will be done match by match with each REGEX below""" ))
 {_('Feed Image Link')}: <b>{esc_mu(feed_img)}</b>
 {_('Feed Character Encoding')}: <b>{esc_mu(feed_charset)}</b>
 {_('Feed Language Code')}: <b>{esc_mu(feed_lang)}</b>
+{_('Parsing time')}: <b>{round(scast(self.handler.parse_time, float, 0) * 1000, 3)} ms</b>
 ------------------------------------------------------------------------------------------------------------------------------
 {_('Extracted entries')} ({len(entries)}):
 """
@@ -113,30 +113,18 @@ class FeedexResDownloader:
 
                 if not open:
                     
-                    i = 0
-                    img_data = BytesIO()
-                    while True:
-                        i += 1
-                        img_chunk = response.read(FEEDEX_MB)
-                        if not img_chunk: break
-                        if i >= MAX_DOWNLOAD_SIZE: return -1, _('Resource too large! Should be %a max'), MAX_DOWNLOAD_SIZE
-                        img_data.write(img_chunk)
-
-                    img = Image.open(img_data)
+                    img_data = read_response(response)
+                    if img_data is None: return -1, _('Resource too large! Should be %a max'), MAX_DOWNLOAD_SIZE
+
+                    img = Image.open(BytesIO(img_data))
                     img.thumbnail((150, 150))
                     img.save(resource['filename'], format="PNG")
                     
                 else:
-                    i = 0
-                    with open(resource['filename'], 'wb') as f:
-                        while True:
-                            i += 1
-                            chunk = response.read(FEEDEX_MB)
-                            if not chunk: break
-                            if i >= MAX_DOWNLOAD_SIZE:
-                                f.close()
-                                return -1, _('Resource too large! Should be %a max'), MAX_DOWNLOAD_SIZE
-                            f.write(chunk)
+                    with open(resource['filename'], 'wb') as f: size = read_response(response, out=f)
+                    if size is None:
+                        os.remove(resource['filename'])
+                        return -1, _('Resource too large! Should be %a max'), MAX_DOWNLOAD_SIZE
                 
                     err = ext_open(self.config, 'image_viewer', resource['filename'], title=resource['title'], alt=resource['alt'], file=True, debug=self.debug)
                     if err != 0: return -1, err
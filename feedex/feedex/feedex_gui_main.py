@@ -31,6 +31,7 @@ class FeedexMainWin(Gtk.Window):
         self.sec_frac_counter = 0
         self.sec_counter = 0
         self.minute_counter = 0
+        self.fetch_retry = 0
 
         self.today = 0
         self._time()
@@ -666,13 +667,17 @@ It will also take some time to perform""") ))
             self.sec_frac_counter = 0
             self.sec_counter += 1
 
-        # Fetch news if specified in config
+            # Fetch news when next channel is due, if specified in config
+            if self.config.get('gui_fetch_periodically', False) and not self.flag_fetch and time.time() >= self.fetch_retry:
+                due = self.FX.scheduler.next_due()
+                if due is not None and due <= time.time():
+                    self.fetch_retry = time.time() + FETCH_RETRY
+                    self.on_load_news_background()
+
         if self.sec_counter > 60:
             self.sec_counter = 0
             self.minute_counter += 1
             self._time()
-            if self.config.get('gui_fetch_periodically', False):
-                self.on_load_news_background()
 
         # Show queued messages from threads
         if len(self.message_q) > 0:
@@ -873,29 +873,18 @@ def download_res(url:str, filename:str, **kargs):
             content_size = scast(response.info().get('Content-Length'), int, None)
             if content_size is not None and content_size > MAX_DOWNLOAD_SIZE: return 1, None
 
-            i = 0
             if not no_thumbnail:
-                img_data = BytesIO()
-                while True:
-                    i += 1
-                    img_chunk = response.read(FEEDEX_MB)
-                    if not img_chunk: break
-                    if i >= MAX_DOWNLOAD_SIZE: return -1, _('Resource too large! Schould be %a max'), MAX_DOWNLOAD_SIZE
-                    img_data.write(img_chunk)
+                img_data = read_response(response)
+                if img_data is None: return -1, _('Resource too large! Schould be %a max'), MAX_DOWNLOAD_SIZE
                 
-                img = Image.open(img_data)
+                img = Image.open(BytesIO(img_data))
                 img.thumbnail((150, 150))
                 img.save(filename, format="PNG")
             else:
-                with open(filename, 'wb') as f:
-                    while True:
-                        i += 1
-                        chunk = response.read(FEEDEX_MB)
-                        if not chunk: break
-                        if i >= MAX_DOWNLOAD_SIZE:
-                            f.close()
-                            return -1, _('Resource too large! Schould be %a max'), MAX_DOWNLOAD_SIZE
-                        f.write(chunk)
+                with open(filename, 'wb') as f: size = read_response(response, out=f)
+                if size is None:
+                    os.remove(filename)
+                    return -1, _('Resource too large! Schould be %a max'), MAX_DOWNLOAD_SIZE
             return 0
         else:
             return -1, f'{_("Could not download image at %a! HTTP return status:")} {response.status}', f'{url}'
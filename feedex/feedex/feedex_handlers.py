@@ -2,6 +2,8 @@
 """ RSS handler for Feedex """
 
 from feedex_headers import *
+from calendar import timegm
+import signal
 
 
 
@@ -10,6 +12,66 @@ from feedex_headers import *
 
 
 
+class FeedexParsedView:
+    """ Read-only view of feedparser's result (or plain dict from other handlers) with plain dict lookups. 
+        FeedParserDict maps keys and raises and catches KeyError for every missing field, so only aliases used by handlers are resolved here.
+        Nothing is copied - view is pointed at next entry by setting data """
+
+    __slots__ = ('data',)
+
+    aliases = {'guid':('id','guid'), 'description':('summary','subtitle','description')}
+
+    def __init__(self, data=None): self.data = data
+
+
+    def get(self, key, default=None):
+        data = self.data
+        keys = self.aliases.get(key)
+        if keys is None: return dict.get(data, key, default)
+        for k in keys:
+            if dict.__contains__(data, k): return dict.__getitem__(data, k)
+        return default
+
+    def sub(self, key, subkey, default=None):
+        """ Field of nested dict (e.g. author_detail) """
+        d = dict.get(self.data, key)
+        if not isinstance(d, dict): return default
+        return dict.get(d, subkey, default)
+
+    def items(self, key):
+        """ List of nested dicts (empty if not a list) """
+        lst = dict.get(self.data, key)
+        if type(lst) not in (list, tuple): return ()
+        return lst
+
+    def category(self):
+        """ Category or first tag """
+        if dict.__contains__(self.data, 'category'): return dict.__getitem__(self.data, 'category')
+        tags = self.items('tags')
+        if len(tags) > 0: return dict.get(tags[0], 'term')
+        return None
+
+    def enclosures(self):
+        """ Enclosure links """
+        if dict.__contains__(self.data, 'enclosures'): return self.items('enclosures')
+        return [l for l in self.items('links') if dict.get(l, 'rel') == 'enclosure']
+
+    def updated(self):
+        """ Update date string (published date if missing) and timestamp if date was already parsed by feedparser (UTC time tuple) """
+        data = self.data
+        for k in ('updated', 'published'):
+            if dict.__contains__(data, k):
+                parsed = dict.get(data, f'{k}_parsed')
+                if parsed is not None:
+                    try: return dict.__getitem__(data, k), timegm(parsed)
+                    except (TypeError, ValueError, OverflowError): pass
+                return dict.__getitem__(data, k), None
+        return None, None
+
+
+
+
+
 
 class FeedexRSSHandler:  
     """RSS handler for Feedex"""
@@ -17,6 +79,7 @@ class FeedexRSSHandler:
     compare_links = True
     no_updates = False
     all_is_html = False
+    streams_entries = False # Are entries yielded while still being downloaded?
     prepend_homepage = False # if link starts with / this flag will prepend homepage to it 
 
     def __init__(self, FX, **kargs):
@@ -44,6 +107,14 @@ class FeedexRSSHandler:
         self.status = None
         self.modified = None
         self.etag = None
+        self.headers = {} # Response headers (lowercase names) for scheduling next check
+
+        # Content cache: hash and size of last downloaded body (given to fetch) and of the current one
+        self.cache_hash = None
+        self.cache_length = None
+        self.content_hash = None
+        self.content_length = None
+        self.bytes_saved = 0
         self.agent = self.config.get('user_agent', FEEDEX_USER_AGENT)
 
         self.images = []
@@ -118,6 +189,7 @@ class FeedexRSSHandler:
         if force:
             if 'etag' in self.http_headers.keys(): del self.http_headers['etag']
             if 'modified' in self.http_headers.keys(): del self.http_headers['modified']
+            self.cache_hash = None
 
         # Download and parse...
         try:
@@ -131,11 +203,15 @@ class FeedexRSSHandler:
 
         # HTTP Status handling...       
         self.status = feed_raw.get('status')
+        self.headers = feed_raw.get('headers', {})
         self.changed = True
 
         if self.status is None: return _('Could not read HTTP status')
-        if self.status == 304:
+        if self.status == 304 or feed_raw.get('unchanged', False):
+            # Validators are kept for next check
             self.changed = False
+            self.etag = coalesce(feed_raw.get('etag'), self.http_headers.get('etag'))
+            self.modified = coalesce(feed_raw.get('modified'), self.http_headers.get('modified'))
             return 0
 
         elif self.status in (301, 302) and not self.redirected:
@@ -179,29 +255,37 @@ class FeedexRSSHandler:
     def fetch(self, feed, **kargs):
         """ Consolidate and return downloaded RSS """
         force = kargs.get('force',False)
-        pguids = list(kargs.get('pguids',()))
-        plinks = list(kargs.get('plinks',()))
+        pguids = set(kargs.get('pguids',()))
+        plinks = set(kargs.get('plinks',()))
         last_read = kargs.get('last_read',0)
 
         self.error = False
         self.status = None
         self.modified = None
         self.etag = None
+        self.headers = {}
         self.redirected = False
 
+        self.cache_hash = kargs.get('content_hash')
+        self.cache_length = kargs.get('content_length')
+        self.content_hash = None
+        self.content_length = None
+        self.bytes_saved = 0
+
         self.entries = []
         
         msg = self.download(force=force)
         if msg != 0: yield -3, msg
 
         if self.error: return -1
-        if self.feed_raw == {}: return -1
         if not self.changed:
-            yield 0, _('Feed unchanged (304)')
+            if self.status == 304: yield 0, _('Feed unchanged (304)')
+            else: yield 0, _('Feed unchanged (same content)')
             return 0
+        if self.feed_raw == {}: return -1
 
-        pub_date_raw = self.feed_raw['feed'].get('updated')
-        pub_date = scast(convert_timestamp(pub_date_raw), int, 0)
+        pub_date_raw, pub_date = FeedexParsedView(self.feed_raw['feed']).updated()
+        if pub_date is None: pub_date = scast(convert_timestamp(pub_date_raw, feed=feed['id']), int, 0)
 
         if pub_date <= last_read and pub_date_raw not in (None,''):
             yield 0, _('Feed unchanged (Published Date)')
@@ -212,24 +296,31 @@ class FeedexRSSHandler:
         if nullif(feed['rx_link'],'') is not None and feed['handler'] != 'html': rx_links = re.compile(scast(feed['rx_link'], str,''), re.DOTALL)
         else: rx_links = None
 
+        feed_lang = FeedexParsedView(self.feed_raw.get('feed',{})).get('language')
+        charset = self.feed_raw.get('encoding')
+        entry = FeedexParsedView()
+        now = datetime.now()
+        now_raw = int(now.timestamp())
+
         # Main loop
-        for entry in self.feed_raw.get('entries',()):
+        for raw_entry in self.feed_raw.get('entries',()):
+            entry.data = raw_entry
 
-            now = datetime.now()
-            now_raw = int(now.timestamp())
-            
-            pub_date_entry_str = entry.get('updated')
+            # Dates parsed by feedparser are used if possible
+            pub_date_entry_str, pub_date_entry = entry.updated()
             if pub_date_entry_str is None: 
                 pub_date_entry_str = now
                 pub_date_entry = now_raw
-            else:
-                pub_date_entry = convert_timestamp(pub_date_entry_str)
+            elif pub_date_entry is None:
+                pub_date_entry = convert_timestamp(pub_date_entry_str, feed=feed['id'])
 
             # Go on if nothing change
             if pub_date_entry <= last_read: continue
             # Check for duplicates in saved entries by complaring to previously compiled lists
-            if (entry.get('guid'),) in pguids and entry.get('guid') not in ('',None): continue
-            if (entry.get('link'),) in plinks and entry.get('link') not in ('',None): continue
+            guid = entry.get('guid')
+            link = entry.get('link')
+            if guid in pguids and guid not in ('',None): continue
+            if link in plinks and link not in ('',None): continue
 
             self.entry.clear()
 
@@ -238,38 +329,37 @@ class FeedexRSSHandler:
             self.entry['title']                   = slist(strip_markup(entry.get('title'), html=True), 0, None)
             
             authors = entry.get('author','')
-            if authors == '' and type(entry.get('authors',())) in (list, tuple):
-                for a in entry.get('authors',()): 
-                   if a.get('name','') != '': authors = f"""{authors}{a.get('name','')}; """
+            if authors == '':
+                for a in entry.items('authors'): 
+                   if dict.get(a, 'name','') != '': authors = f"""{authors}{dict.get(a, 'name','')}; """
 
             self.entry['author']                  = nullif(authors,'')
-            self.entry['author_contact']          = nullif( f"""{entry.get('author_detail',{}).get('email','')}; {entry.get('author_detail',{}).get('href','')}""", '; ')
+            self.entry['author_contact']          = nullif( f"""{entry.sub('author_detail','email','')}; {entry.sub('author_detail','href','')}""", '; ')
             
             contribs = ''
-            if type(entry.get('contributors',())) in (list, tuple):
-                for c in entry.get('contributors',()): 
-                    if c.get('name','') != '': contribs = f"""{contribs}{c.get('name','')}; """
+            for c in entry.items('contributors'): 
+                if dict.get(c, 'name','') != '': contribs = f"""{contribs}{dict.get(c, 'name','')}; """
 
             self.entry['contributors']            = nullif(contribs,'')
             self.entry['publisher']               = entry.get('publisher')
-            self.entry['publisher_contact']       = nullif( f"""{entry.get('publisher_detail',{}).get('email','')}; {entry.get('publisher_detail',{}).get('href','')}""", '; ')
-            self.entry['category']                = entry.get('category')
-            self.entry['lang']                    = entry.get('lang',entry.get('language',self.feed_raw.get('feed',{}).get('language')))
-            self.entry['charset']                 = self.feed_raw.get('encoding')
+            self.entry['publisher_contact']       = nullif( f"""{entry.sub('publisher_detail','email','')}; {entry.sub('publisher_detail','href','')}""", '; ')
+            self.entry['category']                = entry.category()
+            self.entry['lang']                    = entry.get('lang',entry.get('language',feed_lang))
+            self.entry['charset']                 = charset
             self.entry['comments']                = entry.get('comments')
-            self.entry['guid']                    = entry.get('guid')
+            self.entry['guid']                    = guid
             self.entry['pubdate']                 = pub_date_entry
             self.entry['pubdate_str']             = pub_date_entry_str
-            self.entry['source']                  = entry.get('source',{}).get('href')        
+            self.entry['source']                  = entry.sub('source','href')
             if self.prepend_homepage:
-                link = scast(entry.get('link'), str, '')
+                link = scast(link, str, '')
                 if link.startswith('/'):
                     homepage = scast(feed['link'], str, '')
                     if homepage.endswith('/'): homepage = homepage[:-1]
                     self.entry['link'] = f'{homepage}{link}'
                 else: self.entry['link']          = entry.get('link')
 
-            else: self.entry['link']              = entry.get('link')
+            else: self.entry['link']              = link
             self.entry['adddate']                 = now_raw
             self.entry['adddate_str']             = now
             self.entry['note']                    = 0
@@ -290,7 +380,7 @@ class FeedexRSSHandler:
             content = entry.get('content')
             if content is not None:
                 for c in content:
-                    txt, im, ls = strip_markup(c.get('value'), html=True, rx_images=rx_images, rx_links=rx_links)
+                    txt, im, ls = strip_markup(dict.get(c, 'value'), html=True, rx_images=rx_images, rx_links=rx_links)
                     if txt not in (None, ''):
                         text = f"""\n\n{txt.replace(self.entry['desc'],'')}"""
                         for i in im:
@@ -304,22 +394,21 @@ class FeedexRSSHandler:
 
             # Add enclosures
             enclosures = ''
-            enc = entry.get('enclosures',())
-            for e in enc: enclosures = f"""{enclosures}{e.get('href','')}\n"""
+            for e in entry.enclosures(): enclosures = f"""{enclosures}{dict.get(e, 'href','')}\n"""
             self.entry['enclosures'] = nullif(enclosures,'')
 
             # Tag line needs to be combined
             tags = ''
-            for t in entry.get('tags', ()): tags = f"""{tags}  {scast(t.get('label',t.get('term','')), str, '')}"""
+            for t in entry.items('tags'): tags = f"""{tags}  {scast(dict.get(t, 'label', dict.get(t, 'term','')), str, '')}"""
             self.entry['tags'] = nullif(tags,('',' '))
 
             # Compile string with present links
             link_string = ''
-            for l in entry.get('links',()): link_string = f"""{link_string}{l.get('href','')}\n"""
+            for l in entry.items('links'): link_string = f"""{link_string}{dict.get(l, 'href','')}\n"""
             self.entry['links'] = nullif(f"""{link_string}{links}""",'')
 
-            pguids.append(self.entry['guid'])
-            plinks.append(self.entry['link'])
+            pguids.add(self.entry['guid'])
+            plinks.add(self.entry['link'])
             yield self.entry
 
 
@@ -340,18 +429,10 @@ class FeedexRSSHandler:
                     if response.status in (200, 201, 202, 203, 204, 205, 206):
                         
                         if response.info().get('Content-Type') not in FEEDEX_IMAGE_MIMES: return f"""{_('Not a valid image type')} ({response.info().get('Content-Type')})"""
-                        content_size = scast(response.info().get('Content-Length'), int, None)
-                        if content_size is not None and content_size > MAX_DOWNLOAD_SIZE: return f"""{_('Resource size too big')} ({content_size}). {_('Should be')} {MAX_DOWNLOAD_SIZE} {_('max')}"""
-                        with open(imfile, 'wb') as f:
-                            i = 0
-                            while True:
-                                i += 1
-                                chunk = response.read(FEEDEX_MB)
-                                if not chunk: break
-                                if i >= MAX_DOWNLOAD_SIZE:
-                                    f.close()
-                                    return f'{_("Image resource too large! Should be")} {MAX_DOWNLOAD_SIZE} {_("max")}' 
-                                f.write(chunk)
+                        with open(imfile, 'wb') as f: size = read_response(response, out=f)
+                        if size is None:
+                            os.remove(imfile)
+                            return f'{_("Image resource too large! Should be")} {MAX_DOWNLOAD_SIZE} {_("max")}' 
                     else: 
                         self.images = []
                         return f'{_("URLLib could not save image from")} {href}! {_("HTTP return status")}: {response.status}'    
@@ -450,6 +531,36 @@ class FeedexRSSHandler:
 
 
 
+FEEDEX_HTML_PLANS = {} # Channel ID -> compiled parsing plan
+
+class FeedexHTMLPlan:
+    """ Compiled parsing REGEXes of HTML channel. Every field takes the first match, the same way as findall()[0] would:
+        whole match, the only group or tuple of groups. Fields without REGEX give an empty string """
+
+    def __init__(self, key:tuple):
+        self.key = key # REGEX strings in FEEDS_REGEX_HTML_PARSERS order
+        self.rx = {}
+        self.error = None
+        for r, restr in zip(FEEDS_REGEX_HTML_PARSERS, key):
+            if restr == '': self.rx[r] = None
+            else: 
+                try: self.rx[r] = re.compile(restr, re.DOTALL)
+                except re.error as e:
+                    self.error = f'{r} {_("REGEX")} {e}'
+                    return
+
+    def first(self, field:str, text:str):
+        rx = self.rx[field]
+        if rx is None: return ''
+        m = rx.search(text)
+        if m is None: return None
+        if rx.groups == 0: return m.group(0)
+        if rx.groups == 1: return m.groups('')[0]
+        return m.groups('')
+
+
+
+
 class FeedexHTMLHandler(FeedexRSSHandler):  
     """HTML handler for Feedex"""
 
@@ -460,79 +571,95 @@ class FeedexHTMLHandler(FeedexRSSHandler):
 
     def __init__(self, FX, **kargs):
         FeedexRSSHandler.__init__(self, FX, **kargs)
+        self.parse_time = None # Time of last parsing (s)
+
+
+    def _plan(self, ifeed):
+        """ Get compiled parsing plan for channel - cached until its REGEXes change """
+        key = tuple(scast(ifeed.get(r), str, '') for r in FEEDS_REGEX_HTML_PARSERS)
+        plan = FEEDEX_HTML_PLANS.get(ifeed.get('id'))
+        if plan is None or plan.key != key:
+            plan = FeedexHTMLPlan(key)
+            if plan.error is None: FEEDEX_HTML_PLANS[ifeed.get('id')] = plan
+        return plan
+
 
 
     def _parse_html(self, html, **kargs):
-        """ Parse html string with REGEXes """
+        """ Parse html string (or undecoded bytes-like page) with REGEXes """
+        started = time.perf_counter()
         ifeed = kargs.get('ifeed',self.ifeed)
-        regexes = {}
-        for r in FEEDS_REGEX_HTML_PARSERS: 
-            restr = scast(ifeed.get(r), str, '')
-            if restr == '': regexes[r] = ''
-            else: 
-                try: regexes[r] = re.compile( scast(ifeed.get(r), str, ''), re.DOTALL)
-                except re.error as e: 
-                    self.error = True
-                    self.error_str = f'{r} {_("REGEX")} {e}'
-                    return f'{self.error_str}', _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), ()
-
-        feed_title = re.findall(regexes['rx_title_feed'], html)
-        feed_title = slist(feed_title, 0, None)
-        feed_pubdate = re.findall(regexes['rx_pubdate_feed'], html)
-        feed_pubdate = slist(feed_pubdate, 0, None)
-        feed_img = re.findall(regexes['rx_image_feed'], html)
-        feed_img = slist(feed_img, 0, None)
-        feed_charset = re.findall(regexes['rx_charset_feed'], html)
-        feed_charset = slist(feed_charset, 0, None)
-        feed_lang = re.findall(regexes['rx_lang_feed'], html)
-        feed_lang = slist(feed_lang, 0, None)
+        if not isinstance(html, str): html = decode_html(html)[0]
+
+        plan = self._plan(ifeed)
+        if plan.error is not None:
+            self.error = True
+            self.error_str = plan.error
+            return f'{self.error_str}', _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), _('<ERROR>'), ()
+
+        feed_title = plan.first('rx_title_feed', html)
+        feed_pubdate = plan.first('rx_pubdate_feed', html)
+        feed_img = plan.first('rx_image_feed', html)
+        feed_charset = plan.first('rx_charset_feed', html)
+        feed_lang = plan.first('rx_lang_feed', html)
         
-        if regexes['rx_entries'] == '': return feed_title, feed_pubdate, feed_img, feed_charset, feed_lang, '', () 
-        entries_str = re.findall(regexes['rx_entries'], html)
+        if plan.rx['rx_entries'] is None: 
+            self.parse_time = time.perf_counter() - started
+            return feed_title, feed_pubdate, feed_img, feed_charset, feed_lang, '', () 
+        entries_str = plan.rx['rx_entries'].findall(html)
         entries = []
         entry_sample = ''
-        if type(entries_str) in (tuple,list) and len(entries_str) > 0:
-            if entry_sample == '': entry_sample = entries_str[0]
-            links = [] # List to avoid duplicates
+        if len(entries_str) > 0:
+            entry_sample = entries_str[0]
+            links = set() # To avoid duplicates
             for e in entries_str:
                 if type(e) is not str: continue
                 entry = {}
                 
-                title = re.findall(regexes['rx_title'], e)
-                entry['title'] = slist(title, 0, None)
+                entry['title'] = plan.first('rx_title', e)
                 if entry['title'] in (None, ''): continue
 
-                link = slist(re.findall(regexes['rx_link'], e), 0, None)
+                link = plan.first('rx_link', e)
                 if link in links: continue
-                links.append(link)
+                if type(link) is not str: continue
+                links.add(link)
                 entry['link'] = link
+                entry['guid'] = hashlib.sha1(link.encode()).hexdigest()
 
-                if type(entry.get('link')) is str:
-                    guid = hashlib.sha1(entry.get('link').encode())
-                    entry['guid'] = guid.hexdigest()
-                else: continue
+                if plan.rx['rx_desc'] is not None: entry['description'] = plan.first('rx_desc', e)
+                if plan.rx['rx_author'] is not None: entry['author'] = plan.first('rx_author', e)
+                if plan.rx['rx_category'] is not None: entry['category'] = plan.first('rx_category', e)
+                if plan.rx['rx_text'] is not None: entry['content'] = [{'value':plan.first('rx_text', e)}]
+                if plan.rx['rx_images'] is not None: entry['images'] = plan.first('rx_images', e)
+                if plan.rx['rx_pubdate'] is not None: entry['updated'] = plan.first('rx_pubdate', e)
 
-                if regexes['rx_desc'] != '': entry['description'] = slist( re.findall(regexes['rx_desc'], e), 0, None)
-                if regexes['rx_author'] != '': entry['author'] = slist( re.findall(regexes['rx_author'], e), 0, None)
-                if regexes['rx_category'] != '': entry['category'] = slist( re.findall(regexes['rx_category'], e), 0, None)
-                if regexes['rx_text'] != '': entry['content'] = [{'value':slist( re.findall(regexes['rx_text'], e), 0, None)}]
-                if regexes['rx_images'] != '': entry['images'] = slist( re.findall(regexes['rx_images'], e), 0, None)
-                if regexes['rx_pubdate'] != '': entry['updated'] = slist( re.findall(regexes['rx_pubdate'], e), 0, None)
-
-                if entry.get('title') is not None and entry.get('link') is not None: entries.append(entry.copy())
+                entries.append(entry)
 
+        self.parse_time = time.perf_counter() - started
         return feed_title, feed_pubdate, feed_img, feed_charset, feed_lang, entry_sample, entries
 
 
 
 
     def _do_download(self, url: str, **kargs):
-        """ Download HTML resource """
-        self.http_headers['User-Agent'] = self.agent
-        del self.http_headers['agent']
+        """ Download HTML resource. Conditional GET is used if ETag or Last-Modified is known, so unchanged pages are not sent again.
+            If page is sent, but its content (and parsing REGEXes) did not change since last time, it is not parsed again """
+        download_only = kargs.get('download_only',False)
+
+        headers = {'User-Agent': self.agent}
+        if not download_only:
+            if self.http_headers.get('etag') is not None: headers['If-None-Match'] = self.http_headers['etag']
+            if self.http_headers.get('modified') is not None: headers['If-Modified-Since'] = self.http_headers['modified']
+
         try:
-            req = urllib.request.Request(url, None, self.http_headers)
-            response = urllib.request.urlopen(req)
+            req = urllib.request.Request(url, None, headers)
+            opener = urllib.request.build_opener(*self.http_headers.get('handlers', []))
+            response = opener.open(req)
+        except urllib.error.HTTPError as e:
+            # Error statuses (and 304) are handled by caller
+            feed_raw = {'status':e.code, 'headers':{k.lower(): v for k, v in e.headers.items()}}
+            if e.code == 304: self.bytes_saved = scast(self.cache_length, int, 0)
+            return feed_raw
         except Exception as e:
             self.error = True
             self.error_str = f'URLLib: {e}'
@@ -543,50 +670,50 @@ class FeedexHTMLHandler(FeedexRSSHandler):
             self.error = True
             self.error_str = f"""{_('Invalind content type')} ({response.info().get('Content-Type')})  ({_('Should be text/plain or text/html')})"""
             return {}
-        content_size = scast(response.info().get('Content-Length'), int, None)
-        if content_size is not None and content_size > MAX_DOWNLOAD_SIZE: 
-            self.error = True
-            self.error_str = f"""{_('Resource too big')} ({content_size})  ({_('Should be')} {MAX_DOWNLOAD_SIZE} {_('max')})"""
-            return {}
-        
-        html = ''
-        i = 0
-        try:
-            while True:
-                chunk = response.read(FEEDEX_MB)
-                i += 1
-                if not chunk: break
-                if i >= MAX_DOWNLOAD_SIZE: 
-                    self.error = True
-                    self.error_str = _("""Resource too big!""")
-                    return {}
-                html = f'{html}{chunk.decode("utf-8")}'
+        try: data = read_response(response)
         except Exception as e:
             self.error = True
             self.error_str = f'{_("URLLib")}: {e}'
             return {}
-        
-        html = scast(html, str, None)
-        if html is None:
+        if data is None:
+            self.error = True
+            self.error_str = f"""{_('Resource too big')} ({_('Should be')} {MAX_DOWNLOAD_SIZE} {_('max')})"""
+            return {}
+
+        # Raw bytes are hashed and sniffed through a view, page is decoded only once
+        data = memoryview(data)
+        try: html, page_charset = decode_html(data, content_type=response.info().get('Content-Type'))
+        except (LookupError, ValueError, TypeError):
             self.error = True
             self.error_str = _("""Downloaded resource could not be converted to text""")
             return {}
 
         feed_raw = {}
         feed_raw['status'] = response.status
-        feed_raw['etag'] = response.headers.get('etag')
-        feed_raw['modified'] = response.headers.get('modified')
+        feed_raw['headers'] = {k.lower(): v for k, v in response.headers.items()}
+        feed_raw['etag'] = response.headers.get('ETag')
+        feed_raw['modified'] = response.headers.get('Last-Modified')
         feed_raw['raw_html'] = html
 
-        if kargs.get('download_only',False): return feed_raw
+        if download_only: return feed_raw
+
+        # Page content is hashed along with REGEXes, so changed parsing rules are applied to unchanged page
+        sha = hashlib.sha1(data)
+        for r in FEEDS_REGEX_HTML_PARSERS: sha.update(scast(self.ifeed.get(r), str, '').encode('utf-8'))
+        self.content_hash = sha.hexdigest()
+        self.content_length = len(data)
+        if self.cache_hash is not None and self.content_hash == self.cache_hash:
+            feed_raw['unchanged'] = True
+            return feed_raw
 
         title, pubdate, image, charset, lang, entry_sample, entries = self._parse_html(html)
+        if self.debug in (1,3): print(f'Page parsed in {round(scast(self.parse_time, float, 0) * 1000, 3)} ms ({len(entries)} entries)')
         feed_raw['feed'] = {}
         feed_raw['feed']['title'] = title
         feed_raw['feed']['updated'] = pubdate
         feed_raw['feed']['icon'] = image
         feed_raw['feed']['lang'] = lang
-        feed_raw['encoding'] = charset
+        feed_raw['encoding'] = coalesce(charset, page_charset)
 
         if entries != []: feed_raw['entries'] = entries
         return feed_raw
@@ -614,56 +741,212 @@ class FeedexHTMLHandler(FeedexRSSHandler):
 
 
 
-class FeedexScriptHandler:  
-    """User fetching script handler for Feedex"""
+class FeedexScriptHandler(FeedexRSSHandler):
+    """User fetching script handler for Feedex. Script is ran as a subprocess limited by time and output size.
+       Output is either a single JSON document or JSON lines (header followed by one entry per line). 
+       The latter are decoded from the pipe one by one while script is still running"""
 
     compare_links = True
     no_updates = True
+    streams_entries = True
 
     def __init__(self, FX, **kargs):
         FeedexRSSHandler.__init__(self, FX, **kargs)
+        self.proc = None
+        self.timer = None
+        self.time_left = 0
+        self.clock = 0
+        self.timed_out = False
+        self.read_bytes = 0
+        self.max_output = 0
+        self.stream_error = None
+        self.streaming = False
 
 
-    def _do_download(self, dummy, **kargs):
-        """ Execute script and load JSON return value to load as raw feed"""
+
+    def _command(self):
+        """ Split script command and substitute params """
         command = self.ifeed.get('script_file')
-        if command is None: 
-            self.error = True
-            self.error_str = _('No script file provided!')
-            return {}
+        if command in (None,''): return None
 
-        # Substitute command line params ...
         rstr = random_str(string=command)
         command = command.split()
-        
+        params = {'%A':self.http_headers.get('agent'), '%E':self.http_headers.get('etag'), '%M':self.http_headers.get('modified'),
+                  '%L':self.http_headers.get('login'), '%P':self.http_headers.get('password'), '%D':self.http_headers.get('domain'),
+                  '%U':self.ifeed.get('url'), '%F':self.ifeed.get('id')}
+
         for i, arg, in enumerate(command):
             arg = arg.replace('%%',rstr)
-            arg = arg.replace('%A', self.http_headers.get('agent'))
-            arg = arg.replace('%E', self.http_headers.get('etag'))
-            arg = arg.replace('%M', self.http_headers.get('modified'))
-            arg = arg.replace('%L', self.http_headers.get('login'))
-            arg = arg.replace('%P', self.http_headers.get('password'))
-            arg = arg.replace('%D', self.http_headers.get('domain'))
-            arg = arg.replace('%U', self.ifeed.get('url'))
-            arg = arg.replace('%F', self.ifeed.get('id'))
-            arg = arg.replace(rstr, '%')
-            command[i] = arg
+            for k, v in params.items(): arg = arg.replace(k, scast(v, str, ''))
+            command[i] = arg.replace(rstr, '%')
+        return command
+
+
+
+    def _kill(self, proc, **kargs):
+        """ Kill script with all processes it started (timer kills it with timeout=True) """
+        if kargs.get('timeout',False): self.timed_out = True
+        try: os.killpg(proc.pid, signal.SIGKILL)
+        except OSError: pass
+
+
+    def _limit(self, seconds):
+        """ Start clock for script's time limit """
+        self.time_left = seconds
+        self.clock = time.monotonic()
+        self.timer = threading.Timer(seconds, self._kill, args=(self.proc,), kwargs={'timeout':True})
+        self.timer.daemon = True
+        self.timer.start()
+
+
+    def hold(self):
+        """ Stop the clock, e.g. while entries already read wait to be saved """
+        if self.timer is None: return 0
+        self.timer.cancel()
+        self.timer = None
+        self.time_left -= time.monotonic() - self.clock
+        return 0
+
+
+    def resume(self):
+        """ Restart the clock stopped by hold """
+        if self.timer is not None or self.proc is None or self.timed_out: return 0
+        self._limit(max(self.time_left, 0))
+        return 0
+
+
+
+    def _stop(self):
+        """ Cancel time limit and make sure script is not running anymore """
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.proc is None: return 0
+        proc = self.proc
+        self.proc = None
+        # Processes started by script can outlive it and keep the pipe open, so whole group is killed
+        self._kill(proc)
+        try:
+            proc.stdout.close()
+            proc.wait()
+        except OSError: pass
+        return 0
+
+
+
+    def _fail(self, msg:str):
+        """ Stop script and set error """
+        self._stop()
+        self.error = True
+        self.error_str = msg
+        return {}
+
+
+    def _limit_error(self):
+        """ Error for script stopped by a limit """
+        if self.timed_out: return f"""{_('Script timed out')} ({self.config.get('script_timeout',60)}s)"""
+        return f"""{_('Script output too big')} ({_('Should be')} {self.max_output} {_('max')})"""
+
+
+    def _readline(self):
+        """ Read a line of script's output within size limit. Returns None if a limit was exceeded """
+        line = self.proc.stdout.readline(self.max_output - self.read_bytes + 1)
+        self.read_bytes += len(line)
+        if self.read_bytes > self.max_output or self.timed_out: return None
+        return line
+
+
+
+    def _entries(self, entries):
+        """ Yield entries given in header and then decode following JSON lines from script's output as they come """
+        for e in entries:
+            if isinstance(e, dict): yield e
+
+        while self.proc is not None:
+            line = self._readline()
+            if line is None:
+                self.stream_error = self._limit_error()
+                break
+            if line == b'': break
+            line = line.strip()
+            if line == b'': continue
+            try: entry = json.loads(line)
+            except ValueError as e:
+                self.stream_error = f'{_("Error decoding JSON")}: {e}'
+                break
+            if isinstance(entry, dict): yield entry
+
+        if self.stream_error is not None: self._fail(self.stream_error)
+        else: self._stop()
+
+
+
+    def _do_download(self, dummy, **kargs):
+        """ Execute script and read header (or whole JSON document) from its output. Remaining entries are read while processing """
+        self._stop()
+        self.stream_error = None
+        self.timed_out = False
+        self.read_bytes = 0
+        self.max_output = scast(self.config.get('script_max_output',50), int, 50) * FEEDEX_MB
+
+        command = self._command()
+        if command is None: return self._fail(_('No script file provided!'))
 
         if self.debug in (1,3): print(f"""Runing script: {' '.join(command)}""")
 
         try:
-            comm_pipe = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            json_str = comm_pipe.stdout.read()
-        except OSError as e:
-            self.error = True
-            self.error_str = f'{_("Error executing script")}: {e}'
-            return {}
+            # STDERR is not analysed, but shown when debugging
+            # Script runs in its own process group, so it can be killed along with its children
+            if self.debug in (1,3): self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, start_new_session=True)
+            else: self.proc = subprocess.Popen(command, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        except (OSError, ValueError) as e: return self._fail(f'{_("Error executing script")}: {e}')
+
+        self._limit(scast(self.config.get('script_timeout',60), int, 60))
+
+        json_str = self._readline()
+        if json_str is None: return self._fail(self._limit_error())
+
+        # First line is a header for JSON lines, otherwise the whole output is a single JSON document
+        try: feed_raw = json.loads(json_str)
+        except ValueError:
+            rest = self.proc.stdout.read(self.max_output - self.read_bytes + 1)
+            self.read_bytes += len(rest)
+            if self.read_bytes > self.max_output or self.timed_out: return self._fail(self._limit_error())
+            json_str = json_str + rest
+            self._stop()
+            try: feed_raw = json.loads(json_str)
+            except ValueError as e: return self._fail(f'{_("Error decoding JSON")}: {e}')
 
         if self.debug in (1,3): print(f'Output: {json_str}')
 
+        if not isinstance(feed_raw, dict): return self._fail(_('Script output should be a JSON object!'))
+
+        # Entries can be given at top level or inside feed data
+        entries = feed_raw.get('entries')
+        if entries is None and isinstance(feed_raw.get('feed'), dict): entries = feed_raw['feed'].get('entries')
+        if not isinstance(entries, list): entries = ()
+        feed_raw['entries'] = self._entries(entries)
+        return feed_raw
+
+
+
+    def download(self, **kargs):
+        """ Entries are read from script's output during fetching. Otherwise they are all loaded here and script is stopped """
+        msg = FeedexRSSHandler.download(self, **kargs)
+        if self.streaming: return msg
+        if self.feed_raw.get('entries') is not None: self.feed_raw['entries'] = list(self.feed_raw['entries'])
+        self._stop()
+        if msg == 0 and self.stream_error is not None: return self.stream_error
+        return msg
+
+
+    def fetch(self, feed, **kargs):
+        """ Process entries while they are decoded from script's output """
+        self.streaming = True
         try:
-            return json.loads(json_str)
-        except (OSError, JSONDecodeError) as e:
-            self.error = True
-            self.error_str = f'{_("Error decoding JSON")}: {e}'
-            return {}
\ No newline at end of file
+            for item in FeedexRSSHandler.fetch(self, feed, **kargs): yield item
+            if self.stream_error is not None: yield -3, self.stream_error
+        finally:
+            self.streaming = False
+            self._stop()
+
@@ -11,24 +11,87 @@ import os
 from datetime import datetime, timedelta, date
 import re
 from math import log10
-import subprocess
 import time
 import pickle
-from shutil import copyfile
 from random import randint
 import json
 import threading
+import importlib
+from collections import deque
+from bisect import bisect_left
+import hashlib
+import sqlite3
+
+
+
+class FeedexLazyModule:
+    """ Module imported on first attribute access. Heavy dependencies and rarely used modules are
+        declared this way, so simple CLI actions do not pay for them. Submodules are imported together with package """
+
+    def __init__(self, name:str, *submodules):
+        self.__dict__['_name'] = name
+        self.__dict__['_submodules'] = submodules
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        t = time.perf_counter()
+        module = importlib.import_module(self._name)
+        for s in self._submodules: importlib.import_module(f'{self._name}.{s}')
+        FEEDEX_LOAD_TIMES[self._name] = time.perf_counter() - t
+        self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr:str):
+        module = self._module
+        if module is None: module = self._load()
+        return getattr(module, attr)
+
+
+
+class FeedexLazyObject:
+    """ Class or function from a module imported on first call or attribute access """
+
+    def __init__(self, module:str, name:str):
+        self.__dict__['_module'] = module
+        self.__dict__['_name'] = name
+        self.__dict__['_obj'] = None
+
+    def _load(self):
+        t = time.perf_counter()
+        obj = getattr(importlib.import_module(self._module), self._name)
+        if self._module not in FEEDEX_LOAD_TIMES: FEEDEX_LOAD_TIMES[self._module] = time.perf_counter() - t
+        self.__dict__['_obj'] = obj
+        return obj
+
+    def __call__(self, *args, **kargs):
+        obj = self._obj
+        if obj is None: obj = self._load()
+        return obj(*args, **kargs)
+
+    def __getattr__(self, attr:str):
+        obj = self._obj
+        if obj is None: obj = self._load()
+        return getattr(obj, attr)
+
+
 
+FEEDEX_LOAD_TIMES = {} # Module -> time it took to import lazily (for startup profiling)
+
+
+# Loaded on first use
+subprocess = FeedexLazyModule('subprocess')
+copyfile = FeedexLazyObject('shutil', 'copyfile')
+ThreadPoolExecutor = FeedexLazyObject('concurrent.futures', 'ThreadPoolExecutor')
+ProcessPoolExecutor = FeedexLazyObject('concurrent.futures', 'ProcessPoolExecutor')
+Queue = FeedexLazyObject('queue', 'Queue')
 
 # Downloaded
-import feedparser
-import urllib.request
-import hashlib
-import sqlite3
-from dateutil.relativedelta import relativedelta
-import dateutil.parser
-import snowballstemmer
-import pyphen
+feedparser = FeedexLazyModule('feedparser')
+urllib = FeedexLazyModule('urllib', 'request', 'error', 'parse')
+dateutil = FeedexLazyModule('dateutil', 'parser')
+relativedelta = FeedexLazyObject('dateutil.relativedelta', 'relativedelta')
+snowballstemmer = FeedexLazyModule('snowballstemmer')
+pyphen = FeedexLazyModule('pyphen')
 
 import gettext
 
@@ -36,7 +99,7 @@ import gettext
 
 
 # Constants
-FEEDEX_VERSION = "1.0.0"
+FEEDEX_VERSION = "1.1.0"
 FEEDEX_RELEASE="2022"
 FEEDEX_AUTHOR ="""Karol Pałac"""
 FEEDEX_CONTACT="""palac.karol@gmail.com"""
@@ -56,6 +119,7 @@ if PLATFORM == 'linux':
 
     FEEDEX_ICON_PATH = os.environ['HOME'] + '/.local/share/feedex/icons'
     FEEDEX_CACHE_PATH = os.environ['HOME'] + '/.local/share/feedex/cache'
+    FEEDEX_DAEMON_SOCKET = os.environ['HOME'] + '/.local/share/feedex/feedex.sock'
 
     FEEDEX_DEFAULT_BROWSER = 'xdg-open %u'
 
@@ -104,6 +168,10 @@ FEEDEX_TEXT_MIMES = ('text/html','text/plain',)
 #Downloads...
 FEEDEX_MB = 1024 * 1024
 MAX_DOWNLOAD_SIZE = 50 * FEEDEX_MB
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+CHARSET_SNIFF_SIZE = 4096 # Page head searched for <meta> charset declaration
+HTTP_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([A-Za-z0-9_:.\-]+)', re.IGNORECASE)
+HTML_META_CHARSET_RE = re.compile(rb'<meta[^>]+?charset\s*=\s*["\']?\s*([A-Za-z0-9_:.\-]+)', re.IGNORECASE)
 
 # Checks
 FLOAT_VALIDATE_RE = re.compile(r'[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?')
@@ -134,7 +202,8 @@ where coalesce(e.deleted,0) = 0
 
 
 
-GET_RULES_SQL="""
+# Rules are aggregated by triggers into rules_agg table (see db_scripts/1.1.0/5.sql) - this is a full rebuild for maintenance
+RULES_AGG_SQL="""
 SELECT
 null as n, r.name, r.type, r.feed_id, r.field_id, r.string, r.case_insensitive, r.lang,
 sum(r.weight * coalesce( coalesce(e.read, 
@@ -168,8 +237,22 @@ having sum(r.weight * coalesce( coalesce(e.read,
 		else 1
 	end
 	), r.archive) ) <> 0
-order by r.type asc, abs(main_weight) desc
 """
+REBUILD_RULES_AGG_SQL = f"""insert into rules_agg (n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id) {RULES_AGG_SQL}"""
+
+RULES_SELECT_SQL="""
+select n, name, type, feed_id, field_id, string, case_insensitive, lang, weight, additive, learned, flag, context_id
+from rules_agg
+"""
+RULES_ORDER_SQL = """order by type asc, abs(weight) desc
+"""
+GET_RULES_SQL = f"""{RULES_SELECT_SQL}{RULES_ORDER_SQL}"""
+
+# Rules for a single context (entry) or manual ones - for updating rule cache
+GET_RULES_CONTEXT_SQL = f"""{RULES_SELECT_SQL}where context_id = :context_id
+{RULES_ORDER_SQL}"""
+GET_RULES_MANUAL_SQL = f"""{RULES_SELECT_SQL}where context_id = 0
+{RULES_ORDER_SQL}"""
 
 
 GET_RULES_NL_SQL="""
@@ -316,6 +399,16 @@ RULES_TECH_LIST = ('learned','context_id','archive','path')
 
 LING_LIST = ('feed_id','lang','author','publisher','contributors','title','desc','tags','category','text')
 LING_TEXT_LIST = ('title','desc','tags','category','text', 'author', 'publisher', 'contributors')
+LING_TECH_LIST = ('tokens','tokens_raw','sent_count','word_count','char_count','polysyl_count','com_word_count','numerals_count','caps_count','readability','weight')
+# Model word lists used only for membership tests (converted to sets on model load)
+LING_LEXICON_KEYS = ('stops','commons','commons_stemmed','sent_end','sent_beg','quot','quot_end','quot_beg','emph_end','emph_beg','punctation')
+EMPTY_LEXICON = {'items':(), 'words':{}, 'ends':{}, 'begs':{}, 'contains':(), 'phrases':{}}
+
+# Compiled lexicon files (see feedex_lexicons)
+LEXICON_FILE_MAGIC = b'FXLX'
+LEXICON_FILE_VERSION = 1
+LEXICON_FILE_EXT = 'fxlex'
+LEXICON_CACHE_SIZE = 4096 # Decoded phrase groups kept in memory per lexicon
 ENTRIES_TECH_LIST = ('tokens','tokens_raw','sent_count','word_count','char_count','polysyl_count','com_word_count','numerals_count','caps_count','readability','weight','importance','adddate','adddate_str')
 
 
@@ -385,6 +478,47 @@ LOCAL_DB_TIMEOUT = 180
 
 MAX_LAST_UPDATES = 25
 
+ARCHIVE_CHUNK = 10000 # Rows copied to archive DB in a single transaction
+
+# SQLite connection setup (WAL lets readers work alongside a writer)
+DB_BUSY_TIMEOUT = 5000 # ms
+DB_POOL_SIZE = 8 # Max idle connections kept per database
+DB_PRAGMAS = (
+'PRAGMA journal_mode=WAL',
+'PRAGMA synchronous=NORMAL',
+f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT}',
+'PRAGMA mmap_size=268435456',
+'PRAGMA cache_size=-16000',
+'PRAGMA case_sensitive_like=true',
+)
+
+# Fetch scheduling
+FETCH_BACKOFF_MAX = 16 # Max multiplier of check interval for failing channels
+FETCH_CACHE_MAX = 86400 # s - max time server's cache headers can postpone a check
+FETCH_RETRY = 60 # s - wait before trying again if due channels could not be fetched
+ADAPTIVE_TARGET_ITEMS = 1 # New entries expected per check with adaptive intervals
+ADAPTIVE_SMOOTHING = 0.3 # Weight of the latest check in publication rate estimate
+ADAPTIVE_HISTORY = 2592000 # s - entry history used for initial publication rate estimate (30 days)
+FETCH_STREAM_SIZE = 1000 # Items waiting between a streaming fetch worker (scripts) and DB writer
+FETCH_STREAM_WAIT = 0.05 # s - how often a worker waiting for writer checks if fetching was stopped
+
+# Date parsing - common feed formats are parsed directly, dateutil is used only for others
+DATE_CACHE_SIZE = 4096 # Recently parsed date strings kept
+RFC822_DATE_RE = re.compile(r'^\s*(?:[A-Za-z]{3},?\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*(UTC?|GMT|Z|[ECMP][SD]T|[+-]\d{4})?\s*$')
+RFC822_MONTHS = {'jan':1, 'feb':2, 'mar':3, 'apr':4, 'may':5, 'jun':6, 'jul':7, 'aug':8, 'sep':9, 'oct':10, 'nov':11, 'dec':12}
+RFC822_ZONES = {'UT':0, 'UTC':0, 'GMT':0, 'Z':0, 'EST':-5, 'EDT':-4, 'CST':-6, 'CDT':-5, 'MST':-7, 'MDT':-6, 'PST':-8, 'PDT':-7} # Other zone names are left to dateutil
+ISO8601_DATE_RE = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?\s*(Z|[+-]\d{2}:?\d{2})?\s*$')
+
+# Daemon mode - CLI actions that can be forwarded to running daemon (no interactive input or local files)
+DAEMON_CONNECT_TIMEOUT = 1 # s
+DAEMON_ACTIONS = (
+'get_news', 'check', 'next_fetch', 'fetch_report', 'open',
+'query_entries', 'read_feed', 'read_category', 'read_entry', 'find_similar', 'list_feeds', 'list_categories', 'list_flags', 'list_rules',
+'term_net', 'term_in_time', 'rel_in_time', 'term_context', 'terms_for_entry', 'rules_for_entry',
+'add_entry', 'add_url', 'add_keyword', 'add_regex', 'add_full_text', 'add_full_text_exact',
+'mark', 'mark_unimportant', 'flag',
+)
+
 
 #Prefix, sql field name, Field name, 
 PREFIXES={
@@ -450,6 +584,13 @@ DEFAULT_CONFIG = {
             'default_interval': 45,
             'error_threshold': 5,
             'max_items_per_transaction': 300,
+            'fetch_workers': 4,
+            'fetch_host_connections': 2,
+            'script_workers': 2,
+            'script_timeout': 60,
+            'script_max_output': 50,
+            'dedup_window': 1000,
+            'recalc_workers': 0,
             'ignore_images' : False,
             'ignore_media' : False,
             'rule_limit' : 50000,
@@ -466,6 +607,11 @@ DEFAULT_CONFIG = {
             'save_perm_redirects': False,
             'mark_deleted' : False,
             'ignore_modified': True,
+            'respect_cache_headers': True,
+            'adaptive_intervals': False,
+            'adaptive_interval_min': 15,
+            'adaptive_interval_max': 1440,
+            'daemon_fetch': False,
             
             'gui_desktop_notify' : True, 
             'gui_fetch_periodically' : False,
@@ -510,6 +656,13 @@ CONFIG_NAMES = {
             'default_interval': _('Default Channel check interval'),
             'error_threshold': _('Channel error threshold'),
             'max_items_per_transaction': _('Max items for a single transaction'),
+            'fetch_workers': _('Channels downloaded in parallel'),
+            'fetch_host_connections': _('Max parallel connections to a single host'),
+            'script_workers': _('Fetching scripts ran in parallel'),
+            'script_timeout': _('Fetching script time limit (seconds)'),
+            'script_max_output': _('Fetching script output limit (MB)'),
+            'dedup_window': _('Recent items per Channel checked for duplicates in memory'),
+            'recalc_workers': _('Processes used for mass recalculation (0 - all CPUs)'),
             'ignore_images' : _('Ignore image processing'),
             'ignore_media' : _('Ignore handling media'),
             'rule_limit' : _('Limit for rules'),
@@ -528,6 +681,11 @@ CONFIG_NAMES = {
             'do_redirects' : _('Do HTTP redirects'),
 
             'ignore_modified': _('Ignore MODIFIED and ETag tags'),
+            'respect_cache_headers': _('Do not check Channels before their HTTP cache expires'),
+            'adaptive_intervals': _('Adapt check intervals to how often Channels publish'),
+            'adaptive_interval_min': _('Min. adaptive check interval (minutes)'),
+            'adaptive_interval_max': _('Max. adaptive check interval (minutes)'),
+            'daemon_fetch': _('Daemon checks for news when Channels are due'),
             
             'gui_desktop_notify' : _('Push desktop notifications for new items'), 
             'gui_fetch_periodically' : _('Fetch news periodically'),
@@ -561,8 +719,9 @@ CONFIG_NAMES = {
 }
 
 
-CONFIG_INTS_NZ=('timeout','notify_level','default_interval','error_threshold','max_items_per_transaction', 'default_similarity_limit')
-CONFIG_INTS_Z=('rule_limit','gui_clear_cache','default_depth','gui_layout','gui_orientation','gui_notify_depth')
+CONFIG_INTS_NZ=('timeout','notify_level','default_interval','error_threshold','max_items_per_transaction', 'default_similarity_limit', 'fetch_workers', 'fetch_host_connections',
+'script_workers', 'script_timeout', 'script_max_output', 'adaptive_interval_min', 'adaptive_interval_max')
+CONFIG_INTS_Z=('rule_limit','dedup_window','recalc_workers','gui_clear_cache','default_depth','gui_layout','gui_orientation','gui_notify_depth')
 
 CONFIG_FLOATS=('default_entry_weight', 'default_rule_weight', 'query_rule_weight' )
 
@@ -571,7 +730,7 @@ CONFIG_STRINGS=('log','db_path','browser','lang','user_agent', 'gui_notify_group
 CONFIG_KEYS=('gui_key_search','gui_key_new_entry', 'gui_key_new_rule')
 
 CONFIG_BOOLS=('notify','ignore_images', 'ignore_media', 'use_keyword_learning', 'learn_from_added_entries','do_redirects','ignore_modified','gui_desktop_notify',
-'gui_fetch_periodically', 'use_search_habits', 'save_perm_redirects', 'mark_deleted', 'no_history')
+'gui_fetch_periodically', 'use_search_habits', 'save_perm_redirects', 'mark_deleted', 'no_history', 'respect_cache_headers', 'daemon_fetch', 'adaptive_intervals')
 
 CONFIG_COLS=('normal_color','flag_color','read_color','bold_color')
 
@@ -860,6 +1019,13 @@ HTML_ENTITIES_REV = (
 ("&",'&amp;'),
 )
 
+# Lookup tables for strip_markup: entities and markup are translated in one scan each (first entity definition wins)
+HTML_ENTITIES_DICT = {k: e[2] for e in reversed(HTML_ENTITIES) for k in e[:2]}
+HTML_ENTITIES_RE = re.compile(r'&#?[A-Za-z0-9]+;')
+HTML_MARKUP_DICT = {'\n\r':' ', '\n':' ', '\r':' ', '</p>':'\n\n', '<br>':'\n', '<br />':'\n', '<br/>':'\n',
+                    '<em>':'»', '</em>':'«', '<b>':'»', '</b>':'«', '<i>':'»', '</i>':'«', '<u>':'»', '</u>':'«'}
+HTML_MARKUP_RE = re.compile(r'\n\r?|\r|<[^>]*>')
+
 
 
 
@@ -876,19 +1042,30 @@ class FeedexMainDataContainer:
 
         # Language models
         self.__dict__['models'] = {}
-        self.__dict__['multi_dict'] = {}
+        self.__dict__['multi_lexicons'] = None # Loaded on first use
         self.__dict__['loaded_models'] = []
 
         
         # DB stuff
         self.__dict__['feeds'] = []
         self.__dict__['rules'] = []
+        self.__dict__['rules_version'] = 0 # Incremented on every change to rules
+        self.__dict__['rules_db_version'] = None # Rule version in DB when cache was last synced
+        self.__dict__['rules_limit'] = 0 # Limit used for loading rules (0 - no limit)
+
+        # Compiled rule matcher (rebuilt on rule version change)
+        self.__dict__['rule_index'] = {4:{}, 5:{}}
+        self.__dict__['manual_rules'] = []
+        self.__dict__['rule_index_version'] = -1
+        self.__dict__['rule_index_next'] = 0
+
         self.__dict__['search_history'] = []
         self.__dict__['flags'] = {}
 
         self.__dict__['doc_count'] = None
         self.__dict__['avg_weight'] = None
         self.__dict__['fetches'] = None
+        self.__dict__['scheduler'] = None # Fetch scheduler (built on first use)
 
         # Hash for DB path for ID
         self.__dict__['db_hash'] = None
@@ -896,11 +1073,12 @@ class FeedexMainDataContainer:
         # GUI stuff
         self.__dict__['icons'] = {}
 
-        # Local DB lock
-        self.__dict__['db_lock'] = False
+        # Local DB lock manager
+        self.__dict__['db_locks'] = FeedexLockManager()
 
-        # Connection counter
+        # Connection counter and pool
         self.__dict__['conns'] = 0
+        self.__dict__['db_pool'] = FeedexConnectionPool()
 
         # Main return status
         self.__dict__['ret_status'] = 0
@@ -918,13 +1096,28 @@ class FeedexMainDataContainer:
 
 
 
+# Our modules loaded on first use (declared before others, so they get them with star import)
+FeedexLexiconFile = FeedexLazyObject('feedex_lexicons', 'FeedexLexiconFile')
+FeedexLexiconWriter = FeedexLazyObject('feedex_lexicons', 'FeedexLexiconWriter')
+compile_lexicon = FeedexLazyObject('feedex_lexicons', 'compile_lexicon')
+load_lexicon_file = FeedexLazyObject('feedex_lexicons', 'load_lexicon_file')
+file_hash = FeedexLazyObject('feedex_lexicons', 'file_hash')
+LingProcessor = FeedexLazyObject('feedex_ling_processor', 'LingProcessor')
+FeedexRSSHandler = FeedexLazyObject('feedex_handlers', 'FeedexRSSHandler')
+FeedexHTMLHandler = FeedexLazyObject('feedex_handlers', 'FeedexHTMLHandler')
+FeedexScriptHandler = FeedexLazyObject('feedex_handlers', 'FeedexScriptHandler')
+FeederQueryParser = FeedexLazyObject('feeder_query_parser', 'FeederQueryParser')
+FeedexFetchScheduler = FeedexLazyObject('feedex_scheduler', 'FeedexFetchScheduler')
+FeedexOrderedSlots = FeedexLazyObject('feedex_scheduler', 'FeedexOrderedSlots')
+http_cache_until = FeedexLazyObject('feedex_scheduler', 'http_cache_until')
+feedex_docs = FeedexLazyModule('feedex_docs')
+
+# Handler classes by name
+FEEDEX_HANDLERS = {'rss': FeedexRSSHandler, 'html': FeedexHTMLHandler, 'script': FeedexScriptHandler}
+
 # Our modules
 from feedex_utils import *
 from feedex_feed import SQLContainer, SQLContainerEditable, FeedContainerBasic, FeedContainer
-from feedex_ling_processor import LingProcessor
 from feedex_entry import EntryContainer, ResultContainer
 from feedex_rule import RuleContainerBasic, RuleContainer, FlagContainerBasic, FlagContainer, HistoryItem
-from feedex_handlers import FeedexRSSHandler, FeedexHTMLHandler, FeedexScriptHandler
-from feeder_query_parser import FeederQueryParser
-from feeder import Feeder
-from feedex_docs import *
+from feeder import Feeder, FeedexConnectionPool, FeedexLockManager
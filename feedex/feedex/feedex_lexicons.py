@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled lexicon files for Feedex language models
+
+Dictionaries from model pickles are compiled into a versioned binary file with a string table and hash tables.
+Files are memory-mapped, so nothing is deserialized on load and pages are shared between processes.
+
+File layout (native byte order, recorded in index):
+    magic (4B) | version (uint32) | index length (uint32) | JSON index | padding to 8B | data
+
+Index holds offsets (relative to data start) of every table:
+    strings         - uint32 offsets (count + 1) followed by UTF-8 blob
+    items           - (tag string id, length) pairs - int32
+    words, ends, begs, phrases - hash tables: (key string id + 1, value) uint32 slots, key hashed with crc32
+    contains        - (item index, string id) pairs
+    groups          - (start, count) of phrase items for every first word
+    phrase_items    - (item index, word start, word count, length) - int32
+    phrase_words    - string ids
+
+"""
+
+from feedex_headers import *
+import mmap
+import zlib
+from array import array
+
+
+
+
+def compile_lexicon(dc):
+    """ Compile dictionary list (structure given in sample model generators) for lookups:
+        single words are hashed, prefixes/suffixes are hashed by length, phrases are grouped by first word.
+        Items keep their position, because first match in original order wins """
+    lex = {'items':[], 'words':{}, 'ends':{}, 'begs':{}, 'contains':[], 'phrases':{}}
+    for idx, d in enumerate(dc):
+        words, tag, l = d[0], d[1], d[2]
+        lex['items'].append((tag, l))
+        if len(words) == 0: continue
+        if l == 1: lex['words'].setdefault(words[0], idx)
+        elif l == -1: lex['ends'].setdefault(len(words[0]), {}).setdefault(words[0], idx)
+        elif l == -2: lex['begs'].setdefault(len(words[0]), {}).setdefault(words[0], idx)
+        elif l == -3: lex['contains'].append((idx, words[0]))
+        else: lex['phrases'].setdefault(words[0], []).append((idx, tuple(words), l))
+    return lex
+
+
+
+def file_hash(path:str):
+    """ SHA1 of a file """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1048576), b''): sha.update(chunk)
+    return sha.hexdigest()
+
+
+
+
+
+class FeedexLexiconWriter:
+    """ Builds compiled lexicon file from dictionary lists """
+
+    def __init__(self):
+        self.strings = {}
+        self.string_lst = []
+        self.data = bytearray()
+        self.index = {'lexicons':{}}
+
+
+    def _sid(self, string:str):
+        """ Get string id from table """
+        sid = self.strings.get(string)
+        if sid is None:
+            sid = len(self.string_lst)
+            self.strings[string] = sid
+            self.string_lst.append(string)
+        return sid
+
+    def _add_array(self, typecode:str, values):
+        """ Append array to data and return its offset and length """
+        while len(self.data) % 8 != 0: self.data.append(0)
+        arr = array(typecode, values)
+        offset = len(self.data)
+        self.data.extend(arr.tobytes())
+        return [offset, len(arr)]
+
+    def _add_table(self, table:dict):
+        """ Add open addressing hash table: string -> uint32 """
+        slots = 8
+        while slots < len(table) * 2: slots *= 2
+        arr = [0] * (slots * 2)
+        for k, v in table.items():
+            sid = self._sid(k)
+            pos = zlib.crc32(k.encode('utf-8')) & (slots - 1)
+            while arr[pos*2] != 0: pos = (pos + 1) & (slots - 1)
+            arr[pos*2] = sid + 1
+            arr[pos*2+1] = v
+        return self._add_array('I', arr)
+
+
+    def add(self, name:str, dc):
+        """ Compile and add dictionary list """
+        lex = compile_lexicon(dc)
+        ix = {}
+        items = []
+        for tag, l in lex['items']: items.extend( (self._sid(scast(tag, str, '')), l) )
+        ix['items'] = self._add_array('i', items)
+        ix['words'] = self._add_table(lex['words'])
+        ix['ends'] = {str(l): self._add_table(t) for l, t in lex['ends'].items()}
+        ix['begs'] = {str(l): self._add_table(t) for l, t in lex['begs'].items()}
+        contains = []
+        for idx, sub in lex['contains']: contains.extend( (idx, self._sid(sub)) )
+        ix['contains'] = self._add_array('I', contains)
+
+        groups, phrase_items, phrase_words, firsts = [], [], [], {}
+        for first, phrases in lex['phrases'].items():
+            firsts[first] = len(groups) // 2
+            groups.extend( (len(phrase_items) // 4, len(phrases)) )
+            for idx, words, l in phrases:
+                phrase_items.extend( (idx, len(phrase_words), len(words), l) )
+                phrase_words.extend( self._sid(w) for w in words )
+        ix['phrases'] = self._add_table(firsts)
+        ix['groups'] = self._add_array('I', groups)
+        ix['phrase_items'] = self._add_array('i', phrase_items)
+        ix['phrase_words'] = self._add_array('I', phrase_words)
+        self.index['lexicons'][name] = ix
+
+
+    def write(self, path:str, source_hash:str):
+        """ Write file atomically """
+        blob = bytearray()
+        offsets = [0]
+        for s in self.string_lst:
+            blob.extend(s.encode('utf-8'))
+            offsets.append(len(blob))
+        self.index['strings'] = self._add_array('I', offsets)
+        self.index['string_blob'] = [len(self.data), len(blob)]
+        self.data.extend(blob)
+
+        self.index['version'] = LEXICON_FILE_VERSION
+        self.index['byteorder'] = sys.byteorder
+        self.index['source_hash'] = source_hash
+        index = json.dumps(self.index).encode('utf-8')
+        header = LEXICON_FILE_MAGIC + array('I', (LEXICON_FILE_VERSION, len(index))).tobytes() + index
+        header += b'\0' * ((8 - len(header) % 8) % 8)
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(self.data)
+        os.replace(tmp_path, path)
+
+
+
+
+
+class FeedexMappedTable:
+    """ Read-only view of hash table from lexicon file. Behaves like a dict with get() """
+
+    def __init__(self, lf, ix):
+        self.lf = lf
+        self.slots = lf.array('I', ix)
+        self.mask = len(self.slots) // 2 - 1
+
+    def get(self, key:str, default=None):
+        if self.mask < 0 or key is None: return default
+        kb = key.encode('utf-8')
+        pos = zlib.crc32(kb) & self.mask
+        slots = self.slots
+        while True:
+            sid = slots[pos*2]
+            if sid == 0: return default
+            if self.lf.string_bytes(sid - 1) == kb: return slots[pos*2+1]
+            pos = (pos + 1) & self.mask
+
+
+
+class FeedexMappedPhrases(FeedexMappedTable):
+    """ Phrases from lexicon file keyed by first word. Returns list of (item index, words, length)
+        Decoded groups are cached, as common first words have many phrases """
+
+    def __init__(self, lf, ix):
+        super().__init__(lf, ix['phrases'])
+        self.groups = lf.array('I', ix['groups'])
+        self.items = lf.array('i', ix['phrase_items'])
+        self.words = lf.array('I', ix['phrase_words'])
+        self.cache = {}
+
+    def get(self, key:str, default=None):
+        phrases = self.cache.get(key)
+        if phrases is None:
+            phrases = self._decode(key)
+            if len(self.cache) >= LEXICON_CACHE_SIZE: self.cache.clear()
+            self.cache[key] = phrases
+        if len(phrases) == 0: return default
+        return phrases
+
+    def _decode(self, key:str):
+        group = super().get(key)
+        if group is None: return ()
+        start, count = self.groups[group*2], self.groups[group*2+1]
+        phrases = []
+        for i in range(start, start + count):
+            idx, wstart, wcount, l = self.items[i*4:i*4+4]
+            phrases.append( (idx, tuple(self.lf.string(s) for s in self.words[wstart:wstart+wcount]), l) )
+        return phrases
+
+
+
+class FeedexMappedItems:
+    """ Lexicon items: (tag, length) """
+
+    def __init__(self, lf, ix):
+        self.lf = lf
+        self.items = lf.array('i', ix)
+
+    def __getitem__(self, idx:int):
+        return self.lf.string(self.items[idx*2]), self.items[idx*2+1]
+
+    def __len__(self): return len(self.items) // 2
+
+
+
+
+
+class FeedexLexiconFile:
+    """ Memory-mapped compiled lexicon file. Lexicons have the same structure as ones from compile_lexicon """
+
+    def __init__(self, path:str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.mv = memoryview(self.mm)
+
+        if self.mm[:4] != LEXICON_FILE_MAGIC: raise ValueError(f'{path}: {_("Not a lexicon file")}')
+        version, index_len = array('I', self.mm[4:12])
+        if version != LEXICON_FILE_VERSION: raise ValueError(f'{path}: {_("Unsupported lexicon file version")} ({version})')
+        self.index = json.loads(self.mm[12:12+index_len].decode('utf-8'))
+        if self.index.get('byteorder') != sys.byteorder: raise ValueError(f'{path}: {_("Lexicon file compiled on incompatible platform")}')
+        self.start = 12 + index_len + (8 - (12 + index_len) % 8) % 8
+        self.source_hash = self.index.get('source_hash')
+
+        self.offsets = self.array('I', self.index['strings'])
+        blob_start = self.start + self.index['string_blob'][0]
+        self.blob = self.mv[blob_start:blob_start + self.index['string_blob'][1]]
+
+        self.lexicons = {}
+        for name, ix in self.index['lexicons'].items():
+            self.lexicons[name] = {
+                'items' : FeedexMappedItems(self, ix['items']),
+                'words' : FeedexMappedTable(self, ix['words']),
+                'ends' : {int(l): FeedexMappedTable(self, t) for l, t in ix['ends'].items()},
+                'begs' : {int(l): FeedexMappedTable(self, t) for l, t in ix['begs'].items()},
+                'contains' : self._contains(ix['contains']),
+                'phrases' : FeedexMappedPhrases(self, ix)
+            }
+
+
+    def array(self, typecode:str, ix):
+        """ Zero-copy view of an array in file """
+        offset, length = ix
+        offset += self.start
+        return self.mv[offset:offset + length * 4].cast(typecode)
+
+    def string_bytes(self, sid:int):
+        return self.blob[self.offsets[sid]:self.offsets[sid+1]]
+
+    def string(self, sid:int):
+        return bytes(self.string_bytes(sid)).decode('utf-8')
+
+    def _contains(self, ix):
+        arr = self.array('I', ix)
+        return [(arr[i], self.string(arr[i+1])) for i in range(0, len(arr), 2)]
+
+
+
+def load_lexicon_file(pkl_path:str, **kargs):
+    """ Get memory-mapped lexicons for a dictionary pickle. Precompiled file next to pickle is used if its source hash matches,
+        otherwise compiled file is taken from cache or created there """
+    source_hash = file_hash(pkl_path)
+    base = os.path.basename(pkl_path).rsplit('.',1)[0]
+    precompiled = f'{pkl_path.rsplit(".",1)[0]}.{LEXICON_FILE_EXT}'
+    cached = os.path.join(kargs.get('cache_dir', FEEDEX_CACHE_PATH), f'{base}-{source_hash[:16]}.{LEXICON_FILE_EXT}')
+
+    for path in (precompiled, cached):
+        if not os.path.isfile(path): continue
+        try: lf = FeedexLexiconFile(path)
+        except (OSError, ValueError, KeyError): continue
+        if lf.source_hash == source_hash: return lf
+
+    with open(pkl_path, 'rb') as f: dicts = pickle.load(f)
+    if type(dicts) is not dict: raise ValueError(f'{pkl_path}: {_("Data not a dictionary structure!")}')
+    writer = FeedexLexiconWriter()
+    for name, dc in dicts.items():
+        if type(dc) in (tuple, list): writer.add(name, dc)
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    writer.write(cached, source_hash)
+    return FeedexLexiconFile(cached)
@@ -45,14 +45,12 @@ class LingProcessor:
         {'name': 'multi_surnames', 'caps_only': True, 'stop_if_matched':True, 'stem':False, 'uncommon_only':False}    
         ]
 
-        if self.MC.multi_dict == {}:
-            self.MC.multi_dict = self._load_pickle('multi_dict.pkl')
-            if type(self.MC.multi_dict) is not dict: self.MC.multi_dict = {'_none':True}
+        # General dictionary and model dictionaries are loaded only when needed for feature extraction (see _get_lexicons)
 
         # Load model headers from specified dir
         if self.MC.models == {}:
 
-            self.MC.models['heuristic'] = HEURISTIC_MODEL
+            self.MC.models['heuristic'] = self._compile_word_sets(HEURISTIC_MODEL.copy()) # Model data is modified on loading
             
             if os.path.isdir(FEEDEX_MODELS_PATH):
                 for header_file in os.listdir(FEEDEX_MODELS_PATH):
@@ -72,7 +70,7 @@ class LingProcessor:
                         curr_model_name = slist(curr_model.get('names',()),0,None)
             
                         if curr_model_name is not None:
-                            self.MC.models[curr_model_name] = curr_model.copy()
+                            self.MC.models[curr_model_name] = self._compile_word_sets(curr_model.copy())
             else:
                 sys.stderr.write(f'{TERM_ERR}{_("Invalid path for language models!")} ({TERM_ERR_BOLD}{FEEDEX_MODELS_PATH}{TERM_ERR}){TERM_NORMAL}\n')
 
@@ -83,9 +81,9 @@ class LingProcessor:
         self.fields = []
         self.tokens = []
 
-        # Strings for token and regex rule searches
-        self.token_str = ''
-        self.raw_token_str = ''
+        # Strings for token and regex rule searches (token strings are built from lists)
+        self.token_lst = []
+        self.raw_token_lst = []
         self.regex_rule_str = ''
 
         self.rules = []
@@ -144,30 +142,45 @@ class LingProcessor:
 
 
 
-    def _load_pickle(self, pkl:str, **kargs):
-        """ Load pickle file """
+    def _load_lexicons(self, pkl:str):
+        """ Load compiled and memory-mapped lexicons for a dictionary pickle. Falls back to compiling pickle in memory """
         if pkl is None: return {}
-        if not os.path.isdir(FEEDEX_MODELS_PATH):
-            sys.stderr.write(f'{TERM_ERR}{_("Invalid path for language models!")} ({TERM_ERR_BOLD}{FEEDEX_MODELS_PATH}{TERM_ERR}){TERM_NORMAL}')
-            return {}
         pickle_path = f'{FEEDEX_MODELS_PATH}{DIR_SEP}{pkl}'
-        lst = None
-        if os.path.isfile(pickle_path):
-            try:
-                with open(pickle_path, 'rb') as f:
-                    lst = pickle.load(f)
-                    if type(lst) is not dict: 
-                        sys.stderr.write(f'{TERM_ERR}{_("Data not a dictionary structure!")} {TERM_ERR_BOLD}{pickle_path}{TERM_NORMAL}\n')
-                        return {}
-            except OSError as e:
-                sys.stderr.write(f'{TERM_ERR}{_("Could not load pickle")} {TERM_ERR_BOLD}{pickle_path}{TERM_ERR}...{TERM_NORMAL}\n{e}')
-                lst = {}
-            if self.debug in (1,6,4): print(f'{_("Pickle ")}{pkl} {_("loaded")}...')
-        else:
+        if not os.path.isfile(pickle_path):
             sys.stderr.write(f'{TERM_ERR}{_("Could not find pickle path")} {TERM_ERR_BOLD}{pickle_path}{TERM_ERR} ...{TERM_NORMAL}\n')
-            lst = {}
+            return {}
+
+        try: 
+            lexicons = load_lexicon_file(pickle_path).lexicons
+            if self.debug in (1,6,4): print(f'{_("Lexicons for")} {pkl} {_("mapped")}...')
+            return lexicons
+        except (OSError, ValueError, KeyError) as e:
+            sys.stderr.write(f'{TERM_ERR}{_("Could not map lexicon file for")} {TERM_ERR_BOLD}{pickle_path}{TERM_ERR}...{TERM_NORMAL}\n{e}\n')
+
+        try:
+            with open(pickle_path, 'rb') as f: dicts = pickle.load(f)
+        except (OSError, pickle.UnpicklingError) as e:
+            sys.stderr.write(f'{TERM_ERR}{_("Could not load pickle")} {TERM_ERR_BOLD}{pickle_path}{TERM_ERR}...{TERM_NORMAL}\n{e}')
+            return {}
+        if type(dicts) is not dict: 
+            sys.stderr.write(f'{TERM_ERR}{_("Data not a dictionary structure!")} {TERM_ERR_BOLD}{pickle_path}{TERM_NORMAL}\n')
+            return {}
+        return self._compile_lexicons(dicts)
 
-        return lst
+
+
+    def _get_lexicons(self):
+        """ Get lexicons for current model, loading them on first use """
+        if self.MC.multi_lexicons is None: self.MC.multi_lexicons = self._load_lexicons('multi_dict.pkl')
+
+        model = self.MC.models.get(self.get_model(), {})
+        if model.get('lexicons') is None:
+            # Dictionaries from model pickle take precedence over ones in header
+            lexicons = self._compile_lexicons(model.get('d',{}))
+            lexicons.update(self._load_lexicons(model.get('dict_pickle')))
+            model['lexicons'] = lexicons
+        self.lexicons = model['lexicons']
+        return self.lexicons
 
 
 
@@ -191,6 +204,20 @@ class LingProcessor:
 
 
 
+    def _compile_word_sets(self, model:dict):
+        """ Convert model word lists to sets for constant time lookups """
+        for k in LING_LEXICON_KEYS:
+            if k in model: model[k] = frozenset(model[k])
+        return model
+
+
+
+    def _compile_lexicons(self, dicts:dict):
+        """ Compile all dictionary lists from a model """
+        return {name: compile_lexicon(dc) for name, dc in dicts.items() if type(dc) in (tuple, list)}
+
+
+
 
 
 
@@ -240,7 +267,7 @@ class LingProcessor:
                 self.MC.models[mname]['stemmer_obj'] = None
                 self.MC.models[mname]['syls'] = None
                 
-            # Load pickles, parse rules, compile regexes, and merge lookups :)
+            # Parse rules, compile regexes, and merge lookups :)
             re_tokenixer = re.compile(self.MC.models[mname].get('REGEX_tokenizer'))
             re_q_tokenixer = re.compile(self.MC.models[mname].get('REGEX_query_tokenizer'))
 
@@ -249,8 +276,6 @@ class LingProcessor:
 
             tmp_rules = self._parse_rules(self.MC.models.get(mname,{}).get('rules',()) )
             self.MC.models[mname]['rules'] = tmp_rules
-            tmp_d = self._load_pickle(self.MC.models.get(mname,{}).get('dict_pickle'))
-            for d,v in tmp_d.items(): self.MC.models[mname]['d'][d] = v
             
             if not self.MC.models[mname].get('skip_multiling',False):
                 temp_lkps = []
@@ -262,7 +287,7 @@ class LingProcessor:
 
             self.MC.loaded_models.append(mname)
             
-        self.d = self.MC.models.get(mname,{}).get('d',{})
+        self.lexicons = self.MC.models.get(mname,{}).get('lexicons')
         self.rules = self.MC.models.get(mname,{}).get('rules',[])
         self.stemmer = self.model.get('stemmer_obj')
         self.syls = self.model.get('syls')
@@ -315,6 +340,7 @@ class LingProcessor:
             toks = re.findall(regex, string)
 
         tokens_tmp = []
+        aliases = self.model.get('aliases',{})
 
         for t in toks:
             # Strip from trash
@@ -324,40 +350,38 @@ class LingProcessor:
             if t == '' or t in ignore: continue
 
             # Replace aliases/contractions
-            if t in self.model.get('aliases',{}).keys(): tokens_tmp = tokens_tmp + list(self.model.get("aliases",{}).get(t,[]))
+            if t in aliases: tokens_tmp.extend(aliases.get(t,[]))
             else: tokens_tmp.append(t)
 
         if simple: return tokens_tmp
 
         self.tokens = []
-        tt = {}
+        
+        stem = field['stem']
+        stemmer = None
+        if stem and self.model.get('morphology',1) in (1,2): stemmer = self.stemmer
 
-        # Create list of dicts based on token template
+        # Create list of dicts with the same keys as token template
         for t in tokens_tmp:
-            tt = self.token_template.copy()
-            tt['raw'] = t
-            tt['lc'] = t.lower()
-            tt['case'] = self._case(tt['raw']) 
-            tt['prefix'] = prefix
-            tt['tags'] = set()
-
-            if field['stem']:
-                if self.model.get('morphology',1) in (1,2) and self.stemmer is not None:
-                    tt['stem'] = self.stemmer.stemWord(t)
-                    tt['stem_lc'] = tt['stem'].lower()
-                else:
-                    tt['stem'] = t
-                    tt['stem_lc'] = tt['lc']
+            lc = t.lower()
+            case = self._case(t)
 
-                tt['token'] = f'{tt["prefix"]}{str(tt["case"])}{tt["stem_lc"]}'
+            if stem:
+                if stemmer is not None:
+                    st = stemmer.stemWord(t)
+                    st_lc = st.lower()
+                else:
+                    st = t
+                    st_lc = lc
+                token = f'{prefix}{case}{st_lc}'
             else:
-                tt['stem'] = None
-                tt['stem_lc'] = None
-                tt['token'] = f'{tt["prefix"]}{str(tt["case"])}{tt["lc"]}'
+                st = None
+                st_lc = None
+                token = f'{prefix}{case}{lc}'
 
-            self.tokens.append(tt)
-            self.token_count += 1
+            self.tokens.append({'raw':t, 'case':case, 'lc':lc, 'stem':st, 'stem_lc':st_lc, 'syls':0, 'chars':0, 'tags':set(), 'prefix':prefix, 'token':token, 'pos':0})
         
+        self.token_count = len(self.tokens)
         return tokens_tmp
 
 
@@ -383,72 +407,91 @@ class LingProcessor:
 
         quot = False
 
+        # Model lookups are fetched once per field
+        model = self.model
+        sent_end = model.get('sent_end',())
+        sent_beg = model.get('sent_beg',())
+        quots = model.get('quot',())
+        quot_end = model.get('quot_end',())
+        quot_beg = model.get('quot_beg',())
+        emph_end = model.get('emph_end',())
+        emph_beg = model.get('emph_beg',())
+        punctation = model.get('punctation',())
+        alphabetic = model.get('writing_system',1) in (1,2)
+        hyphenate = model.get('pyphen','') != ''
+        bicameral = model.get('bicameral',1)
+        stops = model.get('stops',())
+        commons = model.get('commons',())
+        commons_stemmed = model.get('commons_stemmed',())
+        entry = self.entry
+
         # Basic single-word tagging
-        for i,tok in enumerate(self.tokens):
+        for tok in self.tokens:
 
             stop = False
             t = tok['raw']
+            tags = tok['tags']
 
             # Marks beginning or ending of a sentence?
-            if t in self.model.get('sent_end',()):
-                tok['tags'].add('SE')
-                self.entry['sent_count'] += 1
+            if t in sent_end:
+                tags.add('SE')
+                entry['sent_count'] += 1
                 stop = True
 
-            elif t in self.model.get('sent_beg',()):
-                tok['tags'].add('SB')
+            elif t in sent_beg:
+                tags.add('SB')
                 stop = True
 
             # Is quotation mark?
-            elif t in self.model.get('quot',()):
+            elif t in quots:
                 if quot:
-                    tok['tags'].add('QE')
+                    tags.add('QE')
                     quot = False
                 else:
-                    tok['tags'].add('QB')
+                    tags.add('QB')
                     quot = True
 
-            elif t in self.model.get('quot_end',()):
-                tok['tags'].add('QE')
+            elif t in quot_end:
+                tags.add('QE')
                 stop = True
 
-            elif t in self.model.get('quot_beg',()):
-                tok['tags'].add('QB')
+            elif t in quot_beg:
+                tags.add('QB')
                 stop = True
 
             # Is emphasized by markers?
-            elif t == '«' or t in self.model.get('emph_end',()):
-                tok['tags'].add('EMPE')
+            elif t == '«' or t in emph_end:
+                tags.add('EMPE')
                 stop = True
 
-            elif t == '»' or  t in self.model.get('emph_beg',()):
-                tok['tags'].add('EMPB')
+            elif t == '»' or  t in emph_beg:
+                tags.add('EMPB')
                 stop = True
                 
             # Is a punctation character?
-            elif t == '»' or t in self.model.get('punctation',()):
-                tok['tags'].add('PUNCT')
+            elif t == '»' or t in punctation:
+                tags.add('PUNCT')
                 stop = True
 
             # Add to word count (it is always done)
             if not stop:
                 if not meta:
-                    self.entry['word_count'] += 1
+                    entry['word_count'] += 1
 
-                if self.model.get('writing_system',1) in (1,2):
-                    tok_l = len(tok['raw'])
+                if alphabetic:
+                    tok_l = len(t)
                     tok['chars'] = tok_l
                     # Count characters
                     if not meta:
-                        self.entry['char_count'] += tok['chars']
+                        entry['char_count'] += tok_l
                     
                     # Count syllables and polysyllables
-                    if self.model.get('pyphen','') != '':
+                    if hyphenate:
                         syls_count = len(self.syls.inserted(t).split('-'))
                         if syls_count >= 3:
-                            tok['tags'].add('POLYSYL')
+                            tags.add('POLYSYL')
                             if not meta:
-                                self.entry['polysyl_count'] += 1
+                                entry['polysyl_count'] += 1
     
                     tok['syls'] = syls_count
                         
@@ -462,40 +505,38 @@ class LingProcessor:
             if not stop and self._isnum(t):
                 stop = True
                 if not meta:
-                    self.entry['numerals_count'] += 1
-                tok['tags'].add('NUM')
+                    entry['numerals_count'] += 1
+                tags.add('NUM')
         
 
             if not stop:
                 # Is its case significant?
-                
-                if tok['case'] != 0 and self.model.get('bicameral',1) in (1,2):
+                case = tok['case']
+                if case != 0 and bicameral in (1,2):
                     if not meta:
-                        self.entry['caps_count'] += 1
-                    if tok['case'] == 1 and tok_l > 1:
-                        tok['tags'].add('CAP')
-                    elif tok['case'] == 2 and tok_l == 1:
-                        tok['tags'].add('SCAP')
-                    elif tok['case'] == 2 and self.model.get('writing_system',1) in (1,2):
-                        tok['tags'].add('ALLCAP')
+                        entry['caps_count'] += 1
+                    if case == 1 and tok_l > 1:
+                        tags.add('CAP')
+                    elif case == 2 and tok_l == 1:
+                        tags.add('SCAP')
+                    elif case == 2 and alphabetic:
+                        tags.add('ALLCAP')
 
                 # Is it a non-capitalized stop word?
-                if tok['lc'] in self.model.get('stops',()) and not (tok['case'] == 2 and self.model.get('bicameral',1) != 0):
-                    tok['tags'].add('STOP')
-                    tok['tags'].add('COMM')
+                if tok['lc'] in stops and not (case == 2 and bicameral != 0):
+                    tags.add('STOP')
+                    tags.add('COMM')
                     if not meta:
-                        self.entry['com_word_count'] += 1
+                        entry['com_word_count'] += 1
                 # Is it a common word?
-                elif tok['lc'] in self.model.get('commons',()) or tok['stem_lc'] in self.model.get('commons_stemmed',()):
-                    tok['tags'].add('COMM')
+                elif tok['lc'] in commons or tok['stem_lc'] in commons_stemmed:
+                    tags.add('COMM')
                     if not meta:
-                        self.entry['com_word_count'] += 1
+                        entry['com_word_count'] += 1
                 else:
-                    tok['tags'].add('UNCOMM')
-
+                    tags.add('UNCOMM')
 
 
-            self.tokens[i] = tok
 
 
 
@@ -503,63 +544,49 @@ class LingProcessor:
 
 
 
+    def _dict_lookup(self, pos:int, lex:dict, **kargs):
+        """ Lookup tokens in a compiled dictionary (see _compile_lexicon) """    
+        if kargs.get('stem',False): key = 'stem_lc'
+        else: key = 'lc'
+        tok = self.tokens[pos][key]
+        # Fields without stemming (e.g. author) have no stems to look up
+        if tok is None: return None, None
+        tok_l = len(tok)
 
+        best = lex['words'].get(tok, -1)
 
-    def _dict_lookup(self, pos:int, dc:list, **kargs):
-        """ Lookup tokens in a dictionary (structure given in sample model generators) """    
-        match = True
-        tag = None
-        len = None
-        stem = kargs.get('stem',False)
+        # Below, we implement some kind of morphology-like distictions
+        for l, ends in lex['ends'].items():
+            if l <= tok_l:
+                idx = ends.get(tok[tok_l-l:], -1)
+                if idx != -1 and (best == -1 or idx < best): best = idx
+        for l, begs in lex['begs'].items():
+            if l <= tok_l:
+                idx = begs.get(tok[:l], -1)
+                if idx != -1 and (best == -1 or idx < best): best = idx
+        for idx, sub in lex['contains']:
+            if best != -1 and idx > best: break
+            if sub in tok: 
+                best = idx
+                break
 
-        for d in dc:
-            tag = d[1]
-            len = d[2]
-            match = True
-            if stem: tok = self.tokens[pos]['stem_lc']
-            else: tok = self.tokens[pos]['lc']
-            # If we have a single whole word, the case is simple...
-            if len == 1:
-                if tok == d[0][0]:
-                    match = True
-                    break
-            # Below, we implement some kind of morphology-like distictions
-            elif len == -1:
-                if tok.endswith(d[0][0]):
-                    match = True
-                    break
-            elif len == -2:
-                if tok.startswith(d[0][0]):
-                    match = True
-                    break
-            elif len == -3:
-                if tok.contains(d[0][0]):
-                    match = True
-                    break
+        # ... and finally phrase searching (phrases are sorted by position)
+        for idx, words, l in lex['phrases'].get(tok, ()):
+            if best != -1 and idx > best: break
+            if self._phrase_match(pos, words, l, key):
+                best = idx
+                break
 
-            # ... and finally phrase searching
-            for j, w in enumerate(d[0], start=1):
-                if tok != w:
-                    match = False
-                    break
-            
-                #print(j, w, tok, pos, d[0])
-                if pos+j < self.token_count:
-                    if stem: tok = self.tokens[pos+j]['stem_lc']
-                    else: tok = self.tokens[pos+j]['lc']
-                else:
-                    if j < len:
-                        match = False
-                    break
+        if best == -1: return None, None
+        return lex['items'][best]
 
 
-            if match:
-                break
-        
-        if match:
-            return tag, len
-        else:
-            return None, None
+    def _phrase_match(self, pos:int, words:tuple, l:int, key:str):
+        """ Check if tokens starting at pos match a phrase """
+        for j, w in enumerate(words, start=1):
+            if self.tokens[pos+j-1][key] != w: return False
+            if pos+j >= self.token_count: return j >= l
+        return True
 
 
 
@@ -571,6 +598,9 @@ class LingProcessor:
 
     def _advanced_tag(self, **kargs):
         """ Performs advanced tagging of tokens based on dictionary lookup - helpful in feature extraction """
+        lexicons = self.lexicons
+        if lexicons is None: lexicons = self._get_lexicons()
+        multi_lexicons = self.MC.multi_lexicons
 
         for i, t in enumerate(self.tokens):
 
@@ -601,7 +631,7 @@ class LingProcessor:
 
                 if caps_only and t['case'] == 0: continue
 
-                (tag, len) = self._dict_lookup(i, self.d.get(dc, self.MC.multi_dict.get(dc,())), stem=stem)
+                (tag, len) = self._dict_lookup(i, lexicons.get(dc, multi_lexicons.get(dc, EMPTY_LEXICON)), stem=stem)
                 if tag is None:
                     continue
                 else:
@@ -650,14 +680,14 @@ class LingProcessor:
             field_name = ''
 
         # Create line for regex search with tags and token numbers
+        rule_strs = []
         for i,t in enumerate(self.tokens):
-            tags = ''
             tgs = scast(t['tags'], list, [])
             if tgs == []:
                 continue
-            for tt in sorted(tgs):
-                tags=f"{tags};{tt}"
-            self.regex_rule_str = f'{self.regex_rule_str} {tags}:{str(i)}'
+            tags = ';'.join(sorted(tgs))
+            rule_strs.append(f' ;{tags}:{i}')
+        self.regex_rule_str = ''.join(rule_strs)
 
         if meta: rules = ({},)
         else: rules = self.rules       
@@ -770,9 +800,15 @@ class LingProcessor:
 
 
     def _index_field(self):
-        """ Construct strings of tokens to allow full text search by means of SQL """
-        self.token_str = f'{self.token_str}   '
-        self.raw_token_str = f'{self.raw_token_str}   '
+        """ Construct strings of tokens to allow full text search by means of SQL 
+            Parts are collected in lists and joined once per entry """
+        token_lst = self.token_lst
+        raw_token_lst = self.raw_token_lst
+        token_lst.append('   ')
+        raw_token_lst.append('   ')
+
+        no_index = self.model.get('no_index',{'PUNCT'})
+        dividers = self.model.get('dividers',set())
 
         for t in self.tokens:
 
@@ -780,14 +816,14 @@ class LingProcessor:
             self.last_pos += 1
 
             t['tags'] = set(t['tags'])
-            if t['tags'].intersection(self.model.get('no_index',{'PUNCT'})) != set():
-                self.raw_token_str = f'{self.raw_token_str} {pos_str}{t["prefix"]}{t["case"]}{t["lc"]}'
-            elif t['tags'].intersection(self.model.get('dividers',set())) != set():
-                self.raw_token_str = f'{self.raw_token_str} {pos_str}{t["prefix"]}0{t["raw"]}'
-                self.token_str = f'{self.token_str}   '
+            if not t['tags'].isdisjoint(no_index):
+                raw_token_lst.append(f' {pos_str}{t["prefix"]}{t["case"]}{t["lc"]}')
+            elif not t['tags'].isdisjoint(dividers):
+                raw_token_lst.append(f' {pos_str}{t["prefix"]}0{t["raw"]}')
+                token_lst.append('   ')
             else:
-                self.token_str = f'{self.token_str} {pos_str}{t["token"]}'
-                self.raw_token_str = f'{self.raw_token_str} {pos_str}{t["prefix"]}{t["case"]}{t["lc"]}'
+                token_lst.append(f' {pos_str}{t["token"]}')
+                raw_token_lst.append(f' {pos_str}{t["prefix"]}{t["case"]}{t["lc"]}')
 
 
 
@@ -829,26 +865,67 @@ class LingProcessor:
 
     def process_entry(self, entry, **kargs):
         """ Proces fields given in a list from Feedex's main class """
+        # Set processed entry
+        self._load_entry(entry)
+        self._process_loaded(**kargs)
+
+
+
+    def process_entries(self, entries, **kargs):
+        """ Process a batch of entries (dicts, changed in place) with the same options as process_entry.
+            Entries are grouped by language model, so each model is set up once per batch.
+            Returns a list of extracted features for each entry (in given order) """
+        entries = list(entries)
+        features = [{}] * len(entries)
+
+        groups = {}
+        for i, e in enumerate(entries): groups.setdefault(self._entry_model(e), []).append(i)
+
+        for model, idxs in groups.items():
+            self.set_model(model, detect=False)
+            for i in idxs:
+                entry = entries[i]
+                self._load_entry(entry, no_model=True)
+                if entry.get('lang') is None: entry['lang'] = self.get_model()
+                self._process_loaded(**kargs)
+                features[i] = self.features
+
+        return features
+
+
+
+    def _entry_model(self, entry):
+        """ Resolve language model name for an entry without loading it (detection is run only if needed) """
+        model = self._find_model(entry.get('lang'))
+        if model is not None and model in self.MC.models.keys(): return model
+
+        self.entry = entry
+        self.charset = entry.get('charset')
+        model = self.detect_lang()
+        if model not in self.MC.models.keys(): model = 'heuristic'
+        return model
+
+
+
+    def _process_loaded(self, **kargs):
+        """ Process currently loaded entry (index strings, stats, features and rank) """
         learn = kargs.get('learn',False)
         index = kargs.get('index',True)
         stats = kargs.get('stats',True)
         rank = kargs.get('rank', False)
 
-        # Set processed entry
-        self._load_entry(entry)
-
         # Nullify all present statistics, strings and lists
         self.tokens = [] # List of tokens for further processing
-        self.token_str = ''
-        self.raw_token_str = ''
+        self.token_lst = []
+        self.raw_token_lst = []
         self.last_pos = 0
         self.features = {}
 
         if index or learn or stats:
 
             # Zeroe all the counters
-            for f in self.entry.keys():
-                if f in ('sent_count','word_count','char_count','polysyl_count','com_word_count','numerals_count','caps_count','readability'): self.entry[f] = 0
+            for f in ('sent_count','word_count','char_count','polysyl_count','com_word_count','numerals_count','caps_count','readability'): 
+                if f in self.entry: self.entry[f] = 0
 
             # Process fields
             for f,v in self.entry.items():
@@ -858,10 +935,10 @@ class LingProcessor:
                     self.process_field(field, f, learn=learn, index=index)
 
             #Pad token string end and insert to entry
-            self.token_str = f'{self.token_str}   '
-            self.raw_token_str = f'{self.raw_token_str}   '
-            self.entry['tokens'] = self.token_str
-            self.entry['tokens_raw'] = self.raw_token_str
+            self.token_lst.append('   ')
+            self.raw_token_lst.append('   ')
+            self.entry['tokens'] = ''.join(self.token_lst)
+            self.entry['tokens_raw'] = ''.join(self.raw_token_lst)
 
             if self.debug in (1,4) and learn: print(self.features)
 
@@ -1017,81 +1094,101 @@ class LingProcessor:
         flag_dist = {} # Distribution of flag matches
         entry_dist = {} #If matched with many terms from one entry it will significantly raise importance
 
-        for r in self.MC.rules:
+        # Recompile matcher if rules changed since last time
+        if self.MC.rule_index_version != self.MC.rules_version: self.compile_rules()
+
+        matched_rules = [] # (rule index, rule, match count)
+
+        # Learned rules: token string is scanned once and only rules ending with present terms are checked
+        for qtype, tokens in ((4, self.entry['tokens']), (5, self.entry['tokens_raw'])):
+            rule_index = self.MC.rule_index.get(qtype, {})
+            if len(rule_index) == 0: continue
+            index = self._token_index(scast(tokens, str, ''))
+
+            for base in index.keys():
+                for idx, r, toks in rule_index.get(base, ()):
+                    if not self._rule_applies(r): continue
+                    matched = self._rule_matches(toks, index)
+                    if matched > 0: matched_rules.append( (idx, r, matched) )
+
+        # Manual rules are matched one by one
+        for idx, r in self.MC.manual_rules:
+
+            if not self._rule_applies(r): continue
+
+            qtype = scast(r[2], int, 0)
+            field = scast(r[4], str, None)
+            string = scast(r[5], str, '')
+
+            if r[6] == 1: case_ins = True
+            else: case_ins = False
+
+            if qtype == 3:
+                if field is None: field_lst = LING_TEXT_LIST
+                else: field_lst = [field]
+                matched = 0
+
+                for f in field_lst:
+                    if type(self.entry[f]) is not str: continue
+
+                    if case_ins: matches = re.findall(string, self.entry[f], re.IGNORECASE)
+                    else: matches = re.findall(string, self.entry[f])
+
+                    matched += len(matches)
+
+            else:
+                phrase = self.f_phrase(string, qtype=qtype, field=field, sqlize=False, regexify=True, case_ins=case_ins)
+                matched = self.match_fields(phrase, qtype, field, case_ins=case_ins, snippets=False)[0]
+
+            if matched > 0: matched_rules.append( (idx, r, matched) )
+
+
+        # Process matches in original rule order
+        matched_rules.sort(key=lambda x: x[0])
+
+        for idx, r, matched in matched_rules:
 
             name = r[1]
             qtype = scast(r[2], int, 0)
             feed = scast(r[3], int, -1)
-            if feed is not None and feed != -1 and self.entry['feed_id'] != feed: continue
-
             field = scast(r[4], str, None)
             string = scast(r[5], str, '')
 
-            if len(string) < 1: continue
-
             if r[6] == 1: case_ins = True
             else: case_ins = False
 
             lang = r[7]
-            if lang is not None and lang != self.get_model(): continue
-
             weight = r[8]
             additive = r[9]
             learned = scast(r[10], int, 0)
             do_flag = scast(r[11], int, 0)
             context_id = scast(r[12], int, 0)
 
-            if learned == 1:
-                if qtype == 4:
-                    matched = self.sregex_matcher(string, scast(self.entry['tokens'],str,''))
-                elif qtype == 5:
-                    matched = self.sregex_matcher(string, scast(self.entry['tokens_raw'],str,''))
-
-            else:
-                if qtype == 3:
-                    if field is None: field_lst = LING_TEXT_LIST
-                    else: field_lst = [field]
-                    matched = 0
-
-                    for f in field_lst:
-                        if type(self.entry[f]) is not str: continue
-                    
-                        if case_ins: matches = re.findall(string, self.entry[f], re.IGNORECASE)
-                        else: matches = re.findall(string, self.entry[f])
-
-                        matched += len(matches)
-
-                else:
-                    phrase = self.f_phrase(string, qtype=qtype, field=field, sqlize=False, regexify=True, case_ins=case_ins)
-                    matched = self.match_fields(phrase, qtype, field, case_ins=case_ins, snippets=False)[0]
-                
-            if matched > 0:
-
-                entry_dist[context_id] = entry_dist.get(context_id,0) + (matched * weight)
-
-                # Create list for display
-                if to_var: 
-                    rule.clear()
-                    rule['learned'] = learned
-                    rule['case_insensitive'] = case_ins
-                    rule['additive'] = additive
-                    rule['string'] = string
-                    rule['name'] = name
-                    rule['matched'] = matched
-                    rule['type'] = qtype
-                    rule['field_id'] = field
-                    rule['feed_id'] = feed
-                    rule['flag'] = do_flag
-                    rule['lang'] = lang
-                    rule['weight'] = weight
-                    rule['context_id'] = context_id
-
-                    display_list.append( rule.tuplify() )
-
-                if learned not in (1,2) and do_flag > 0: flag_dist[do_flag] = flag_dist.get(do_flag,0) + (weight * matched)
-
-                if additive == 1: final_weight = final_weight + (weight * matched)
-                else: final_weight = weight * matched
+            entry_dist[context_id] = entry_dist.get(context_id,0) + (matched * weight)
+
+            # Create list for display
+            if to_var:
+                rule.clear()
+                rule['learned'] = learned
+                rule['case_insensitive'] = case_ins
+                rule['additive'] = additive
+                rule['string'] = string
+                rule['name'] = name
+                rule['matched'] = matched
+                rule['type'] = qtype
+                rule['field_id'] = field
+                rule['feed_id'] = feed
+                rule['flag'] = do_flag
+                rule['lang'] = lang
+                rule['weight'] = weight
+                rule['context_id'] = context_id
+
+                display_list.append( rule.tuplify() )
+
+            if learned not in (1,2) and do_flag > 0: flag_dist[do_flag] = flag_dist.get(do_flag,0) + (weight * matched)
+
+            if additive == 1: final_weight = final_weight + (weight * matched)
+            else: final_weight = weight * matched
     
 
 
@@ -1121,6 +1218,118 @@ class LingProcessor:
 
 
 
+    def compile_rules(self, **kargs):
+        """ Compile loaded rules for matching: learned rules are indexed by base of their last token,
+            so only rules ending with a term present in entry need to be checked. Manual rules are kept in a list """
+        version = self.MC.rules_version
+        rule_index = {4:{}, 5:{}}
+        manual_rules = []
+        for i,r in enumerate(self.MC.rules): self._compile_rule(i, r, rule_index, manual_rules)
+
+        self.MC.rule_index = rule_index
+        self.MC.manual_rules = manual_rules
+        self.MC.rule_index_next = len(self.MC.rules)
+        self.MC.rule_index_version = version
+        if self.debug in (1,4): print(f'Rules compiled (version: {version})')
+
+
+    def update_compiled_rules(self, removed:list, added:list):
+        """ Apply rule changes to compiled matcher instead of recompiling (rules in MC need to be already updated) """
+        self.MC.rules_version += 1
+        # Outdated matcher will be recompiled on next match anyway
+        if self.MC.rule_index_version != self.MC.rules_version - 1: return 0
+
+        rule_index = self.MC.rule_index
+        removed = set(removed)
+        manual_removed = False
+        for r in removed:
+            if scast(r[10], int, 0) == 1 and scast(r[2], int, 0) in (4,5):
+                base = scast(r[5], str, '').split(' ')[-1][3:]
+                lst = rule_index[scast(r[2], int, 0)].get(base)
+                if lst is None: continue
+                new_lst = []
+                for c in lst:
+                    if c[1] not in removed: new_lst.append(c)
+                rule_index[scast(r[2], int, 0)][base] = new_lst
+            else: manual_removed = True
+
+        manual_rules = []
+        if manual_removed:
+            for c in self.MC.manual_rules:
+                if c[1] not in removed: manual_rules.append(c)
+        else: manual_rules = self.MC.manual_rules.copy()
+
+        idx = self.MC.rule_index_next
+        for r in added:
+            self._compile_rule(idx, r, rule_index, manual_rules)
+            idx += 1
+
+        self.MC.manual_rules = manual_rules
+        self.MC.rule_index_next = idx
+        self.MC.rule_index_version = self.MC.rules_version
+        return 0
+
+
+    def _compile_rule(self, idx:int, r, rule_index:dict, manual_rules:list):
+        """ Add a single rule to compiled matcher structures """
+        qtype = scast(r[2], int, 0)
+        string = scast(r[5], str, '')
+        if len(string) < 1: return -1
+
+        if scast(r[10], int, 0) == 1 and qtype in (4,5):
+            toks = []
+            for t in string.split(' '): toks.append( (t[3:], t[2:3], t[0:2]) ) # base, case, prefix
+            rule_index[qtype].setdefault(toks[-1][0], []).append( (idx, r, tuple(toks)) )
+        else: manual_rules.append( (idx, r) )
+        return 0
+
+
+    def _rule_applies(self, r):
+        """ Check rule's feed and language restrictions """
+        feed = scast(r[3], int, -1)
+        if feed is not None and feed != -1 and self.entry['feed_id'] != feed: return False
+        if r[7] is not None and r[7] != self.get_model(): return False
+        return True
+
+
+    def _token_index(self, tokens:str):
+        """ Map token bases from token string to lists of their ordinal numbers and (prefix, case) pairs """
+        index = {}
+        n = 0
+        for t in tokens.split(' '):
+            if len(t) <= 10: continue
+            occ = index.get(t[10:])
+            if occ is None:
+                occ = ([], [])
+                index[t[10:]] = occ
+            occ[0].append(n)
+            occ[1].append( (t[7:9], t[9]) )
+            n += 1
+        return index
+
+
+    def _rule_matches(self, toks:tuple, index:dict):
+        """ Count matches of learned rule in indexed token string (like sregex_matcher, but on whole tokens) """
+        l = len(toks)
+        matches = 0
+        pos = 0
+        while True:
+            for i, (base, case, prefix) in enumerate(toks):
+                occ = index.get(base)
+                if occ is None: return matches
+                k = bisect_left(occ[0], pos)
+                if k == len(occ[0]): return matches
+                pos = occ[0][k] + 1
+                if i == l-1:
+                    pr, cs = occ[1][k]
+                    if (cs == case or case == '.') and (pr == prefix or (prefix == '..' and pr[0] == 'T')): matches += 1
+
+
+
+
+
+
+
     def match_fields(self, phrase:dict, qtype:int, field:str, **kargs):
         """ Performs phrase matching given a search phrase and field list. Returns match count and snippets if needed """
         if kargs.get('entry') is not None: self._load_entry(kargs.get('entry'), no_model=True)
@@ -1199,6 +1408,7 @@ class LingProcessor:
         phrase['beg'] = False
         phrase['end'] = False
         phrase['has_wildcards'] = False
+        phrase['terms'] = [] # Exact terms (without wildcards) for index lookup
 
 
         # Deal with start/end
@@ -1322,6 +1532,7 @@ class LingProcessor:
             phrase['str_matching'] = string
 
             for w in string.split(' '):
+                if len(w) > 3 and '.' not in w[3:]: phrase['terms'].append(w[3:])
                 w = f"_______{w.replace('.','_')}"
                 phrase['sql'] = f"{phrase['sql']} {w}"
 
@@ -1389,6 +1600,8 @@ class LingProcessor:
                         phrase['sql'] = f"""{phrase['sql']}%"""
                     else:
                         tok = tok.lower()
+                        # Index holds terms as they are in tokens, so escaped wildcards are matched literally
+                        if not has_wc: phrase['terms'].append(tok.replace('\.','.').replace('\*','*'))
                         sql = self._sqlize(tok)
 
                         if has_wc: sql = _repl_wc_sql(sql)
@@ -192,9 +192,8 @@ class RuleContainer(RuleContainerBasic):
 
         if self.FX.rowcount > 0:
 
-            if not self.FX.single_run: 
-                err = self.FX.load_rules()
-                if err != 0: return -2, _('Error reloading rules after successfull update: %a'), err
+            err = self.FX.update_rules(self.vals.get('context_id'), full=(self.vals.get('context_id') != self.backup_vals.get('context_id')))
+            if err != 0: return -2, _('Error reloading rules after successfull update: %a'), err
             
             for i,u in enumerate(self.to_update):
                 if u in self.immutable or u == 'id': del self.to_update[i]
@@ -239,9 +238,8 @@ class RuleContainer(RuleContainerBasic):
         if err != 0: return -2, _('DB Error: %a'), err
         
         if self.FX.rowcount > 0: 
-            if not self.FX.single_run: 
-                err = self.FX.load_rules()
-                if err != 0: return -2, _('Error reloading rules after successfull delete: %a'), err
+            err = self.FX.update_rules(self.vals.get('context_id'))
+            if err != 0: return -2, _('Error reloading rules after successfull delete: %a'), err
 
             self.FX.log(False, f'Rule {self.vals["id"]} deleted')
             return 0, _('Rule %a deleted'), self.vals['id']
@@ -277,9 +275,8 @@ class RuleContainer(RuleContainerBasic):
         self.vals['id'] = self.FX.lastrowid
         self.FX.last_rule_id = self.vals['id']
 
-        if not self.FX.single_run: 
-            err = self.FX.load_rules()
-            if err != 0: return -2, _('Error reloading rules after successfull add: %a'), err
+        err = self.FX.update_rules(None)
+        if err != 0: return -2, _('Error reloading rules after successfull add: %a'), err
 
         self.FX.log(False, f'Rule {self.name(id=True)} added')
         return 0, _('Rule %a added successfully'), self.name(id=True)
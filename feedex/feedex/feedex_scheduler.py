@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Fetch scheduler for Feedex
+
+Channels are kept in a priority queue keyed by the time of their next check. Due time is computed from channel's interval
+and last check, multiplied by a backoff factor after consecutive errors, and postponed until the time the server
+asked us not to come back before (Cache-Control: max-age, Expires, Retry-After)
+
+With adaptive intervals, channel's publication rate (new entries per hour) is estimated from entry history and then
+updated after every check with exponential smoothing (304 and unchanged channels count as zero new entries).
+Interval is chosen so that about ADAPTIVE_TARGET_ITEMS new entries are expected per check, within configured bounds.
+Predicted and actual number of new entries are accumulated for every channel to show how good the estimates are
+
+Queue items are (due, feed id) tuples. Rescheduled channels are simply pushed again and outdated items are skipped when popped
+
+"""
+
+from feedex_headers import *
+import heapq
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+
+
+
+
+def http_cache_until(headers:dict, now:int, **kargs):
+    """ Time until which the response can be considered fresh according to HTTP headers (None if not stated) """
+    if not isinstance(headers, dict) or len(headers) == 0: return None
+    headers = {scast(k, str, '').lower(): v for k, v in headers.items()}
+    until = None
+
+    # Retry-After (429, 503) - seconds or HTTP date
+    retry = scast(headers.get('retry-after'), str, '').strip()
+    if retry.isdigit(): until = now + int(retry)
+    elif retry != '': until = _http_date(retry)
+
+    cache_control = scast(headers.get('cache-control'), str, '').lower()
+    if 'no-cache' in cache_control or 'no-store' in cache_control: return until
+
+    max_age = None
+    for d in cache_control.split(','):
+        d = d.strip()
+        if d.startswith('max-age='): max_age = scast(d[8:].strip('"'), int, None)
+
+    if max_age is not None:
+        # Age header tells how long response spent in proxy caches
+        fresh = now + max_age - scast(headers.get('age'), int, 0)
+    else: fresh = _http_date(scast(headers.get('expires'), str, ''))
+
+    if fresh is None: return until
+    if until is None: return fresh
+    return max(until, fresh)
+
+
+
+def _http_date(string:str):
+    """ Convert HTTP date to timestamp """
+    if string in (None, ''): return None
+    try: return int(parsedate_to_datetime(string).timestamp())
+    except (TypeError, ValueError, IndexError, OverflowError): return None
+
+
+
+
+
+
+class FeedexOrderedSlots:
+    """ Limit on jobs running at once, but unlike a semaphore, slots are given in the order tickets were taken.
+        Job waiting for its turn never lets a later one go first, so a writer taking results in dispatch order 
+        can't wait for a job that waits for a slot held by later jobs. Tickets of jobs that won't run are dropped """
+
+    def __init__(self, size:int):
+        self.size = max(1, size)
+        self.cond = threading.Condition()
+        self.active = 0
+        self.issued = 0 # Next ticket to take
+        self.served = 0 # Next ticket to be given a slot
+        self.dropped = set()
+        self.closed = False
+
+
+    def ticket(self):
+        """ Take next ticket (in dispatch order) """
+        with self.cond:
+            self.issued += 1
+            return self.issued - 1
+
+
+    def acquire(self, ticket:int):
+        """ Wait for ticket's turn and a free slot. Returns False if ticket was dropped or slots were closed """
+        with self.cond:
+            while True:
+                while self.served in self.dropped: self.served += 1
+                if self.closed or ticket in self.dropped: return False
+                if ticket == self.served and self.active < self.size:
+                    self.served += 1
+                    self.active += 1
+                    return True
+                self.cond.wait()
+
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+
+    def drop(self, ticket:int):
+        """ Give up ticket not served yet (served ones are ignored) """
+        with self.cond:
+            if ticket >= self.served:
+                self.dropped.add(ticket)
+                self.cond.notify_all()
+
+
+    def close(self):
+        """ Stop giving slots - all waiting jobs are let go without one """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+    @contextmanager
+    def taken(self, ticket:int):
+        """ Hold a slot for ticket. Yields False if none was given """
+        acquired = self.acquire(ticket)
+        try: yield acquired
+        finally:
+            if acquired: self.release()
+
+
+
+
+
+
+
+class FeedexFetchScheduler:
+    """ Priority queue of channels to check, keyed by next due time. Built from loaded feeds and saved schedule.
+        Channels taken for fetching stay pending until rescheduled with fetch result or released back """
+
+    def __init__(self, config, **kargs):
+        self.config = config
+        self.lock = threading.Lock()
+
+        self.heap = []
+        self.items = {} # Feed id -> {'due', 'checked', 'interval', 'errors', 'cache_until', 'rate', 'checks', 'empty', 'predicted', 'actual', 'bytes_saved'}
+        self.pending = {} # Channels taken for fetching
+        self.rows = {} # Feed id -> feed row
+        self.feeds = None # Feed list the queue was built from
+
+
+
+    def interval(self, feed, rate):
+        """ Channel check interval in seconds - static one from channel's settings or adapted to estimated publication rate """
+        if rate is None or not self.config.get('adaptive_intervals', False):
+            return scast(feed['interval'], int, self.config.get('default_interval',45)) * 60
+
+        min_int = self.config.get('adaptive_interval_min', 15) * 60
+        max_int = max(min_int, self.config.get('adaptive_interval_max', 1440) * 60)
+        if rate <= 0: return max_int
+        return int(min(max_int, max(min_int, ADAPTIVE_TARGET_ITEMS / rate * 3600)))
+
+
+    def due(self, item:dict):
+        """ Next check time for schedule item """
+        due = item['checked'] + item['interval']
+
+        # Back off exponentially from failing channels
+        if item['errors'] > 0: due = item['checked'] + item['interval'] * min(2 ** item['errors'], FETCH_BACKOFF_MAX)
+
+        # Respect server's caching, but not for too long
+        if item['cache_until'] is not None and self.config.get('respect_cache_headers', True):
+            due = max(due, min(item['cache_until'], item['checked'] + FETCH_CACHE_MAX))
+
+        return due
+
+
+
+    def _eligible(self, feed):
+        """ Is channel fetched during periodic checks? """
+        if feed['deleted'] == 1: return False
+        if feed['fetch'] in (None,0): return False
+        if feed['is_category'] not in (0,None) or feed['handler'] in ('local',): return False
+        if feed['handler'] not in FEEDEX_HANDLERS.keys(): return False
+        if scast(feed['error'], int, 0) >= self.config.get('error_threshold',5): return False
+        return True
+
+
+    def _push(self, feed_id:int, item:dict):
+        item['due'] = self.due(item)
+        self.items[feed_id] = item
+        heapq.heappush(self.heap, (item['due'], feed_id))
+
+
+
+    def build(self, feeds, saved:dict, **kargs):
+        """ Rebuild queue from feed list and saved schedule ({feed id: {column: value}}). 
+            Rates for channels without saved ones are taken from history={feed id: rate} """
+        history = kargs.get('history', {})
+        with self.lock:
+            self.heap = []
+            self.items = {}
+            self.pending = {}
+            self.rows = {}
+            feed = FeedContainerBasic()
+            for f in feeds:
+                feed.populate(f)
+                if not self._eligible(feed): continue
+                self.rows[feed['id']] = f
+                sv = saved.get(feed['id'], {})
+                rate = scast(sv.get('rate'), float, None)
+                if rate is None: rate = history.get(feed['id'])
+                item = {'checked':scast(feed['lastchecked'], int, 0), 'interval':self.interval(feed, rate), 'errors':scast(feed['error'], int, 0),
+                        'cache_until':sv.get('cache_until'), 'rate':rate, 'checks':scast(sv.get('checks'), int, 0), 'empty':scast(sv.get('empty_checks'), int, 0),
+                        'predicted':scast(sv.get('predicted'), float, 0), 'actual':scast(sv.get('actual'), int, 0), 'bytes_saved':scast(sv.get('bytes_saved'), int, 0)}
+                self._push(feed['id'], item)
+            self.feeds = feeds
+
+
+
+    def _top(self):
+        """ Drop outdated items from the top of the queue """
+        while len(self.heap) > 0:
+            due, feed_id = self.heap[0]
+            item = self.items.get(feed_id)
+            if item is not None and item['due'] == due and feed_id not in self.pending: return self.heap[0]
+            heapq.heappop(self.heap)
+        return None
+
+
+    def next_due(self):
+        """ Time of the next check (None if nothing is scheduled) """
+        with self.lock:
+            top = self._top()
+            if top is None:
+                if len(self.pending) == 0: return None
+                return min(i['due'] for i in self.pending.values())
+            return top[0]
+
+
+
+    def take_due(self, now:int):
+        """ Pop channels due for check (in due order) and mark them as pending """
+        ids = []
+        with self.lock:
+            while True:
+                top = self._top()
+                if top is None or top[0] > now: break
+                heapq.heappop(self.heap)
+                self.pending[top[1]] = self.items[top[1]]
+                ids.append(top[1])
+        return ids
+
+
+
+    def take(self, feed, now:int):
+        """ Take single channel for fetching if it is due. Channels not in the queue (not checked periodically)
+            are due after their interval since last check """
+        with self.lock:
+            item = self.items.get(feed['id'])
+            if item is None: return now >= scast(feed['lastchecked'], int, 0) + self.interval(feed, None)
+            if feed['id'] in self.pending or item['due'] > now: return False
+            self.pending[feed['id']] = item
+            return True
+
+
+
+    def needs_history(self, feeds, saved:dict):
+        """ Channels to be queued without saved rate (only needed with adaptive intervals) """
+        if not self.config.get('adaptive_intervals', False): return []
+        ids = []
+        feed = FeedContainerBasic()
+        for f in feeds:
+            feed.populate(f)
+            if scast(saved.get(feed['id'], {}).get('rate'), float, None) is None and self._eligible(feed): ids.append(feed['id'])
+        return ids
+
+
+
+    def reschedule(self, feed, checked:int, **kargs):
+        """ Schedule next check after fetch result. Publication rate and yield stats are updated with number of new entries (new_items)
+            if server responded (observed) and check did not fail. Returns schedule item or None if channel is dropped from queue """
+        error = kargs.get('error', False)
+        new_items = kargs.get('new_items', 0)
+        observed = kargs.get('observed', True)
+        with self.lock:
+            old = self.pending.pop(feed['id'], None)
+            if old is None: old = self.items.get(feed['id'])
+            if old is None: old = {'checked':scast(feed['lastchecked'], int, 0), 'errors':scast(feed['error'], int, 0), 'rate':None,
+                                    'checks':0, 'empty':0, 'predicted':0, 'actual':0, 'bytes_saved':0, 'queued':False}
+
+            item = {'checked':checked, 'errors':0, 'cache_until':kargs.get('cache_until'), 'rate':old['rate'], 'checks':old['checks'],
+                    'empty':old['empty'], 'predicted':old['predicted'], 'actual':old['actual'], 'bytes_saved':old['bytes_saved'] + kargs.get('bytes_saved', 0)}
+            if error: item['errors'] = old['errors'] + 1
+            elif observed:
+                elapsed = (checked - old['checked']) / 3600
+                if old['checked'] > 0 and elapsed > 0:
+                    if old['rate'] is not None:
+                        item['predicted'] += old['rate'] * elapsed
+                        item['actual'] += new_items
+                        item['rate'] = (1 - ADAPTIVE_SMOOTHING) * old['rate'] + ADAPTIVE_SMOOTHING * new_items / elapsed
+                    else: item['rate'] = new_items / elapsed
+                    item['checks'] += 1
+                    if new_items == 0: item['empty'] += 1
+
+            item['interval'] = self.interval(feed, item['rate'])
+
+            if item['errors'] >= self.config.get('error_threshold',5):
+                self.items.pop(feed['id'], None)
+                return None
+
+            # Channels fetched on demand, but not checked periodically, are not queued
+            if not old.get('queued', True):
+                item['due'] = self.due(item)
+                return item
+
+            self._push(feed['id'], item)
+            return item
+
+
+
+    def report(self):
+        """ List of (feed row, schedule item) for queued channels in due order """
+        with self.lock:
+            items = list(self.items.items())
+        items.sort(key=lambda x: x[1]['due'])
+        return [(self.rows[i], item) for i, item in items if i in self.rows]
+
+
+
+    def release(self):
+        """ Put channels that were taken, but not rescheduled, back to the queue """
+        with self.lock:
+            for feed_id, item in self.pending.items(): heapq.heappush(self.heap, (item['due'], feed_id))
+            self.pending = {}
@@ -3,6 +3,9 @@
 
 
 from feedex_headers import *
+import codecs
+from collections import OrderedDict
+from datetime import timezone
 
 
 
@@ -60,8 +63,76 @@ def ellipsize(string, length):
 
 
 
+DATE_PARSE_STATS = {'calls':0, 'cached':0, 'rfc822':0, 'iso8601':0, 'dateutil':0, 'failed':0, 'time':0.0}
+_date_cache = OrderedDict() # Date string -> (timestamp, error)
+_date_formats = {} # Feed -> parser that worked last time
+_date_lock = threading.Lock()
+
+
+def _date_tz(zone):
+    """ Timezone from RFC 822 zone or ISO 8601 offset (None if not given) """
+    if zone is None: return None
+    if zone in RFC822_ZONES: return timezone(timedelta(hours=RFC822_ZONES[zone]))
+    offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+    if zone[0] == '-': offset = -offset
+    return timezone(offset)
+
+def _date_rfc822(string:str):
+    """ RFC 822 date (RSS) """
+    m = RFC822_DATE_RE.match(string)
+    if m is None: return None
+    d, mon, y, h, mi, sec, zone = m.groups()
+    mon = RFC822_MONTHS.get(mon.lower())
+    if mon is None: return None
+    try: date = datetime(int(y), mon, int(d), int(h), int(mi), int(sec or 0), tzinfo=_date_tz(zone))
+    except ValueError: return None
+    return int(date.timestamp())
+
+def _date_iso8601(string:str):
+    """ ISO 8601 date (Atom) """
+    m = ISO8601_DATE_RE.match(string)
+    if m is None: return None
+    y, mo, d, h, mi, sec, frac, zone = m.groups()
+    try: date = datetime(int(y), int(mo), int(d), int(h or 0), int(mi or 0), int(sec or 0), int((frac or '0')[:6].ljust(6,'0')), tzinfo=_date_tz(zone))
+    except ValueError: return None
+    return int(date.timestamp())
+
+def _date_dateutil(string:str):
+    """ Anything else """
+    date_obj = dateutil.parser.parse(string, fuzzy_with_tokens=True)
+    return int(date_obj[0].timestamp())
+
+DATE_PARSERS = {'rfc822':_date_rfc822, 'iso8601':_date_iso8601}
+
+
+
+def _parse_date(datestring:str, feed):
+    """ Try format that worked for this feed before, then known formats, then dateutil """
+    first = _date_formats.get(feed)
+    order = list(DATE_PARSERS.keys())
+    if first in order:
+        order.remove(first)
+        order.insert(0, first)
+    for name in order:
+        try: ts = DATE_PARSERS[name](datestring)
+        except (ValueError, OverflowError, OSError): ts = None
+        if ts is not None:
+            DATE_PARSE_STATS[name] += 1
+            if feed is not None: _date_formats[feed] = name
+            return ts, None
+
+    try: ts = _date_dateutil(datestring)
+    except (dateutil.parser.ParserError, ValueError, OverflowError, OSError) as e:
+        DATE_PARSE_STATS['failed'] += 1
+        return None, e
+    DATE_PARSE_STATS['dateutil'] += 1
+    return ts, None
+
+
+
 def convert_timestamp(datestring:str, **kargs):
-    """ This is needed to handle timestamps from updates, as it can be tricky at times and will derail the whole thing"""
+    """ This is needed to handle timestamps from updates, as it can be tricky at times and will derail the whole thing
+        Recent strings are cached. Format that parsed last date from the same source (feed=) is tried first """
     if isinstance(datestring, str):
         
         if datestring.isdigit():
@@ -72,18 +143,34 @@ def convert_timestamp(datestring:str, **kargs):
                 cli_msg( (-1, _('Timestamp convertion: %a'), _('Invalid epoch')) )
                 return None
 
-        try:
-            date_obj = dateutil.parser.parse(datestring, fuzzy_with_tokens=True)
-            return int(date_obj[0].timestamp())
-        except (dateutil.parser.ParserError, ValueError) as e:
-            cli_msg( (-1, _('Timestamp convertion: %a'), e ) )
-            return None
+        started = time.perf_counter()
+        with _date_lock:
+            DATE_PARSE_STATS['calls'] += 1
+            res = _date_cache.get(datestring)
+            if res is not None:
+                _date_cache.move_to_end(datestring)
+                DATE_PARSE_STATS['cached'] += 1
+            else:
+                res = _parse_date(datestring, kargs.get('feed'))
+                _date_cache[datestring] = res
+                if len(_date_cache) > DATE_CACHE_SIZE: _date_cache.popitem(last=False)
+            DATE_PARSE_STATS['time'] += time.perf_counter() - started
+
+        if res[1] is not None: cli_msg( (-1, _('Timestamp convertion: %a'), res[1] ) )
+        return res[0]
 
     elif isinstance(datestring, int): return datestring
     else: return None
 
 
 
+def date_parse_stats():
+    """ Summary of date parsing since start """
+    st = DATE_PARSE_STATS
+    return f"""{_('Dates parsed')}: {st['calls']} ({_('cached')}: {st['cached']}, RFC 822: {st['rfc822']}, ISO 8601: {st['iso8601']}, dateutil: {st['dateutil']}, {_('failed')}: {st['failed']}) {_('in')} {round(st['time'],4)}s"""
+
+
+
 def sanitize_file_size(size:int, **kargs):
     """ Convert bytes to a nice string """
     str_dict = {1: 'KB', 2:' MB', 3:'GB', 4:'TB', 5:'PB', 6:'EB' } # This is clearly an overkill :)
@@ -404,6 +491,63 @@ def check_url(string:str):
 
 
 
+def read_response(response, **kargs):
+    """ Read HTTP response into a bytearray, stopping if it is larger than limit (MAX_DOWNLOAD_SIZE by default).
+        Chunks are read into one reused buffer and written to file object 'out', if given, instead of being kept.
+        Returns data (number of bytes if written to file) or None if resource is too large """
+    limit = kargs.get('limit', MAX_DOWNLOAD_SIZE)
+    out = kargs.get('out')
+
+    size = scast(response.headers.get('Content-Length'), int, None)
+    if size is not None and size > limit: return None
+
+    if out is None: data = bytearray()
+    total = 0
+    chunk = memoryview(bytearray(DOWNLOAD_CHUNK_SIZE))
+    while True:
+        n = response.readinto(chunk)
+        if not n: break
+        total += n
+        if total > limit: return None
+        if out is None: data += chunk[:n]
+        else: out.write(chunk[:n])
+
+    if out is None: return data
+    return total
+
+
+
+def sniff_charset(data, **kargs):
+    """ Get charset of downloaded page: from Content-Type header, byte order mark or <meta> tag in page head. 
+        Data can be any bytes-like object. Returns None if not declared or unknown """
+    charset = HTTP_CHARSET_RE.search(scast(kargs.get('content_type'), str, ''))
+    if charset is not None: charset = charset.group(1)
+    else:
+        data = memoryview(data)
+        head = data[:CHARSET_SNIFF_SIZE]
+        if head[:3] == codecs.BOM_UTF8: charset = 'utf-8-sig'
+        elif head[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE): charset = 'utf-16'
+        else:
+            charset = HTML_META_CHARSET_RE.search(head)
+            if charset is None: return None
+            charset = charset.group(1).decode('ascii')
+    try: return codecs.lookup(charset).name
+    except LookupError: return None
+
+
+
+def decode_html(data, **kargs):
+    """ Decode downloaded page in one go using declared or sniffed charset (UTF-8 if none). Undecodable bytes are replaced.
+        Returns text and charset used """
+    charset = coalesce(sniff_charset(data, **kargs), 'utf-8')
+    return str(data, charset, 'replace'), charset
+
+
+
+
+
+def _html_entity(m): return HTML_ENTITIES_DICT.get(m.group(), m.group())
+def _html_markup(m): return HTML_MARKUP_DICT.get(m.group(), '')
 
 def strip_markup(raw_text:str, **kargs):
     """ Detect and strip HTML from text
@@ -415,19 +559,17 @@ def strip_markup(raw_text:str, **kargs):
     # Determine content type (unless overridden)
     html = kargs.get('html',False)
     if not html:
-        test = re.search(RSS_HANDLER_TEST_RE, raw_text)
-        if test is None: html = False
-        else: html = True
+        # There is no markup without tags
+        if '<' in raw_text and RSS_HANDLER_TEST_RE.search(raw_text) is not None: html = True
 
-    # strip most popular HTML specials
-    for ent in HTML_ENTITIES:
-        raw_text = raw_text.replace(ent[0],ent[2])
-        raw_text = raw_text.replace(ent[1],ent[2])
+    # Replace HTML entities in one scan (unknown ones are left as they are)
+    if '&' in raw_text: raw_text = HTML_ENTITIES_RE.sub(_html_entity, raw_text)
 
     if html:
         # Search for images
         if kargs.get('rx_images') is not None: images = re.findall(kargs.get('rx_images'), raw_text)
-        else: images = re.findall(RSS_HANDLER_IMAGES_RE, raw_text)
+        elif '<' in raw_text: images = RSS_HANDLER_IMAGES_RE.findall(raw_text)
+        else: images = []
 
         if kargs.get('rx_links') is not None: links = re.findall(kargs.get('rx_links'), raw_text)
         else: links = ()
@@ -435,24 +577,8 @@ def strip_markup(raw_text:str, **kargs):
         if kargs.get('test',False): return raw_text, images, links
 
         # Strips markup from text - a simple one for speed and convenience
-        # Handle tags...
-        raw_text = raw_text.replace("\n\r",' ')
-        raw_text = raw_text.replace("\n",' ')
-        raw_text = raw_text.replace("\r",' ')
-        raw_text = raw_text.replace("</p>","\n\n")
-        raw_text = raw_text.replace("<br>","\n")
-        raw_text = raw_text.replace("<br />","\n")
-        raw_text = raw_text.replace("<br/>","\n")
-        raw_text = raw_text.replace('<em>','»')
-        raw_text = raw_text.replace('</em>','«')
-        raw_text = raw_text.replace('<b>','»')
-        raw_text = raw_text.replace('</b>','«')
-        raw_text = raw_text.replace('<i>','»')
-        raw_text = raw_text.replace('</i>','«')
-        raw_text = raw_text.replace('<u>','»')
-        raw_text = raw_text.replace('</u>','«')
-        stripped_text = re.sub(RSS_HANDLER_STRIP_HTML_RE, '', scast(raw_text, str, ''))
-        stripped_text = stripped_text.strip()
+        # Line breaks become spaces, paragraphs and breaks become new lines, emphasis is marked with »«, other tags are dropped
+        stripped_text = HTML_MARKUP_RE.sub(_html_markup, raw_text).strip()
 
     else:
         stripped_text = raw_text